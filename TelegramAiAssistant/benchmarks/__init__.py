@@ -0,0 +1 @@
+# Benchmarks and stress checks, run from the project root with python -m benchmarks.<name>
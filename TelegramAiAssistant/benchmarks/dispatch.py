@@ -0,0 +1,108 @@
+"""Dispatch cost per callback query, lambda filters vs CallbackRouter.
+
+Usage: python -m benchmarks.dispatch [--callbacks 20000]
+
+The callback actions are collected by running every handler module's
+register_handlers on a scratch dispatcher, so the run always uses the
+current handler count. Two dispatchers then get a no-op handler per
+action: one registered the way the handlers used to be, one
+dp.callback_query handler per action filtered by a lambda on
+callback.data, and one through CallbackRouter. Both get the same packed
+callback_data (utils.callback_data). --callbacks updates, spread
+evenly over the actions, go through Dispatcher.feed_update() (middlewares
+and FSM included) and the mean per callback is reported, along with the
+filter-free floor: one handler accepting everything.
+"""
+import time
+import asyncio
+import argparse
+from typing import List, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import CallbackQuery, Update, User
+
+from utils.callback_data import ACTION_CODES, decode_int, pack
+from utils.callback_router import Route, callback_router
+
+# Never used to reach Telegram: feed_update() calls the handlers directly
+TOKEN = "123456:benchmark-token"
+
+def current_routes() -> List[Tuple[str, Route]]:
+    """Actions of the registered callback handlers, in registration order"""
+    from handlers import menu, orders, sponsor, recruitment, admin, fallback, user_management
+
+    dp = Dispatcher(storage=MemoryStorage())
+    for module in (menu, orders, sponsor, recruitment, admin, user_management, fallback):
+        module.register_handlers(dp, None, None)
+    return list(callback_router(dp).routes.items())
+
+def sample_data(action: str, route: Route) -> str:
+    return pack(action, *(k + 1 if convert is decode_int else str(k + 1) for k, convert in enumerate(route.converters)))
+
+async def noop(*args, **kwargs):
+    pass
+
+def lambda_dispatcher(routes: List[Tuple[str, Route]]) -> Dispatcher:
+    dp = Dispatcher(storage=MemoryStorage())
+    for action, route in routes:
+        code = ACTION_CODES[action]
+        if route.fields:
+            dp.callback_query.register(noop, lambda c, prefix=code + ":": c.data.startswith(prefix))
+        else:
+            dp.callback_query.register(noop, lambda c, data=code: c.data == data)
+    return dp
+
+def router_dispatcher(routes: List[Tuple[str, Route]]) -> Dispatcher:
+    dp = Dispatcher(storage=MemoryStorage())
+    router = callback_router(dp)
+    for action, route in routes:
+        router.routes[action] = route._replace(handler=noop)
+    return dp
+
+def floor_dispatcher() -> Dispatcher:
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.callback_query.register(noop)
+    return dp
+
+def updates(routes: List[Tuple[str, Route]], count: int) -> List[Update]:
+    user = User(id=42, is_bot=False, first_name="Bench")
+    return [
+        Update(update_id=k, callback_query=CallbackQuery(
+            id=str(k), from_user=user, chat_instance="bench",
+            data=sample_data(*routes[k % len(routes)])
+        ))
+        for k in range(count)
+    ]
+
+async def time_dispatch(dp: Dispatcher, bot: Bot, batch: List[Update]) -> float:
+    """Mean microseconds per feed_update()"""
+    for update in batch[:1000]:
+        await dp.feed_update(bot, update)
+    start = time.perf_counter()
+    for update in batch:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - start) / len(batch) * 1e6
+
+async def run(callbacks: int):
+    routes = current_routes()
+    bot = Bot(token=TOKEN)
+    batch = updates(routes, callbacks)
+    exact = sum(1 for _, route in routes if not route.fields)
+    print(f"{len(routes)} callback handlers ({exact} exact, {len(routes) - exact} prefixed), {callbacks} callbacks")
+    try:
+        for name, dp in (("lambda filters", lambda_dispatcher(routes)),
+                         ("CallbackRouter", router_dispatcher(routes)),
+                         ("no filter floor", floor_dispatcher())):
+            print(f"  {name:<16} {await time_dispatch(dp, bot, batch):8.1f} µs/callback")
+    finally:
+        await bot.session.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--callbacks", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.callbacks))
+
+if __name__ == "__main__":
+    main()
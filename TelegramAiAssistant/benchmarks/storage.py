@@ -0,0 +1,487 @@
+"""Ops/sec of the hot storage calls for every backend.
+
+Usage: python -m benchmarks.storage [--backends json,sqlite,memory] [--orders 10000] [--ops 2000]
+       python -m benchmarks.storage --loop-lag [--orders 10000] [--ops 2000]
+       python -m benchmarks.storage --write-amp [--orders 10000]
+       python -m benchmarks.storage --indexes [--orders 500000] [--ops 2000]
+       python -m benchmarks.storage --startup [--sizes 10000,100000,1000000]
+       python -m benchmarks.storage --atomic [--orders 10000] [--ops 2000]
+       python -m benchmarks.storage --memory [--orders 100000]
+       python -m benchmarks.storage --latency [--backends json,sqlite,memory] [--sizes 1000,100000,1000000] [--ops 2000]
+
+Each backend runs in a fresh temporary directory, is seeded with --orders
+orders through the public API and then timed on the calls the handlers make
+on every update. --loop-lag instead measures event-loop lag while 20 tasks
+write concurrently, for the JSON backend called directly (write-through on
+the loop) and through AsyncDatabase (writes on the writer thread).
+--write-amp reports the bytes one operation costs on the JSON backend: its
+journal append, the shard rewrite at the next compaction and, for
+comparison, the single config.json document every save used to rewrite.
+--indexes compares the secondary-index queries with a linear scan of the
+orders on the in-memory backend, with 1 order in 1000 still pending.
+--startup times the JSON backend constructor (everything the bot waits for
+before polling) for every snapshot codec and STARTUP_LOAD mode, plus the
+background history load of hot_first and the worst event-loop stall during
+it. The order shards are written directly, seeding millions of orders
+through the API would dominate the run.
+--atomic compares the latency of one shard write done in place (the write
+before crash-safe snapshots) with write_atomic() keeping
+SNAPSHOT_GENERATIONS generations, for a small shard, a 100 KB one and an
+orders shard of --orders orders, against ATOMIC_BUDGET_MS added at p50.
+--memory reports the memory tracemalloc traces for --orders orders held as
+the decoded shard dicts (as the store kept them before models.order) and
+as the slotted records it holds now, scaled to 100k orders.
+--latency reports p50/p99 latency of single add_to_cart and
+update_order_status calls for every backend holding each of --sizes
+orders, seeded through the API in batches of SEED_BATCH orders.
+"""
+import os
+import gc
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from database import Database, create_database
+from storage.base import StorageBackend
+from storage.async_database import AsyncDatabase
+from storage.codecs import CODECS
+from storage.memory import to_record
+from models.record import json_default
+from storage.atomic import write_atomic
+from config import SNAPSHOT_GENERATIONS
+
+HOT_CALLS = ["get_cart_count", "add_to_cart", "create_order_from_cart", "is_user_banned"]
+# Latency write_atomic() may add to a shard write at p50
+ATOMIC_BUDGET_MS = 5.0
+LATENCY_CALLS = ["add_to_cart", "update_order_status"]
+# Orders created per batch (one persisted write) while seeding for --latency
+SEED_BATCH = 1000
+
+def seed(db: StorageBackend, orders: int):
+    """Create orders spread over 1000 users"""
+    for i in range(orders):
+        user_id = i % 1000
+        db.add_to_cart(user_id, "Coca Cola", 3, "🥤 Bevande")
+        db.create_order_from_cart(user_id, f"user{user_id}")
+    db.flush()
+
+def ops_per_second(call: Callable[[int], None], ops: int) -> float:
+    start = time.perf_counter()
+    for i in range(ops):
+        call(i)
+    return ops / (time.perf_counter() - start)
+
+def seed_batched(db: StorageBackend, orders: int) -> List[str]:
+    """Create orders spread over 1000 users, SEED_BATCH per batch, returns their ids"""
+    order_ids = []
+    for start in range(0, orders, SEED_BATCH):
+        with db.batch():
+            for i in range(start, min(start + SEED_BATCH, orders)):
+                user_id = i % 1000
+                db.add_to_cart(user_id, "Coca Cola", 3, "🥤 Bevande")
+                order_ids.append(db.create_order_from_cart(user_id, f"user{user_id}"))
+    db.flush()
+    return order_ids
+
+def latencies(call: Callable[[int], None], ops: int) -> Dict[str, float]:
+    """p50/p99 milliseconds of ops calls"""
+    times = []
+    for i in range(ops):
+        start = time.perf_counter()
+        call(i)
+        times.append((time.perf_counter() - start) * 1000)
+    return {"p50": statistics.median(times), "p99": statistics.quantiles(times, n=100)[-1]}
+
+def call_latencies(backend: str, orders: int, ops: int) -> Dict[str, Dict[str, float]]:
+    """Latency of the hot mutations on a backend holding orders orders"""
+    db = create_database(backend)
+    order_ids = seed_batched(db, orders)
+    statuses = ("preparing", "pending")
+    results = {
+        "add_to_cart": latencies(lambda i: db.add_to_cart(i % 1000, "Acqua", 2, "🥤 Bevande"), ops),
+        "update_order_status": latencies(
+            lambda i: db.update_order_status(order_ids[i * 7919 % len(order_ids)], statuses[i % 2]), ops
+        ),
+    }
+    db.flush()
+    return results
+
+def run_call_latencies(backends: List[str], sizes: List[int], ops: int):
+    cwd = os.getcwd()
+    print(f"{'orders':>8} {'backend':<8} " + " ".join(f"{name + ' p50/p99':>32}" for name in LATENCY_CALLS))
+    for orders in sizes:
+        for backend in backends:
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                try:
+                    results = call_latencies(backend, orders, ops)
+                finally:
+                    os.chdir(cwd)
+            print(f"{orders:>8} {backend:<8} " + " ".join(
+                f"{results[name]['p50']:>18.3f} /{results[name]['p99']:>8.3f} ms" for name in LATENCY_CALLS
+            ))
+
+def run_backend(backend: str, orders: int, ops: int) -> Dict[str, float]:
+    db = create_database(backend)
+    seed(db, orders)
+
+    results = {
+        "get_cart_count": ops_per_second(lambda i: db.get_cart_count(i % 1000), ops),
+        "add_to_cart": ops_per_second(lambda i: db.add_to_cart(i % 1000, "Acqua", 2, "🥤 Bevande"), ops),
+        "create_order_from_cart": ops_per_second(lambda i: db.create_order_from_cart(i % 1000, "bench"), ops),
+        "is_user_banned": ops_per_second(lambda i: db.is_user_banned(i % 1000), ops),
+    }
+    db.flush()
+    return results
+
+async def loop_lag(db: StorageBackend, use_async: bool, ops: int, writers: int = 20) -> Dict[str, float]:
+    """Max and mean lateness of a 1ms ticker while writer tasks mutate the store"""
+    loop = asyncio.get_running_loop()
+    facade = AsyncDatabase(db) if use_async else None
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = loop.time()
+            await asyncio.sleep(0.001)
+            lags.append(loop.time() - start - 0.001)
+
+    async def writer(worker: int):
+        for i in range(ops // writers):
+            if facade:
+                await facade.add_to_cart(worker, "Acqua", 2, "🥤 Bevande")
+            else:
+                db.add_to_cart(worker, "Acqua", 2, "🥤 Bevande")
+                await asyncio.sleep(0)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.gather(*(writer(worker) for worker in range(writers)))
+    done.set()
+    await tick
+    if facade:
+        await facade.close()
+    return {"max_ms": max(lags) * 1000, "mean_ms": sum(lags) / len(lags) * 1000}
+
+def run_loop_lag(orders: int, ops: int):
+    cwd = os.getcwd()
+    for label, use_async in (("sync", False), ("async", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                db = create_database("json")
+                seed(db, orders)
+                db.write_behind = False
+                result = asyncio.run(loop_lag(db, use_async, ops))
+            finally:
+                os.chdir(cwd)
+        print(f"{label:<6} loop lag max {result['max_ms']:.2f} ms, mean {result['mean_ms']:.3f} ms")
+
+def write_amplification(orders: int) -> Dict[str, Dict[str, int]]:
+    """Bytes written per operation on a JSON store seeded with orders"""
+    db = Database()
+    db.write_behind = False
+    seed(db, orders)
+    db.add_to_cart(0, "Acqua", 2, "🥤 Bevande")
+    order_id = db.create_order_from_cart(0, "bench")
+
+    operations = {
+        "add_to_cart": (None, lambda: db.add_to_cart(1, "Acqua", 2, "🥤 Bevande")),
+        "create_order_from_cart": (lambda: db.add_to_cart(2, "Acqua", 2, "🥤 Bevande"),
+                                   lambda: db.create_order_from_cart(2, "bench")),
+        "update_order_status": (None, lambda: db.update_order_status(order_id, "ready", 1)),
+        "ban_user": (None, lambda: db.ban_user(3)),
+    }
+    results = {}
+    for name, (setup, operation) in operations.items():
+        if setup:
+            setup()
+        db.compact()
+
+        before = db.persistence_stats["bytes_written"]
+        operation()
+        journal = db.persistence_stats["bytes_written"] - before
+        db.compact()
+        shards = db.persistence_stats["bytes_written"] - before - journal
+
+        document = len(json.dumps(db.config, indent=2, ensure_ascii=False, default=json_default).encode('utf-8'))
+        results[name] = {"journal": journal, "shards": shards, "single_file": document}
+    return results
+
+def run_write_amplification(orders: int):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            results = write_amplification(orders)
+        finally:
+            os.chdir(cwd)
+
+    print(f"{'operation':<24} {'journal':>12} {'shard rewrite':>16} {'single config.json':>20}")
+    for name, result in results.items():
+        print(f"{name:<24} {result['journal']:>10} B {result['shards']:>14} B {result['single_file']:>18} B")
+
+def index_lookups(orders: int, ops: int) -> Dict[str, Dict[str, float]]:
+    """Microseconds per query through the indexes and by scanning all orders"""
+    db = create_database("memory")
+    for i in range(orders):
+        db.add_to_cart(i % 1000, "Coca Cola", 3, "🥤 Bevande")
+        order_id = db.create_order_from_cart(i % 1000, f"user{i % 1000}")
+        if i % 1000:
+            db.update_order_status(order_id, "completed")
+
+    all_orders = db.config["orders"]
+    queries = {
+        "orders_by_user": (lambda i: db.get_orders_by_user(i % 1000),
+                           lambda i: [o for o in all_orders.values() if o["user_id"] == i % 1000]),
+        "orders_by_status": (lambda i: db.get_orders_by_status("pending"),
+                             lambda i: [o for o in all_orders.values() if o["status"] == "pending"]),
+    }
+    results = {}
+    for name, (indexed, scan) in queries.items():
+        results[name] = {
+            "matches": len(indexed(0)),
+            "indexed_us": 1e6 / ops_per_second(indexed, ops),
+            "scan_us": 1e6 / ops_per_second(scan, max(ops // 100, 5)),
+        }
+    return results
+
+def run_index_lookups(orders: int, ops: int):
+    print(f"{'query':<18} {'matches':>8} {'indexed':>14} {'linear scan':>16}")
+    for name, result in index_lookups(orders, ops).items():
+        print(f"{name:<18} {result['matches']:>8} {result['indexed_us']:>11.1f} us {result['scan_us']:>13.1f} us")
+
+def write_order_shards(orders: int):
+    """Write an orders shard of completed orders in data/config/ in every codec"""
+    start = datetime(2025, 1, 1)
+    shard = {}
+    for i in range(1, orders + 1):
+        created_at = (start + timedelta(seconds=i * 30)).isoformat()
+        shard[str(i)] = {
+            "id": str(i),
+            "user_id": i % 1000,
+            "username": f"user{i % 1000}",
+            "items": [{"item_name": "Coca Cola", "item_price": 3, "quantity": 1,
+                       "category": "🥤 Bevande", "added_at": created_at}],
+            "total_price": 3,
+            "status": "completed",
+            "created_at": created_at,
+            "updated_at": created_at,
+            "staff_message_id": None,
+            "assigned_to": None
+        }
+    os.makedirs("data/config", exist_ok=True)
+    for codec in CODECS.values():
+        with open(os.path.join("data/config", "orders" + codec.extension), 'wb') as f:
+            f.write(codec.dumps(shard))
+
+async def load_history_lag(db: Database) -> Dict[str, float]:
+    """Duration of the background history load and the worst lateness of a 1ms ticker during it"""
+    loop = asyncio.get_running_loop()
+    lags = [0.0]
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            start = loop.time()
+            await asyncio.sleep(0.001)
+            lags.append(loop.time() - start - 0.001)
+
+    tick = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    await db.load_history_async()
+    history = time.perf_counter() - start
+    done.set()
+    await tick
+    return {"history_s": history, "max_lag_ms": max(lags) * 1000}
+
+def startup_times(orders: int) -> List[Dict]:
+    """Startup of a JSON store holding orders, for every codec and load mode"""
+    results = []
+    write_order_shards(orders)
+    for codec in CODECS.values():
+        # Keep only this codec's shard, as after a compaction with it
+        for other in CODECS.values():
+            path = os.path.join("data/config", "orders" + other.extension)
+            if other is not codec and os.path.exists(path):
+                os.rename(path, path + ".off")
+            elif other is codec and os.path.exists(path + ".off"):
+                os.rename(path + ".off", path)
+        size = os.path.getsize(os.path.join("data/config", "orders" + codec.extension))
+
+        for mode in ("eager", "hot_first"):
+            start = time.perf_counter()
+            db = Database(codec=codec.name, startup_load=mode)
+            ready = time.perf_counter() - start
+            result = asyncio.run(load_history_lag(db)) if mode == "hot_first" else {"history_s": 0, "max_lag_ms": 0}
+            assert len(db.get_orders_by_user(1)) == len(range(1, orders + 1, 1000))
+            db._writer.shutdown(wait=True)
+            del db
+            results.append(dict(result, codec=codec.name, mode=mode, ready_s=ready, shard_bytes=size))
+    return results
+
+def run_startup_times(sizes: List[int]):
+    cwd = os.getcwd()
+    print(f"{'orders':>8} {'codec':<8} {'mode':<10} {'shard':>10} {'until polling':>14} "
+          f"{'history':>10} {'max loop lag':>13}")
+    for orders in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                results = startup_times(orders)
+            finally:
+                os.chdir(cwd)
+        for result in results:
+            print(f"{orders:>8} {result['codec']:<8} {result['mode']:<10} {result['shard_bytes'] / 1e6:>7.1f} MB "
+                  f"{result['ready_s']:>12.3f} s {result['history_s']:>8.2f} s {result['max_lag_ms']:>10.1f} ms")
+
+def write_in_place(path: str, data: bytes):
+    """Shard write before crash-safe snapshots: truncate, write and fsync"""
+    with open(path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def atomic_write_latency(orders: int, ops: int) -> Dict[str, Dict[str, float]]:
+    """p50/p90 milliseconds of in-place and atomic writes of shards of several sizes"""
+    write_order_shards(orders)
+    with open(os.path.join("data/config", "orders" + CODECS["json"].extension), 'rb') as f:
+        orders_shard = f.read()
+    payloads = {
+        "1 KB": b"x" * 1024,
+        "100 KB": b"x" * 100 * 1024,
+        f"orders ({len(orders_shard) / 1e6:.1f} MB)": orders_shard,
+    }
+    writers = {
+        "in_place": write_in_place,
+        "atomic": lambda path, data: write_atomic(path, data, SNAPSHOT_GENERATIONS),
+    }
+    results = {}
+    for label, data in payloads.items():
+        results[label] = {}
+        for name, write in writers.items():
+            path = os.path.join("data", f"bench_{name}.json")
+            count = ops if len(data) < 1024 * 1024 else max(ops // 10, 10)
+            times = []
+            for _ in range(count):
+                start = time.perf_counter()
+                write(path, data)
+                times.append((time.perf_counter() - start) * 1000)
+            deciles = statistics.quantiles(times, n=10)
+            results[label][name + "_p50"] = statistics.median(times)
+            results[label][name + "_p90"] = deciles[-1]
+    return results
+
+def run_atomic_write_latency(orders: int, ops: int):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            results = atomic_write_latency(orders, ops)
+        finally:
+            os.chdir(cwd)
+
+    print(f"{'shard':<20} {'in place p50/p90':>20} {'atomic p50/p90':>20} {'added p50':>11}")
+    over = []
+    for label, result in results.items():
+        added = result["atomic_p50"] - result["in_place_p50"]
+        if added > ATOMIC_BUDGET_MS:
+            over.append(label)
+        print(f"{label:<20} {result['in_place_p50']:>8.2f} /{result['in_place_p90']:>6.2f} ms "
+              f"{result['atomic_p50']:>8.2f} /{result['atomic_p90']:>6.2f} ms {added:>8.2f} ms")
+    print(f"budget: +{ATOMIC_BUDGET_MS:.1f} ms at p50 with {SNAPSHOT_GENERATIONS} generations: "
+          + (f"EXCEEDED for {', '.join(over)}" if over else "OK"))
+
+def order_memory(orders: int) -> Dict[str, int]:
+    """Bytes traced for an orders shard decoded to dicts and converted to records"""
+    write_order_shards(orders)
+    with open(os.path.join("data/config", "orders" + CODECS["json"].extension), 'rb') as f:
+        data = f.read()
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        dicts = CODECS["json"].loads(data)
+        as_dicts = tracemalloc.get_traced_memory()[0] - base
+        records = to_record(("orders",), dicts)
+        del dicts
+        gc.collect()
+        as_records = tracemalloc.get_traced_memory()[0] - base
+    finally:
+        tracemalloc.stop()
+    assert len(records) == orders
+    return {"dicts": as_dicts, "records": as_records}
+
+def run_order_memory(orders: int):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            result = order_memory(orders)
+        finally:
+            os.chdir(cwd)
+
+    print(f"{'representation':<16} {'per order':>10} {'per 100k orders':>16}")
+    for name in ("dicts", "records"):
+        print(f"{name:<16} {result[name] / orders:>8.0f} B {result[name] / orders * 100000 / 1e6:>13.1f} MB")
+    print(f"records use {result['records'] / result['dicts']:.0%} of the dict representation")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", default="memory,json,sqlite")
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--loop-lag", action="store_true")
+    parser.add_argument("--write-amp", action="store_true")
+    parser.add_argument("--indexes", action="store_true")
+    parser.add_argument("--startup", action="store_true")
+    parser.add_argument("--sizes", help="orders held, default 10000,100000,1000000 (--startup) "
+                                         "or 1000,100000,1000000 (--latency)")
+    parser.add_argument("--atomic", action="store_true")
+    parser.add_argument("--memory", action="store_true")
+    parser.add_argument("--latency", action="store_true")
+    args = parser.parse_args()
+
+    if args.loop_lag:
+        run_loop_lag(args.orders, args.ops)
+        return
+    if args.write_amp:
+        run_write_amplification(args.orders)
+        return
+    if args.indexes:
+        run_index_lookups(args.orders, args.ops)
+        return
+    if args.startup:
+        run_startup_times([int(size) for size in (args.sizes or "10000,100000,1000000").split(",")])
+        return
+    if args.atomic:
+        run_atomic_write_latency(args.orders, args.ops)
+        return
+    if args.memory:
+        run_order_memory(args.orders)
+        return
+    if args.latency:
+        sizes = [int(size) for size in (args.sizes or "1000,100000,1000000").split(",")]
+        run_call_latencies(args.backends.split(","), sizes, args.ops)
+        return
+
+    cwd = os.getcwd()
+    print(f"{'backend':<8} " + " ".join(f"{name:>24}" for name in HOT_CALLS))
+    for backend in args.backends.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                results = run_backend(backend, args.orders, args.ops)
+            finally:
+                os.chdir(cwd)
+        print(f"{backend:<8} " + " ".join(f"{results[name]:>20.0f} op/s" for name in HOT_CALLS))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Several processes creating orders concurrently on one shared JSON or SQLite store.
+
+Usage: python -m benchmarks.storage_stress [--backend shared_json] [--processes 4] [--orders 500] [--compact-bytes 65536]
+
+Every process opens the --backend store (a SharedDatabase, or a
+SqliteDatabase on one file) in the same temporary directory, creates
+--orders orders for its own users and completes pending orders created
+by the others. With shared_json a small --compact-bytes makes the
+processes compact and re-read each other's shards during the run. The
+store is then reopened and checked: order numbers are unique and
+gap-free, every created order is present with its user, every completion
+is kept and the counter matches.
+"""
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from typing import Dict, List, Tuple
+
+from database import create_database
+from storage.sqlite_database import SqliteDatabase
+
+def open_store(backend: str):
+    return create_database(backend) if backend == "shared_json" else SqliteDatabase("data/stress.db")
+
+def order_counter(db) -> int:
+    if isinstance(db, SqliteDatabase):
+        row = db.conn.execute("SELECT value FROM counters WHERE name = 'order_counter'").fetchone()
+        return row[0] if row else 0
+    return db.config.get("order_counter")
+
+def worker(directory: str, backend: str, worker_id: int, orders: int, compact_bytes: int) -> Dict:
+    """Create orders and complete the other workers' ones, returns what was done"""
+    os.chdir(directory)
+    db = open_store(backend)
+    db.compact_bytes = compact_bytes
+    created: List[Tuple[str, int]] = []
+    completed: List[str] = []
+
+    for i in range(orders):
+        user_id = worker_id * 1000 + i % 50
+        db.add_to_cart(user_id, "Coca Cola", 3, "🥤 Bevande")
+        created.append((db.create_order_from_cart(user_id, f"worker{worker_id}"), user_id))
+        if i % 4 == 0:
+            # Possibly stale read; the update itself runs on the latest state
+            for order in db.get_orders_by_status("pending"):
+                if order["user_id"] // 1000 != worker_id:
+                    db.update_order_status(order["id"], "completed", worker_id)
+                    completed.append(order["id"])
+                    break
+
+    asyncio.run(db.close())
+    return {"created": created, "completed": completed, "stats": db.get_persistence_stats()}
+
+def check(directory: str, backend: str, results: List[Dict]) -> List[str]:
+    """Reopen the store and list every inconsistency found"""
+    os.chdir(directory)
+    db = open_store(backend)
+    errors = []
+
+    created = [order for result in results for order in result["created"]]
+    ids = [order_id for order_id, _ in created]
+    if len(set(ids)) != len(ids):
+        errors.append(f"{len(ids) - len(set(ids))} order numbers were handed out twice")
+    if sorted(int(order_id) for order_id in ids) != list(range(1, len(ids) + 1)):
+        errors.append("order numbers are not 1..N")
+    if order_counter(db) != len(ids):
+        errors.append(f"order_counter is {order_counter(db)}, expected {len(ids)}")
+
+    for order_id, user_id in created:
+        order = db.get_order(order_id)
+        if order is None:
+            errors.append(f"order {order_id} was lost")
+        elif order["user_id"] != user_id:
+            errors.append(f"order {order_id} belongs to {order['user_id']}, expected {user_id}")
+    for order_id in (order_id for result in results for order_id in result["completed"]):
+        order = db.get_order(order_id)
+        if order is None or order["status"] != "completed":
+            errors.append(f"completion of order {order_id} was lost")
+
+    asyncio.run(db.close())
+    return errors
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", default="shared_json", choices=("shared_json", "sqlite"))
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--orders", type=int, default=500)
+    parser.add_argument("--compact-bytes", type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            start = time.perf_counter()
+            with multiprocessing.Pool(args.processes) as pool:
+                results = pool.starmap(worker, [
+                    (tmp, args.backend, worker_id, args.orders, args.compact_bytes)
+                    for worker_id in range(args.processes)
+                ])
+            elapsed = time.perf_counter() - start
+            errors = check(tmp, args.backend, results)
+        finally:
+            os.chdir(cwd)
+
+    total = sum(len(result["created"]) for result in results)
+    completed = sum(len(result["completed"]) for result in results)
+    print(f"{args.processes} processes created {total} orders and completed {completed} "
+          f"in {elapsed:.2f}s ({total / elapsed:.0f} orders/s)")
+    for key in ("compactions", "syncs", "synced_records", "shard_reloads", "mutations"):
+        if key in results[0]["stats"]:
+            print(f"  {key}: {sum(result['stats'][key] for result in results)}")
+    if errors:
+        print(f"FAILED: {len(errors)} problems")
+        for error in errors[:20]:
+            print(f"  {error}")
+        raise SystemExit(1)
+    print("OK: no duplicate or missing orders")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Supervisor throughput at 1, 2, 4 and 8 workers on synthetic updates.
+
+Usage: python -m benchmarks.workers [--workers 1,2,4,8] [--users 200] [--messages 6] [--backend sqlite]
+
+For each worker count the bot is started as in production, `python
+main.py` with BOT_WORKERS and BOT_MODE=webhook, in a temporary directory
+with its own --backend store. It talks through BOT_API_URL to a sink Bot
+API in this process, which answers every method at once; throttling and
+outbound pacing are lifted so the run measures the processing. Once
+every worker answered a first update, --users users post --messages
+updates each, all users at once and each user's one after the other,
+alternating /start and /menu. The run ends when every reply reached the
+sink. The updates per second and the speedup over the first worker count
+are reported next to the CPU count: workers past it cannot add
+throughput. The run fails if a reply is missing or a user's replies came
+out of order.
+"""
+import os
+import sys
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+from collections import defaultdict
+from typing import Dict, List
+
+import aiohttp
+from aiohttp import web
+
+from config import WELCOME_MESSAGE
+from tests.fakes import serve, start_update
+from utils.workers import MAIN
+
+TOKEN = "123456:workers-benchmark"
+SECRET = "workers-benchmark-secret"
+COMMANDS = ["/start", "/menu"]
+# Lifts throttling and outbound pacing in the bot
+UNLIMITED = {name: "1000000" for name in (
+    "THROTTLE_USER_RATE", "THROTTLE_USER_BURST", "THROTTLE_ACTION_RATE", "THROTTLE_ACTION_BURST",
+    "OUTBOUND_GLOBAL_RATE", "OUTBOUND_GLOBAL_BURST", "OUTBOUND_CHAT_RATE", "OUTBOUND_CHAT_BURST"
+)}
+
+class SinkBotApi:
+    """Answers every Bot API method at once, recording which command each message replies to"""
+
+    def __init__(self):
+        self.replies: Dict[int, List[str]] = defaultdict(list)
+        self.count = 0
+        self.received = asyncio.Event()
+        self.expected = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if request.match_info["method"].lower() != "sendmessage":
+            return web.json_response({"ok": True, "result": True})
+        form = await request.post()
+        chat_id = int(form["chat_id"])
+        self.replies[chat_id].append("/start" if form["text"] == WELCOME_MESSAGE else "/menu")
+        self.count += 1
+        if self.count >= self.expected:
+            self.received.set()
+        return web.json_response({"ok": True, "result": {
+            "message_id": self.count, "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"}, "text": form["text"]
+        }})
+
+    def expect(self, count: int):
+        self.count = 0
+        self.replies.clear()
+        self.expected = count
+        self.received.clear()
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def post_all(url: str, updates: List[Dict]):
+    """Post updates in order, each once the previous one was answered"""
+    async with aiohttp.ClientSession() as session:
+        for update in updates:
+            async with session.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}) as response:
+                if response.status != 200:
+                    raise RuntimeError(f"update {update['update_id']} answered {response.status}")
+
+async def run_workers(sink: SinkBotApi, api_port: int, workers: int, users: int, messages: int,
+                      backend: str) -> Dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/webhook"
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, **UNLIMITED, BOT_TOKEN=TOKEN, BOT_API_URL=f"http://127.0.0.1:{api_port}",
+                   BOT_MODE="webhook", WEBHOOK_HOST="127.0.0.1", WEBHOOK_PORT=str(port), WEBHOOK_URL="",
+                   WEBHOOK_SECRET=SECRET, BOT_WORKERS=str(workers), STORAGE_BACKEND=backend)
+        with open(os.path.join(directory, "bot.log"), "wb") as log:
+            supervisor = await asyncio.create_subprocess_exec(
+                sys.executable, MAIN, cwd=directory, env=env, stdout=log, stderr=log
+            )
+            try:
+                # One /start per worker: every worker is up before the timed run
+                warmup = [start_update(k + 1, workers * 10 ** 6 + k) for k in range(workers)]
+                sink.expect(workers)
+                await wait_for_server(url, supervisor)
+                await asyncio.gather(*(post_all(url, [update]) for update in warmup))
+                await asyncio.wait_for(sink.received.wait(), 60)
+
+                sink.expect(users * messages)
+                start = time.perf_counter()
+                await asyncio.gather(*(post_all(url, user_updates(user_id, messages))
+                                       for user_id in range(1, users + 1)))
+                try:
+                    await asyncio.wait_for(sink.received.wait(), 120)
+                except asyncio.TimeoutError:
+                    pass
+                elapsed = time.perf_counter() - start
+            finally:
+                supervisor.send_signal(signal.SIGTERM)
+                await supervisor.wait()
+
+    out_of_order = sum(1 for user_id in range(1, users + 1)
+                       if sink.replies[user_id] != [COMMANDS[k % 2] for k in range(messages)][:len(sink.replies[user_id])])
+    return {"elapsed": elapsed, "replies": sink.count, "out_of_order": out_of_order}
+
+def user_updates(user_id: int, messages: int) -> List[Dict]:
+    updates = []
+    for k in range(messages):
+        update = start_update(user_id * 1000 + k, user_id)
+        command = COMMANDS[k % 2]
+        update["message"]["text"] = command
+        update["message"]["entities"][0]["length"] = len(command)
+        updates.append(update)
+    return updates
+
+async def wait_for_server(url: str, supervisor: asyncio.subprocess.Process):
+    """Wait until the supervisor's webhook server answers"""
+    async with aiohttp.ClientSession() as session:
+        for _ in range(300):
+            if supervisor.returncode is not None:
+                raise RuntimeError(f"the bot exited with code {supervisor.returncode}")
+            try:
+                async with session.get(url) as response:
+                    if response.status == 405:
+                        return
+            except aiohttp.ClientConnectionError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError("the webhook server did not start")
+
+async def run(worker_counts: List[int], users: int, messages: int, backend: str) -> bool:
+    sink = SinkBotApi()
+    runner, api_port = await serve(sink)
+    results = {}
+    try:
+        for workers in worker_counts:
+            results[workers] = await run_workers(sink, api_port, workers, users, messages, backend)
+    finally:
+        await runner.cleanup()
+
+    total = users * messages
+    print(f"{total} updates ({users} users x {messages}), {backend} store, {os.cpu_count()} CPUs")
+    print(f"  {'workers':>7}  {'updates/s':>9}  {'speedup':>7}")
+    base = None
+    problems = []
+    for workers, result in results.items():
+        rate = result["replies"] / result["elapsed"]
+        base = base or rate
+        print(f"  {workers:>7}  {rate:>9.0f}  {rate / base:>6.2f}x")
+        if result["replies"] != total:
+            problems.append(f"{workers} workers: {result['replies']} replies for {total} updates")
+        if result["out_of_order"]:
+            problems.append(f"{workers} workers: {result['out_of_order']} users got their replies out of order")
+    for problem in problems:
+        print(f"FAILED: {problem}")
+    if not problems:
+        print("OK: every update answered, in order for each user")
+    return not problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4,8", help="comma-separated worker counts")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=6, help="updates per user, alternating /start and /menu")
+    parser.add_argument("--backend", default="sqlite", choices=("sqlite", "shared_json"))
+    args = parser.parse_args()
+    worker_counts = [int(count) for count in args.workers.split(",")]
+    ok = asyncio.run(run(worker_counts, args.users, args.messages, args.backend))
+    raise SystemExit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
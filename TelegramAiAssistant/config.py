@@ -3,6 +3,8 @@ from typing import List
 
 # Bot configuration
 BOT_TOKEN = os.getenv("BOT_TOKEN", "your_bot_token_here")
+# Bot API server base URL, e.g. a local telegram-bot-api server; api.telegram.org when empty
+BOT_API_URL = os.getenv("BOT_API_URL", "")
 
 # Admin user IDs (replace with actual admin user IDs)
 ADMIN_IDS: List[int] = [
@@ -12,10 +14,105 @@ ADMIN_IDS: List[int] = [
 # Database file paths
 CONFIG_FILE = "data/config.json"
 MENU_FILE = "data/menu.json"
+SQLITE_FILE = os.getenv("SQLITE_FILE", "data/krusty_krab.db")
+
+# Storage backend: "json" (data/config/ shards + journal), "shared_json" (the same
+# files, safe for several bot processes), "sqlite" or "memory"
+# Import existing JSON data with: python -m storage.sqlite_database
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+# shared_json: how often a process picks up the other processes' changes between its own mutations
+SHARED_SYNC_INTERVAL_SECONDS = float(os.getenv("SHARED_SYNC_INTERVAL_SECONDS", "1"))
+
+# Update delivery: "polling" (getUpdates) or "webhook" (embedded aiohttp server
+# receiving Telegram's requests, utils/webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Address the webhook server listens on (local only by default, behind a reverse
+# proxy; "0.0.0.0" to receive Telegram's requests directly) and its endpoint path
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Public HTTPS base URL the webhook is registered with at startup (WEBHOOK_URL +
+# WEBHOOK_PATH); leave empty when the reverse proxy setup registers it
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+# Telegram sends it back with every update, requests without it are answered 401;
+# generated at startup if empty and WEBHOOK_URL is set, required otherwise
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Updates processed at the same time; the others wait, already answered 200
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "32"))
+# Supervisor mode (utils/workers.py): with BOT_WORKERS > 0 this process only receives
+# the updates (as set by BOT_MODE) and hands each to one of BOT_WORKERS worker
+# processes, chosen by user id; needs STORAGE_BACKEND shared_json or sqlite
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "0"))
+# Index of a worker process from 0, set by the supervisor (-1 outside workers)
+BOT_WORKER = int(os.getenv("BOT_WORKER", "-1"))
+# Updates a worker processes at the same time; those of one user go one by one, in order
+WORKER_MAX_CONCURRENCY = int(os.getenv("WORKER_MAX_CONCURRENCY", "32"))
 
 # Bot settings
 MAX_ORDERS_PER_USER = 5
 ORDER_TIMEOUT_HOURS = 24
+# Carts untouched for this long are dropped by the sweeper
+CART_TTL_HOURS = float(os.getenv("CART_TTL_HOURS", "24"))
+SWEEP_INTERVAL_SECONDS = float(os.getenv("SWEEP_INTERVAL_SECONDS", "60"))
+
+# Persistence settings
+# "write_through" persists every mutation immediately; "write_behind" (opt-in)
+# coalesces mutations and flushes them in the background, so a crash can lose
+# up to SAVE_INTERVAL_SECONDS or SAVE_MAX_PENDING mutations
+SAVE_MODE = os.getenv("SAVE_MODE", "write_through")
+SAVE_INTERVAL_SECONDS = float(os.getenv("SAVE_INTERVAL_SECONDS", "2"))
+SAVE_MAX_PENDING = int(os.getenv("SAVE_MAX_PENDING", "50"))
+# Mutations are appended to data/config.journal; once it grows past this size
+# the changed collection shards in data/config/ are rewritten and it is reset
+JOURNAL_COMPACT_BYTES = int(os.getenv("JOURNAL_COMPACT_BYTES", str(1024 * 1024)))
+# Completed/rejected orders untouched for this many days are moved to
+# compressed monthly segments in data/archive/ (0 disables archiving)
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600"))
+# Shard format written by compaction: "json" (indented) or "compact" (zlib JSON lines);
+# shards in the other format are still read and converted at the next compaction
+SNAPSHOT_CODEC = os.getenv("SNAPSHOT_CODEC", "json")
+# Shards and the menu are replaced atomically behind a checksum header; this many
+# replaced versions are kept as <file>.1, <file>.2, ... for startup recovery
+SNAPSHOT_GENERATIONS = int(os.getenv("SNAPSHOT_GENERATIONS", "2"))
+# "eager" loads every shard before the bot starts, "hot_first" loads orders and
+# applications in the background after it started polling
+STARTUP_LOAD = os.getenv("STARTUP_LOAD", "eager")
+
+# Inbound throttling (middlewares/throttling.py): token buckets refilled at RATE
+# updates per second up to BURST, one per user and one per user and action.
+# THROTTLE_ACTION_LIMITS overrides single actions, e.g. "item=1/4,checkout=0.2/2"
+THROTTLE_USER_RATE = float(os.getenv("THROTTLE_USER_RATE", "3"))
+THROTTLE_USER_BURST = int(os.getenv("THROTTLE_USER_BURST", "10"))
+THROTTLE_ACTION_RATE = float(os.getenv("THROTTLE_ACTION_RATE", "1"))
+THROTTLE_ACTION_BURST = int(os.getenv("THROTTLE_ACTION_BURST", "5"))
+THROTTLE_ACTION_LIMITS = os.getenv("THROTTLE_ACTION_LIMITS", "")
+# Bucket states kept, least recently used users are forgotten past this
+THROTTLE_MAX_BUCKETS = int(os.getenv("THROTTLE_MAX_BUCKETS", "10000"))
+
+# Outbound pacing (middlewares/outbound.py): messages per second sent by the
+# bot overall, to one private chat and to one group, each with a burst.
+# Telegram allows about 30/s overall, 1/s per chat and 20/min per group
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_GLOBAL_BURST = int(os.getenv("OUTBOUND_GLOBAL_BURST", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60)))
+OUTBOUND_GROUP_BURST = int(os.getenv("OUTBOUND_GROUP_BURST", "20"))
+# Times a request answered 429 is sent again after retry_after before failing
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "5"))
+# Sender workers draining the outbound queue (utils/outbound_queue.py) and
+# jobs it holds before handlers wait to add more
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", "4"))
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", "1000"))
+# Outbox (utils/outbox.py): staff posts and notifications are stored with the
+# change they report and retried after OUTBOX_RETRY_BASE_SECONDS, doubling up
+# to OUTBOX_RETRY_MAX_SECONDS, until delivered or OUTBOX_MAX_ATTEMPTS failed
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "2"))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "600"))
+# Longest the outbox waits before looking for due messages again
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
 
 # Messages and emojis
 RESTAURANT_NAME = "𝐓𝐡𝐞 𝐊𝐫𝐮𝐬𝐭𝐲 𝐊𝐫𝐚𝐛 • 𝐍𝐞𝐨𝐭𝐞𝐜𝐧𝐨"
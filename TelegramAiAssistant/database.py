@@ -1,476 +1,605 @@
 import json
 import os
+import gc
+import copy
+import time
 import asyncio
-from typing import Dict, List, Optional, Any
+import logging
+from itertools import islice
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 from datetime import datetime, timedelta
-
-class Database:
-    def __init__(self):
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (SAVE_MODE, SAVE_INTERVAL_SECONDS, SAVE_MAX_PENDING, JOURNAL_COMPACT_BYTES, STORAGE_BACKEND,
+                    SQLITE_FILE, ARCHIVE_AFTER_DAYS, ARCHIVE_INTERVAL_SECONDS, SNAPSHOT_CODEC, STARTUP_LOAD,
+                    SNAPSHOT_GENERATIONS)
+from models.record import datetime_timestamp
+from storage.base import StorageBackend
+from storage.archive import OrderArchive
+from storage.atomic import write_atomic, read_newest_valid, generation_files
+from storage.codecs import CODECS, get_codec
+from storage.journal import Journal, make_record, apply_record, flatten
+from storage.memory import MemoryDatabase, DEFAULT_CONFIG, DEFAULT_MENU, migrate_carts, migrate_users, to_record
+from storage.sqlite_database import SqliteDatabase
+
+logger = logging.getLogger(__name__)
+
+# Shard holding the scalar config keys (staff_group_id, counters, ...)
+SETTINGS_SHARD = "settings"
+# Order statuses that never change again and can be archived
+TERMINAL_ORDER_STATUSES = ("completed", "rejected", "expired")
+# Shards that "hot_first" startup loads after polling started
+HISTORY_SHARDS = ("orders", "applications")
+# History entries inserted per event-loop iteration by the background loader
+HISTORY_LOAD_CHUNK = 500
+# Shard of the minecraft name map merged into the user profiles
+LEGACY_USERS_SHARD = "minecraft_names"
+
+class Database(MemoryDatabase):
+    """JSON-file storage backend: per-collection snapshot shards plus mutation journal.
+
+    Every collection of config (orders, carts, users, ...) is stored in its
+    own data/config/<collection> shard and the scalar keys share the
+    settings shard, encoded by the SNAPSHOT_CODEC of storage.codecs.
+    Compaction only rewrites the shards changed since the previous one, so
+    a cart tap never rewrites the order history. Old terminal orders are
+    moved out of memory into storage.archive. Shards and the menu are
+    replaced atomically behind a checksum header (storage.atomic), and a
+    file failing its checksum is loaded from its newest valid generation.
+
+    With STARTUP_LOAD=hot_first the order and application shards are not
+    loaded by the constructor: start_flusher() streams them in on the loop
+    a chunk at a time, and a call that needs one of them earlier finishes
+    loading it first (see _collection()).
+    """
+
+    def __init__(self, codec: str = SNAPSHOT_CODEC, startup_load: str = STARTUP_LOAD):
         self.config_file = "data/config.json"
+        self.shard_dir = "data/config"
         self.menu_file = "data/menu.json"
+        self.journal = Journal("data/config.journal")
+        self.compact_bytes = JOURNAL_COMPACT_BYTES
+        self.archive = OrderArchive("data/archive")
+        self.archive_after_days = ARCHIVE_AFTER_DAYS
+        self.archive_interval = ARCHIVE_INTERVAL_SECONDS
+        self._archiver_task: Optional[asyncio.Task] = None
+        self.codec = get_codec(codec)
+        self.snapshot_generations = SNAPSHOT_GENERATIONS
+        self.startup_load = startup_load
+        # History shards not loaded yet: name -> entries left to insert, None until the file is read
+        self._loading: Dict[str, Optional[Iterator[Tuple[str, Dict]]]] = {}
+        # Journal records of those shards, applied once they are loaded
+        self._deferred_records: List[Dict] = []
+        self._loader_task: Optional[asyncio.Task] = None
+
+        # Write-behind persistence state
+        self.write_behind = SAVE_MODE == "write_behind"
+        self.flush_interval = SAVE_INTERVAL_SECONDS
+        self.flush_max_pending = SAVE_MAX_PENDING
+        self._pending_mutations = 0
+        self._dirty_paths: Dict[Tuple[str, ...], None] = {}
+        # Shards with journaled changes not yet written by a compaction
+        self._dirty_shards: Set[str] = set()
+        self._flusher_task: Optional[asyncio.Task] = None
+        self._compacting = False
+        # Single writer thread: journal appends and snapshots run in submission order
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
         self.ensure_data_directory()
-        self.load_data()
+        super().__init__()
+        self.persistence_stats.update({
+            "flushes": 0,
+            "bytes_written": 0,
+            "coalesced_mutations": 0,
+            "journal_records": 0,
+            "compactions": 0,
+            "shard_writes": 0,
+            "archived_orders": 0
+        })
+        self.recover()
 
     def ensure_data_directory(self):
         """Ensure data directory exists"""
         os.makedirs("data", exist_ok=True)
 
     def load_data(self):
-        """Load data from files"""
-        self.config = self.load_json(self.config_file, {
-            "staff_group_id": None,
-            "topics": {},
-            "orders": {},
-            "sponsors": {},
-            "applications": {},
-            "carts": {},
-            "user_states": {},
-            "admins": [],
-            "order_counter": 0,
-            "sponsor_counter": 0
-        })
-
-        self.menu_data = self.load_json(self.menu_file, {
-            "categories": {
-                "🍔 Panini": {
-                    "Hamburger Classico": {"price": 8, "description": "Hamburger con carne, lattuga e pomodoro"},
-                    "Hamburger Deluxe": {"price": 12, "description": "Hamburger con doppia carne e formaggio"},
-                    "Cheeseburger": {"price": 10, "description": "Hamburger con formaggio fuso"}
-                },
-                "🥤 Bevande": {
-                    "Coca Cola": {"price": 3, "description": "Bibita fresca"},
-                    "Acqua": {"price": 2, "description": "Acqua naturale"},
-                    "Birra": {"price": 5, "description": "Birra fresca"}
-                },
-                "🍟 Extra": {
-                    "Patatine Fritte": {"price": 4, "description": "Patatine croccanti"},
-                    "Onion Rings": {"price": 4, "description": "Anelli di cipolla fritti"},
-                    "Salse Varie": {"price": 1, "description": "Ketchup, maionese, senape"}
-                }
-            }
-        })
-
-    def load_json(self, filename: str, default: Dict) -> Dict:
-        """Load JSON file with default fallback"""
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return default
-
-    def save_config(self):
-        """Save configuration to file"""
-        with open(self.config_file, 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, indent=2, ensure_ascii=False)
-
-    def save_menu(self):
-        """Save menu to file"""
-        with open(self.menu_file, 'w', encoding='utf-8') as f:
-            json.dump(self.menu_data, f, indent=2, ensure_ascii=False)
-
-    def add_menu_item(self, category: str, name: str, price: int, description: str) -> bool:
-        """Add new item to menu"""
-        if "categories" not in self.menu_data:
-            self.menu_data["categories"] = {}
-        if category not in self.menu_data["categories"]:
-            self.menu_data["categories"][category] = {}
-
-        if name in self.menu_data["categories"][category]:
-            return False  # Item already exists
-
-        self.menu_data["categories"][category][name] = {
-            "price": price,
-            "description": description
-        }
-        self.save_menu()
-        return True
+        """Load snapshot shards and menu from files, migrating a single config.json first"""
+        if not os.path.isdir(self.shard_dir) and os.path.exists(self.config_file):
+            self.migrate_to_shards()
+        os.makedirs(self.shard_dir, exist_ok=True)
+
+        self.config = copy.deepcopy(DEFAULT_CONFIG)
+        self._shard_codecs = self._find_shards()
+        if SETTINGS_SHARD in self._shard_codecs:
+            self.config.update(self._load_shard(SETTINGS_SHARD, {}))
+        for name in self._shard_codecs:
+            if name == SETTINGS_SHARD:
+                continue
+            if name in HISTORY_SHARDS and self.startup_load == "hot_first":
+                self.config[name] = {}
+                self._loading[name] = None
+            else:
+                self.config[name] = self._load_shard(name, self.config.get(name, {}))
+        # Shards in another format are rewritten by the next compaction
+        self._dirty_shards.update(
+            name for name, codec in self._shard_codecs.items() if codec is not self.codec and name not in self._loading
+        )
+        self.menu_data = self.load_json(self.menu_file, copy.deepcopy(DEFAULT_MENU))
+
+    def migrate_to_shards(self):
+        """Split the legacy single-document config.json into shards.
+
+        Shards are written to a temporary directory that is renamed into
+        place, and config.json is kept as config.json.migrated, so a crash
+        mid-migration simply migrates again on the next start.
+        """
+        config = self.load_json(self.config_file, copy.deepcopy(DEFAULT_CONFIG))
+        tmp_dir = self.shard_dir + ".tmp"
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name, value in self._split_shards(config, config).items():
+            self._write_file(os.path.join(tmp_dir, name + self.codec.extension), self.codec.dumps(value))
+        os.replace(tmp_dir, self.shard_dir)
+        os.replace(self.config_file, self.config_file + ".migrated")
+        logger.info(f"Migrated {self.config_file} into shards in {self.shard_dir}")
+
+    def recover(self):
+        """Replay the journal on top of the loaded snapshot.
+
+        Records of history shards that are not loaded yet are kept aside and
+        applied by _finish_loading(); the journal is then only compacted
+        once those shards are loaded, since compaction resets it.
+        """
+        records = self.journal.read()
+        if records:
+            for record in flatten(records):
+                if record["path"][0] in self._loading:
+                    self._deferred_records.append(record)
+                else:
+                    apply_record(self.config, record, to_record)
+            logger.info(f"Replayed {len(records)} journal records on top of {self.shard_dir}")
+            # Records written before the item-keyed cart format hold list carts
+            migrate_carts(self.config)
+            migrate_users(self.config)
+            self._dirty_shards.update(self._shard_of(key) for key in self.config if key not in self._loading)
+        if self._merge_legacy_users():
+            logger.info("Merged minecraft_names into the user profiles")
+        elif not records:
+            return
+        self.rebuild_indexes()
+        if not self._deferred_records:
+            self.compact()
 
-    def remove_menu_item(self, category: str, item_name: str) -> bool:
-        """Remove item from menu"""
-        if "categories" not in self.menu_data or category not in self.menu_data["categories"]:
+    def _merge_legacy_users(self) -> bool:
+        """Persist the minecraft_names shard merged into users by migrate_users(), returns True if there was one"""
+        if LEGACY_USERS_SHARD not in self._shard_codecs:
             return False
-
-        if item_name in self.menu_data["categories"][category]:
-            del self.menu_data["categories"][category][item_name]
-            self.save_menu()
-            return True
-        return False
-
-    def add_category(self, category_name: str) -> bool:
-        """Add new category"""
-        if "categories" not in self.menu_data:
-            self.menu_data["categories"] = {}
-
-        if category_name in self.menu_data["categories"]:
-            return False  # Category already exists
-
-        self.menu_data["categories"][category_name] = {}
-        self.save_menu()
+        # Written and removed at the next compaction (see _snapshot())
+        self._dirty_shards.update(("users", LEGACY_USERS_SHARD))
+        del self._shard_codecs[LEGACY_USERS_SHARD]
         return True
 
-    def remove_category(self, category_name: str) -> bool:
-        """Remove category"""
-        if "categories" not in self.menu_data or category_name not in self.menu_data["categories"]:
-            return False
-
-        del self.menu_data["categories"][category_name]
-        self.save_menu()
-        return True
+    def _find_shards(self) -> Dict:
+        """Codec of every shard file, preferring SNAPSHOT_CODEC for a shard found in both formats"""
+        shards = {}
+        for filename in sorted(os.listdir(self.shard_dir)):
+            for codec in CODECS.values():
+                if filename.endswith(codec.extension):
+                    name = filename[:-len(codec.extension)]
+                    if shards.get(name) is not self.codec:
+                        shards[name] = codec
+        return shards
+
+    def _shard_file(self, name: str, codec=None) -> str:
+        return os.path.join(self.shard_dir, name + (codec or self.codec).extension)
+
+    def _load_shard(self, name: str, default):
+        """Decode the newest valid generation of a shard, default if it has none"""
+        codec = self._shard_codecs[name]
+        path = self._shard_file(name, codec)
+        with gc_paused():
+            value, source = read_newest_valid(path, self.snapshot_generations, codec.loads)
+            if source is None:
+                return default
+            if source != path:
+                self._dirty_shards.add(name)  # rewrite the damaged file at the next compaction
+            return to_record((name,), value)
+
+    def _shard_of(self, key: str) -> str:
+        """Shard storing a top-level config key"""
+        return key if isinstance(self.config.get(key), (dict, list)) else SETTINGS_SHARD
+
+    @staticmethod
+    def _split_shards(config: Dict, names) -> Dict:
+        """Shallow copies of the named shards of config"""
+        shards = {}
+        for name in names:
+            value = config.get(name)
+            if isinstance(value, (dict, list)):
+                shards[name] = value.copy()
+            elif SETTINGS_SHARD not in shards:
+                shards[SETTINGS_SHARD] = {
+                    key: value for key, value in config.items() if not isinstance(value, (dict, list))
+                }
+        return shards
 
-    # Staff group management
-    def get_staff_group_id(self) -> Optional[int]:
-        return self.config.get("staff_group_id")
-
-    def set_staff_group_id(self, group_id: int):
-        self.config["staff_group_id"] = group_id
-        self.save_config()
-
-    def get_topic_id(self, topic_name: str) -> Optional[int]:
-        return self.config.get("topics", {}).get(topic_name)
-
-    def set_topic_id(self, topic_name: str, topic_id: int):
-        if "topics" not in self.config:
-            self.config["topics"] = {}
-        self.config["topics"][topic_name] = topic_id
-        self.save_config()
-
-    # Menu management
-    def get_menu(self) -> Dict:
-        return self.menu_data
-
-    def get_categories(self) -> List[str]:
-        return list(self.menu_data.get("categories", {}).keys())
-
-    def get_category_items(self, category: str) -> Dict:
-        return self.menu_data.get("categories", {}).get(category, {})
-
-    # Cart management
-    def get_user_cart(self, user_id: int) -> List[Dict]:
-        """Get user's cart items"""
-        if "carts" not in self.config:
-            self.config["carts"] = {}
-        return self.config["carts"].get(str(user_id), [])
-
-    def add_to_cart(self, user_id: int, item_name: str, item_price: int, category: str):
-        """Add item to user's cart"""
-        if "carts" not in self.config:
-            self.config["carts"] = {}
-
-        if str(user_id) not in self.config["carts"]:
-            self.config["carts"][str(user_id)] = []
-
-        cart_item = {
-            "item_name": item_name,
-            "item_price": item_price,
-            "category": category,
-            "quantity": 1,
-            "added_at": datetime.now().isoformat()
-        }
-
-        # Check if item already exists in cart
-        existing_item = None
-        for item in self.config["carts"][str(user_id)]:
-            if item["item_name"] == item_name:
-                existing_item = item
-                break
-
-        if existing_item:
-            existing_item["quantity"] += 1
-        else:
-            self.config["carts"][str(user_id)].append(cart_item)
-
-        self.save_config()
-
-    def remove_from_cart(self, user_id: int, item_name: str):
-        """Remove item from user's cart"""
-        if "carts" not in self.config:
+    def load_json(self, filename: str, default: Dict) -> Dict:
+        """Load the newest valid generation of a JSON file, default if it does not exist"""
+        value, source = read_newest_valid(
+            filename, self.snapshot_generations, lambda data: json.loads(data.decode('utf-8'))
+        )
+        return default if source is None else value
+
+    def save_config(self, *paths: Tuple[str, ...]):
+        """Record changed config paths and persist them according to SAVE_MODE"""
+        for path in paths:
+            self._dirty_paths[path] = None
+        if self._undo is not None:
+            return  # persisted once by end_batch()
+        self.persistence_stats["mutations"] += 1
+        self._pending_mutations += 1
+
+        if not self.defer_flush and self.needs_flush():
+            self.flush()
+
+    def needs_flush(self) -> bool:
+        """Check if pending mutations must be written before the next flush interval"""
+        if not self._pending_mutations or self._undo is not None:
+            return False
+        return not self.write_behind or self._pending_mutations >= self.flush_max_pending
+
+    def _take_pending(self) -> List[Dict]:
+        """Build journal records for the dirty paths and reset pending state"""
+        records = [make_record(self.config, path) for path in self._dirty_paths]
+        self._dirty_shards.update(self._shard_of(path[0]) for path in self._dirty_paths)
+        self.persistence_stats["coalesced_mutations"] += self._pending_mutations - 1
+        self._pending_mutations = 0
+        self._dirty_paths.clear()
+        return records
+
+    def _append_records(self, records: List[Dict]) -> Tuple[int, int]:
+        """Writer thread: append records, returns bytes written and journal size"""
+        written = self.journal.append(records)
+        return written, self.journal.size()
+
+    def _record_flush(self, records: List[Dict], written: int):
+        self.persistence_stats["flushes"] += 1
+        self.persistence_stats["bytes_written"] += written
+        self.persistence_stats["journal_records"] += len(records)
+
+    def flush(self):
+        """Append pending changes to the journal, blocking until written"""
+        if not self._pending_mutations or self._undo is not None:
             return
 
-        cart = self.config["carts"].get(str(user_id), [])
-        self.config["carts"][str(user_id)] = [item for item in cart if item["item_name"] != item_name]
-        self.save_config()
+        records = self._take_pending()
+        written, journal_size = self._writer.submit(self._append_records, records).result()
+        self._record_flush(records, written)
+
+        if journal_size >= self.compact_bytes:
+            self.compact()
 
-    def clear_cart(self, user_id: int):
-        """Clear user's cart"""
-        if "carts" not in self.config:
+    async def flush_async(self):
+        """Append pending changes to the journal from the writer thread"""
+        if not self._pending_mutations or self._undo is not None:
             return
 
-        if str(user_id) in self.config["carts"]:
-            del self.config["carts"][str(user_id)]
-            self.save_config()
-
-    def get_cart_total(self, user_id: int) -> int:
-        """Get total price of items in cart"""
-        cart = self.get_user_cart(user_id)
-        return sum(item["item_price"] * item["quantity"] for item in cart)
-
-    def get_cart_count(self, user_id: int) -> int:
-        """Get total number of items in cart"""
-        cart = self.get_user_cart(user_id)
-        return sum(item["quantity"] for item in cart)
-
-    # Order management
-    def create_order_from_cart(self, user_id: int, username: str) -> Optional[str]:
-        """Create order from user's cart"""
-        cart = self.get_user_cart(user_id)
-        if not cart:
-            return None
-
-        # Increment order counter for sequential numbering
-        self.config["order_counter"] = self.config.get("order_counter", 0) + 1
-        order_number = self.config["order_counter"]
-        order_id = f"{order_number}"
-        total_price = self.get_cart_total(user_id)
-
-        order_data = {
-            "id": order_id,
-            "user_id": user_id,
-            "username": username,
-            "items": cart.copy(),
-            "total_price": total_price,
-            "status": "pending",
-            "created_at": datetime.now().isoformat(),
-            "staff_message_id": None,
-            "assigned_to": None
-        }
-
-        if "orders" not in self.config:
-            self.config["orders"] = {}
-
-        self.config["orders"][order_id] = order_data
-        self.clear_cart(user_id)  # Clear cart after creating order
-        self.save_config()
-        return order_id
-
-    def create_order(self, user_id: int, username: str, item_name: str, item_price: int) -> str:
-        """Legacy method for single item orders"""
-        order_id = f"order_{user_id}_{int(datetime.now().timestamp())}"
-        order_data = {
-            "id": order_id,
-            "user_id": user_id,
-            "username": username,
-            "items": [{
-                "item_name": item_name,
-                "item_price": item_price,
-                "quantity": 1
-            }],
-            "total_price": item_price,
-            "status": "pending",
-            "created_at": datetime.now().isoformat(),
-            "staff_message_id": None,
-            "assigned_to": None
-        }
-
-        if "orders" not in self.config:
-            self.config["orders"] = {}
-
-        self.config["orders"][order_id] = order_data
-        self.save_config()
-        return order_id
-
-    def add_admin(self, user_id: int) -> bool:
-        """Add a new admin"""
-        if 'admins' not in self.config:
-            self.config['admins'] = []
-
-        if user_id not in self.config['admins']:
-            self.config['admins'].append(user_id)
-            self.save_config()
-            return True
-        return False
-
-    def is_admin(self, user_id: int) -> bool:
-        """Check if user is admin"""
-        return user_id in self.config.get('admins', [])
-
-    def set_sponsor_channel_id(self, channel_id: int):
-        """Set sponsor channel ID"""
-        self.config["sponsor_channel_id"] = channel_id
-        self.save_config()
-
-    def get_sponsor_channel_id(self) -> Optional[int]:
-        """Get sponsor channel ID"""
-        return self.config.get("sponsor_channel_id")
+        records = self._take_pending()
+        loop = asyncio.get_running_loop()
+        written, journal_size = await loop.run_in_executor(self._writer, self._append_records, records)
+        self._record_flush(records, written)
+
+        if journal_size >= self.compact_bytes and not self._compacting:
+            await self.compact_async()
+
+    def _snapshot(self) -> Dict:
+        """Shallow copy of the dirty shards, consistent because entries are never changed in place"""
+        # Deferred records would be lost with the journal reset
+        for name in {record["path"][0] for record in self._deferred_records} | (self._dirty_shards & set(self._loading)):
+            self._finish_loading(name)
+        shards = self._split_shards(self.config, self._dirty_shards)
+        # A dirty shard whose collection is gone is removed
+        shards.update(
+            (name, None) for name in self._dirty_shards
+            if name != SETTINGS_SHARD and not isinstance(self.config.get(name), (dict, list))
+        )
+        self._dirty_shards.clear()
+        return shards
+
+    def _write_file(self, filename: str, data: bytes) -> int:
+        """Atomically replace a file, keeping its previous generations, returns bytes written"""
+        return write_atomic(filename, data, self.snapshot_generations)
+
+    def _write_shards(self, shards: Dict) -> int:
+        """Writer thread: write shards with the current codec and remove the None ones, returns bytes written"""
+        written = 0
+        for name, value in shards.items():
+            if value is not None:
+                written += self._write_file(self._shard_file(name), self.codec.dumps(value))
+            for codec in CODECS.values():
+                if codec is self.codec and value is not None:
+                    continue
+                for path in generation_files(self._shard_file(name, codec), self.snapshot_generations):
+                    if os.path.exists(path):
+                        os.remove(path)
+        return written
+
+    def _write_snapshot(self, shards: Dict) -> int:
+        """Writer thread: write the dirty shards and reset the journal"""
+        written = self._write_shards(shards)
+        self.journal.reset()
+        return written
+
+    def _record_compaction(self, shards: Dict, written: int):
+        self.persistence_stats["compactions"] += 1
+        self.persistence_stats["shard_writes"] += len(shards)
+        self.persistence_stats["bytes_written"] += written
+
+    def compact(self):
+        """Write the dirty shards and reset the journal, blocking until written"""
+        shards = self._snapshot()
+        written = self._writer.submit(self._write_snapshot, shards).result()
+        self._record_compaction(shards, written)
+
+    async def compact_async(self):
+        """Write a full snapshot from the writer thread.
+
+        The snapshot is taken on the loop before later journal appends are
+        queued, and the single writer thread runs jobs in order, so records
+        appended after the reset are exactly the mutations made after it.
+        """
+        self._compacting = True
+        try:
+            shards = self._snapshot()
+            loop = asyncio.get_running_loop()
+            written = await loop.run_in_executor(self._writer, self._write_snapshot, shards)
+        finally:
+            self._compacting = False
+        self._record_compaction(shards, written)
+
+    def is_dirty(self) -> bool:
+        """Check if there are mutations not yet written to file"""
+        return self._pending_mutations > 0
+
+    def get_persistence_stats(self) -> Dict:
+        """Get flush, bytes written and coalesced mutation counters"""
+        return dict(self.persistence_stats, pending_mutations=self._pending_mutations)
+
+    def start_flusher(self):
+        """Start the background history loader, write-behind flusher and order archiver"""
+        if self._loading and not self._loader_task:
+            self._loader_task = asyncio.create_task(self._run_history_loader())
+        if self.write_behind and not self._flusher_task:
+            self._flusher_task = asyncio.create_task(self._run_flusher())
+        if self.archive_after_days and not self._archiver_task:
+            self._archiver_task = asyncio.create_task(self._run_archiver())
+
+    async def _run_flusher(self):
+        """Flush pending mutations at most once per flush interval"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush_async()
+            except Exception as e:
+                logger.error(f"Error flushing database: {e}")
+
+    async def close(self):
+        """Stop the background tasks, force a final flush and compaction"""
+        for task in (self._loader_task, self._flusher_task, self._archiver_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._loader_task = self._flusher_task = self._archiver_task = None
+
+        await self.flush_async()
+        if self.journal.size() or self._dirty_shards:
+            await self.compact_async()
+        self._writer.shutdown(wait=True)
+        logger.info(f"Database closed: {self.get_persistence_stats()}")
+
+    # History loading
+    def _collection(self, name: str) -> Dict:
+        if name in self._loading:
+            self._finish_loading(name)
+        return self.config.get(name, {})
+
+    def _set(self, path: Tuple[str, ...], value):
+        if path[0] in self._loading:
+            self._finish_loading(path[0])
+        super()._set(path, value)
+
+    def _delete(self, path: Tuple[str, ...]):
+        if path[0] in self._loading:
+            self._finish_loading(path[0])
+        super()._delete(path)
+
+    def _read_history(self, name: str) -> Iterator[Tuple[str, Dict]]:
+        """Read the newest valid generation of a history shard, returns its entries decoded on demand"""
+        codec = self._shard_codecs[name]
+        path = self._shard_file(name, codec)
+        data, source = read_newest_valid(path, self.snapshot_generations)
+        if source is None:
+            return iter(())
+        if source != path:
+            self._dirty_shards.add(name)
+        return codec.iter_items(data)
+
+    def _load_entries(self, name: str, entries: Iterator[Tuple[str, Dict]], limit: Optional[int] = None) -> int:
+        """Insert up to limit entries into a loading collection, returns the number inserted"""
+        collection = self.config[name]
+        loaded = 0
+        try:
+            for key, record in islice(entries, limit):
+                record = to_record((name, key), record)
+                collection[key] = record
+                self._reindex((name, key), None, record)
+                loaded += 1
+        except ValueError as e:
+            logger.error(f"Error decoding {name} shard, kept {len(collection)} entries: {e}")
+        return loaded
+
+    def _finish_loading(self, name: str):
+        """Insert the remaining entries of a history shard and apply its deferred journal records"""
+        entries = self._loading[name]
+        if entries is None:
+            # Raises while no generation is valid: the shard stays unloaded and is never compacted empty
+            entries = self._read_history(name)
+        del self._loading[name]
+        self._load_entries(name, entries)
+
+        records = [record for record in self._deferred_records if record["path"][0] == name]
+        if records:
+            self._deferred_records = [record for record in self._deferred_records if record["path"][0] != name]
+            collection = self.config[name]
+            for record in records:
+                path = tuple(record["path"])
+                old = collection.get(path[1]) if len(path) > 1 else None
+                apply_record(self.config, record, to_record)
+                self._reindex(path, old, collection.get(path[1]) if len(path) > 1 else None)
+            self._dirty_shards.add(name)
+        if self._shard_codecs[name] is not self.codec:
+            self._dirty_shards.add(name)
+        logger.info(f"Loaded {len(self.config[name])} {name}")
+
+    def load_history(self):
+        """Finish loading every history shard, blocking"""
+        for name in list(self._loading):
+            self._finish_loading(name)
+
+    async def load_history_async(self):
+        """Load the history shards a chunk at a time between event-loop iterations.
+
+        Files are read and decompressed on a thread; entries are decoded and
+        indexed on the loop, HISTORY_LOAD_CHUNK at a time, continuing from
+        the same iterator if a call needs a shard before it is done.
+        """
+        loop = asyncio.get_running_loop()
+        for name in list(self._loading):
+            entries = await loop.run_in_executor(None, self._read_history, name)
+            if name not in self._loading:
+                continue  # loaded on first use while the file was read
+            self._loading[name] = entries
+            while name in self._loading:
+                if self._load_entries(name, entries, HISTORY_LOAD_CHUNK) < HISTORY_LOAD_CHUNK:
+                    self._finish_loading(name)
+                # Keep loaded records out of full collections, which would
+                # otherwise rescan the growing history on the loop (records
+                # hold no reference cycles, so refcounting still frees them)
+                gc.freeze()
+                await asyncio.sleep(0)
+
+    async def _run_history_loader(self):
+        start = time.perf_counter()
+        try:
+            await self.load_history_async()
+            logger.info(f"History loaded in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            logger.error(f"Error loading history: {e}")
 
+    # Order archive
     def get_order(self, order_id: str) -> Optional[Dict]:
-        return self.config.get("orders", {}).get(order_id)
-
-    def update_order_status(self, order_id: str, status: str, staff_user_id: Optional[int] = None):
-        if order_id in self.config.get("orders", {}):
-            self.config["orders"][order_id]["status"] = status
-            self.config["orders"][order_id]["updated_at"] = datetime.now().isoformat()
-            if staff_user_id:
-                self.config["orders"][order_id]["assigned_to"] = staff_user_id
-            self.save_config()
-
-    def set_order_staff_message(self, order_id: str, message_id: int):
-        if order_id in self.config.get("orders", {}):
-            self.config["orders"][order_id]["staff_message_id"] = message_id
-            self.save_config()
-
-    # Sponsor management
-    def create_sponsor_request(self, user_id: int, username: str, message: str, original_message_id: int = None, original_chat_id: int = None) -> str:
-        # Increment sponsor counter for sequential numbering
-        self.config["sponsor_counter"] = self.config.get("sponsor_counter", 0) + 1
-        sponsor_number = self.config["sponsor_counter"]
-        sponsor_id = f"S{sponsor_number}"
-        sponsor_data = {
-            "id": sponsor_id,
-            "user_id": user_id,
-            "username": username,
-            "message": message,
-            "original_message_id": original_message_id,
-            "original_chat_id": original_chat_id,
-            "status": "pending",
-            "created_at": datetime.now().isoformat(),
-            "staff_message_id": None
-        }
-
-        if "sponsors" not in self.config:
-            self.config["sponsors"] = {}
-
-        self.config["sponsors"][sponsor_id] = sponsor_data
-        self.save_config()
-        return sponsor_id
-
-    def get_sponsor_request(self, sponsor_id: str) -> Optional[Dict]:
-        return self.config.get("sponsors", {}).get(sponsor_id)
-
-    def update_sponsor_status(self, sponsor_id: str, status: str):
-        if sponsor_id in self.config.get("sponsors", {}):
-            self.config["sponsors"][sponsor_id]["status"] = status
-            self.config["sponsors"][sponsor_id]["updated_at"] = datetime.now().isoformat()
-            self.save_config()
-
-    def set_sponsor_staff_message(self, sponsor_id: str, message_id: int):
-        if sponsor_id in self.config.get("sponsors", {}):
-            self.config["sponsors"][sponsor_id]["staff_message_id"] = message_id
-            self.save_config()
-
-    # Application management
-    def create_application(self, user_id: int, username: str, full_name: str, minecraft_name: str, 
-                         telegram: str, presentation: str, reason: str, experience: str, 
-                         hours: str, advice: str, bad_employee: str, additional: str) -> str:
-        app_id = f"app_{user_id}_{int(datetime.now().timestamp())}"
-        app_data = {
-            "id": app_id,
-            "user_id": user_id,
-            "username": username,
-            "full_name": full_name,
-            "minecraft_name": minecraft_name,
-            "telegram": telegram,
-            "presentation": presentation,
-            "reason": reason,
-            "experience": experience,
-            "hours": hours,
-            "advice": advice,
-            "bad_employee": bad_employee,
-            "additional": additional,
-            "status": "pending",
-            "created_at": datetime.now().isoformat(),
-            "staff_message_id": None
-        }
-
-        if "applications" not in self.config:
-            self.config["applications"] = {}
-
-        self.config["applications"][app_id] = app_data
-        self.save_config()
-        return app_id
-
-    def get_application(self, app_id: str) -> Optional[Dict]:
-        return self.config.get("applications", {}).get(app_id)
-
-    def update_application_status(self, app_id: str, status: str):
-        if app_id in self.config.get("applications", {}):
-            self.config["applications"][app_id]["status"] = status
-            self.config["applications"][app_id]["updated_at"] = datetime.now().isoformat()
-            self.save_config()
-
-    def set_application_staff_message(self, app_id: str, message_id: int):
-        if app_id in self.config.get("applications", {}):
-            self.config["applications"][app_id]["staff_message_id"] = message_id
-            self.save_config()
-
-    # Admin management
-    def add_admin(self, user_id: int) -> bool:
-        """Add a new admin"""
-        if "admins" not in self.config:
-            self.config["admins"] = []
-
-        if user_id not in self.config["admins"]:
-            self.config["admins"].append(user_id)
-            self.save_config()
-            return True
-        return False
-
-    def remove_admin(self, user_id: int) -> bool:
-        """Remove an admin"""
-        if "admins" not in self.config:
-            return False
+        """Get an order from memory, falling back to the archive"""
+        order = super().get_order(order_id)
+        if order is None and order_id in self.archive:
+            order = to_record(("orders", order_id), self.archive.get(order_id))
+        return order
+
+    def _archivable_orders(self, max_age_days: Optional[int]) -> List[Dict]:
+        """Terminal orders not updated for max_age_days"""
+        days = self.archive_after_days if max_age_days is None else max_age_days
+        cutoff = datetime_timestamp(datetime.now() - timedelta(days=days))
+        return [
+            order for order in self._collection("orders").values()
+            if order.status in TERMINAL_ORDER_STATUSES and (order.updated_at or order.created_at) < cutoff
+        ]
+
+    def _drop_archived(self, orders: List[Dict], written: int):
+        """Remove archived orders from memory, skipping any changed while being archived"""
+        with self.batch():
+            for order in orders:
+                if self._collection("orders").get(order["id"]) is order:
+                    self._delete(("orders", order["id"]))
+                    self.save_config(("orders", order["id"]))
+        self.persistence_stats["archived_orders"] += len(orders)
+        self.persistence_stats["bytes_written"] += written
+
+    def archive_orders(self, max_age_days: Optional[int] = None) -> int:
+        """Move old terminal orders to the archive, blocking until written"""
+        orders = self._archivable_orders(max_age_days)
+        if not orders:
+            return 0
+
+        written = self._writer.submit(self.archive.append, orders).result()
+        self._drop_archived(orders, written)
+        return len(orders)
+
+    async def archive_orders_async(self, max_age_days: Optional[int] = None) -> int:
+        """Move old terminal orders to the archive from the writer thread.
+
+        Orders are dropped from memory only once their segment and index
+        lines are on disk; a crash in between leaves them in both places,
+        which is harmless because get_order() checks memory first.
+        """
+        orders = self._archivable_orders(max_age_days)
+        if not orders:
+            return 0
+
+        loop = asyncio.get_running_loop()
+        written = await loop.run_in_executor(self._writer, self.archive.append, orders)
+        self._drop_archived(orders, written)
+        if self.needs_flush():
+            await self.flush_async()
+        return len(orders)
+
+    async def _run_archiver(self):
+        """Archive old terminal orders once per archive interval"""
+        if self._loader_task:
+            await asyncio.wait([self._loader_task])
+        while True:
+            try:
+                archived = await self.archive_orders_async()
+                if archived:
+                    logger.info(f"Archived {archived} orders, {len(self.archive)} in the archive")
+            except Exception as e:
+                logger.error(f"Error archiving orders: {e}")
+            await asyncio.sleep(self.archive_interval)
 
-        if user_id in self.config["admins"]:
-            self.config["admins"].remove(user_id)
-            self.save_config()
-            return True
-        return False
-
-    def get_admins(self) -> list:
-        """Get list of admin user IDs"""
-        return self.config.get("admins", [])
-
-    def is_admin(self, user_id: int) -> bool:
-        """Check if user is admin"""
-        return user_id in self.config.get("admins", [])
-
-    def get_current_time(self) -> datetime:
-        """Get current datetime"""
-        return datetime.now()
-    
-    def set_user_minecraft_name(self, user_id: int, minecraft_name: str, username: str = None):
-        """Set user minecraft name"""
-        if "minecraft_names" not in self.config:
-            self.config["minecraft_names"] = {}
-        if "users" not in self.config:
-            self.config["users"] = {}
-        
-        self.config["minecraft_names"][str(user_id)] = minecraft_name
-        self.config["users"][str(user_id)] = {
-            "minecraft_name": minecraft_name,
-            "username": username,
-            "banned": False,
-            "registered_at": self.get_current_time().isoformat()
-        }
-        self.save_config()
-    
-    def get_user_minecraft_name(self, user_id: int) -> str:
-        """Get user minecraft name"""
-        return self.config.get("minecraft_names", {}).get(str(user_id))
-    
-    def ban_user(self, user_id: int):
-        """Ban user from bot"""
-        if "users" not in self.config:
-            self.config["users"] = {}
-        if str(user_id) not in self.config["users"]:
-            self.config["users"][str(user_id)] = {}
-        
-        self.config["users"][str(user_id)]["banned"] = True
-        self.save_config()
-    
-    def unban_user(self, user_id: int):
-        """Unban user from bot"""
-        if "users" not in self.config:
-            self.config["users"] = {}
-        if str(user_id) not in self.config["users"]:
-            self.config["users"][str(user_id)] = {}
-        
-        self.config["users"][str(user_id)]["banned"] = False
-        self.save_config()
-    
-    def is_user_banned(self, user_id: int) -> bool:
-        """Check if user is banned"""
-        return self.config.get("users", {}).get(str(user_id), {}).get("banned", False)
-    
-    def get_all_users(self) -> dict:
-        """Get all registered users"""
-        return self.config.get("users", {})
\ No newline at end of file
+    def save_menu(self):
+        """Queue a menu write on the writer thread"""
+        self.menu_index.rebuild(self.menu_data)
+        self._writer.submit(self._write_menu, copy.deepcopy(self.menu_data))
+
+    def _write_menu(self, menu: Dict):
+        """Writer thread: save menu to file"""
+        self._write_file(self.menu_file, json.dumps(menu, indent=2, ensure_ascii=False).encode('utf-8'))
+
+@contextmanager
+def gc_paused():
+    """Suspend garbage collection while decoding a shard.
+
+    Decoded entries hold no reference cycles, so the collections triggered
+    by allocating them would only rescan the growing collection.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def create_database(backend: str = STORAGE_BACKEND) -> StorageBackend:
+    """Create the storage backend selected by STORAGE_BACKEND"""
+    if backend == "sqlite":
+        return SqliteDatabase(SQLITE_FILE)
+    if backend == "memory":
+        return MemoryDatabase()
+    if backend == "json":
+        return Database()
+    if backend == "shared_json":
+        from storage.shared import SharedDatabase
+        return SharedDatabase()
+    raise ValueError(f"Unknown storage backend: {backend}")
@@ -6,18 +6,23 @@ from aiogram.exceptions import TelegramBadRequest
 
 from config import ADMIN_IDS
 from utils.keyboards import AdminKeyboard
+from utils.callback_router import callback_router
 from handlers.states import AdminStates
-from database import Database
+from storage.async_database import AsyncDatabase
+from middlewares.throttling import ThrottlingMiddleware
+from middlewares.outbound import OutboundLimiter
+from utils.outbound_queue import OutboundQueue
+from utils.outbox import Outbox
 
 router = Router()
 
-def is_admin(user_id: int, db: Database) -> bool:
+async def is_admin(user_id: int, db: AsyncDatabase) -> bool:
     """Check if user is admin"""
-    return user_id in ADMIN_IDS or db.is_admin(user_id)
+    return user_id in ADMIN_IDS or await db.is_admin(user_id)
 
-async def cmd_setup_staff(message: Message, db: Database):
+async def cmd_setup_staff(message: Message, db: AsyncDatabase):
     """Setup staff group - admin only"""
-    if not is_admin(message.from_user.id, db):
+    if not await is_admin(message.from_user.id, db):
         await message.answer("❌ Non hai i permessi per questo comando!")
         return
 
@@ -34,7 +39,7 @@ async def cmd_setup_staff(message: Message, db: Database):
         return
 
     # Set this group as staff group
-    db.set_staff_group_id(message.chat.id)
+    await db.set_staff_group_id(message.chat.id)
 
     await message.answer(
         f"✅ **Gruppo Staff Configurato!**\n\n"
@@ -42,7 +47,7 @@ async def cmd_setup_staff(message: Message, db: Database):
         f"📋 Ora usa /create_topics per creare i topics necessari"
     )
 
-async def cmd_create_topics(message: Message, db: Database, bot: Bot):
+async def cmd_create_topics(message: Message, db: AsyncDatabase, bot: Bot):
     """Create forum topics in staff group"""
     if message.chat.type != "supergroup":
         await message.answer("❌ Questo comando funziona solo nei supergruppi!")
@@ -64,7 +69,7 @@ async def cmd_create_topics(message: Message, db: Database, bot: Bot):
     for topic_name, topic_key in topics:
         try:
             # Check if topic already exists
-            existing_topic_id = db.get_topic_id(topic_key)
+            existing_topic_id = await db.get_topic_id(topic_key)
             if existing_topic_id:
                 created_topics.append(f"✅ {topic_name} (già esistente)")
                 continue
@@ -76,7 +81,7 @@ async def cmd_create_topics(message: Message, db: Database, bot: Bot):
             )
 
             # Save topic ID
-            db.set_topic_id(topic_key, topic.message_thread_id)
+            await db.set_topic_id(topic_key, topic.message_thread_id)
             created_topics.append(f"✅ {topic_name}")
 
         except Exception as e:
@@ -87,13 +92,13 @@ async def cmd_create_topics(message: Message, db: Database, bot: Bot):
 
     await message.answer(result_text)
 
-async def cmd_gestisci_menu(message: Message, db: Database):
+async def cmd_gestisci_menu(message: Message, db: AsyncDatabase):
     """Manage menu - admin only"""
-    if not is_admin(message.from_user.id, db):
+    if not await is_admin(message.from_user.id, db):
         await message.answer("❌ Non hai i permessi per questo comando!")
         return
 
-    categories = db.get_categories()
+    categories = await db.get_category_ids()
 
     menu_text = "⚙️ **Gestione Menù**\n\n"
     menu_text += "Scegli cosa vuoi fare:"
@@ -103,13 +108,13 @@ async def cmd_gestisci_menu(message: Message, db: Database):
         reply_markup=AdminKeyboard.menu_management(categories)
     )
 
-async def cmd_aggiungi_piatto(message: Message, db: Database, state: FSMContext):
+async def cmd_aggiungi_piatto(message: Message, db: AsyncDatabase, state: FSMContext):
     """Add menu item - admin only"""
-    if not is_admin(message.from_user.id, db):
+    if not await is_admin(message.from_user.id, db):
         await message.answer("❌ Non hai i permessi per questo comando!")
         return
 
-    categories = db.get_categories()
+    categories = await db.get_category_ids()
 
     await message.answer(
         "📝 **Aggiungi Nuovo Piatto**\n\n"
@@ -117,9 +122,13 @@ async def cmd_aggiungi_piatto(message: Message, db: Database, state: FSMContext)
         reply_markup=AdminKeyboard.category_selection(categories)
     )
 
-async def handle_category_for_new_item(callback: CallbackQuery, state: FSMContext):
+async def handle_category_for_new_item(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase, category_id: int):
     """Handle category selection for new item"""
-    category = callback.data.split(":")[-1]
+    category = await db.get_category_by_id(category_id)
+    if category is None:
+        await callback.answer("❌ Categoria non trovata!", show_alert=True)
+        return
+
     await state.update_data(category=category)
     await state.set_state(AdminStates.waiting_for_item_name)
 
@@ -174,12 +183,12 @@ async def handle_item_price_input(message: Message, state: FSMContext):
             reply_markup=AdminKeyboard.cancel_add_item()
         )
 
-async def handle_item_description_input(message: Message, state: FSMContext, db: Database):
+async def handle_item_description_input(message: Message, state: FSMContext, db: AsyncDatabase):
     """Handle item description input and create item"""
     data = await state.get_data()
 
     # Add item to menu
-    db.add_menu_item(
+    await db.add_menu_item(
         category=data['category'],
         name=data['item_name'],
         price=data['item_price'],
@@ -197,17 +206,21 @@ async def handle_item_description_input(message: Message, state: FSMContext, db:
         f"Il piatto è ora disponibile nel menù!"
     )
 
-async def handle_view_category(callback: CallbackQuery, db: Database):
+async def handle_view_category(callback: CallbackQuery, db: AsyncDatabase, category_id: int):
     """Handle view category items"""
-    category = callback.data.split(":")[-1]
-    items = db.get_category_items(category)
+    category = await db.get_category_by_id(category_id)
+    if category is None:
+        await callback.answer("❌ Categoria non trovata!", show_alert=True)
+        return
+
+    items = await db.get_category_items(category)
 
     if not items:
         try:
             await callback.message.edit_text(
                 f"📋 **{category}**\n\n"
                 f"📋 Categoria vuota! Aggiungi il primo piatto:",
-                reply_markup=AdminKeyboard.category_items_management(category, [])
+                reply_markup=AdminKeyboard.category_items_management(category, category_id, {})
             )
         except TelegramBadRequest:
             pass
@@ -225,35 +238,33 @@ async def handle_view_category(callback: CallbackQuery, db: Database):
     try:
         await callback.message.edit_text(
             items_text,
-            reply_markup=AdminKeyboard.category_items_management(category, list(items.keys()))
+            reply_markup=AdminKeyboard.category_items_management(category, category_id, items)
         )
     except TelegramBadRequest:
         pass
 
     await callback.answer()
 
-async def handle_remove_item(callback: CallbackQuery, db: Database):
+async def handle_remove_item(callback: CallbackQuery, db: AsyncDatabase, item_id: int):
     """Handle remove menu item"""
-    data_parts = callback.data.split(":")
-    category = data_parts[1]
-    item_name = data_parts[2]
+    category, item_name = await db.get_menu_item_by_id(item_id)
+    category_id = (await db.get_category_ids())[category]
 
     # Remove item from database
-    db.remove_menu_item(category, item_name)
+    await db.remove_menu_item(category, item_name)
 
     await callback.answer(f"🗑️ {item_name} rimosso!", show_alert=True)
 
     # Refresh the category view
     fake_callback = type('CallbackQuery', (), {
-        'data': f'view_category:{category}',
         'message': callback.message,
         'answer': lambda: None
     })()
-    await handle_view_category(fake_callback, db)
+    await handle_view_category(fake_callback, db, category_id)
 
-async def handle_back_to_menu_management(callback: CallbackQuery, db: Database):
+async def handle_back_to_menu_management(callback: CallbackQuery, db: AsyncDatabase):
     """Handle back to menu management"""
-    categories = db.get_categories()
+    categories = await db.get_category_ids()
 
     menu_text = "⚙️ **Gestione Menù**\n\n"
     menu_text += "Scegli cosa vuoi fare:"
@@ -283,9 +294,9 @@ async def handle_cancel_add_item(callback: CallbackQuery, state: FSMContext):
 
     await callback.answer("❌ Operazione annullata")
 
-async def handle_manage_categories(callback: CallbackQuery, db: Database):
+async def handle_manage_categories(callback: CallbackQuery, db: AsyncDatabase):
     """Handle category management"""
-    categories = db.get_categories()
+    categories = await db.get_category_ids()
 
     try:
         await callback.message.edit_text(
@@ -298,12 +309,16 @@ async def handle_manage_categories(callback: CallbackQuery, db: Database):
 
     await callback.answer()
 
-async def handle_remove_category_confirm(callback: CallbackQuery, db: Database):
+async def handle_remove_category_confirm(callback: CallbackQuery, db: AsyncDatabase, category_id: int):
     """Handle remove category confirmation"""
-    category = callback.data.split(":")[-1]
+    category = await db.get_category_by_id(category_id)
+    if category is None:
+        await callback.answer("❌ Categoria non trovata!", show_alert=True)
+        return
+
 
     # Check if category has items
-    items = db.get_category_items(category)
+    items = await db.get_category_items(category)
     if items:
         await callback.answer(
             f"❌ Impossibile rimuovere '{category}': contiene {len(items)} piatti!",
@@ -314,16 +329,16 @@ async def handle_remove_category_confirm(callback: CallbackQuery, db: Database):
     # Remove category
     if category in db.menu_data.get("categories", {}):
         del db.menu_data["categories"][category]
-        db.save_menu()
+        await db.save_menu()
 
     await callback.answer(f"🗑️ Categoria '{category}' rimossa!", show_alert=True)
 
     # Refresh category management view
     await handle_manage_categories(callback, db)
 
-async def cmd_add_admin(message: Message, db: Database, state: FSMContext):
+async def cmd_add_admin(message: Message, db: AsyncDatabase, state: FSMContext):
     """Add new admin - super admin only"""
-    if not is_admin(message.from_user.id, db):
+    if not await is_admin(message.from_user.id, db):
         await message.answer("❌ Non hai i permessi per questo comando!")
         return
 
@@ -334,12 +349,12 @@ async def cmd_add_admin(message: Message, db: Database, state: FSMContext):
     )
     await state.set_state(AdminStates.waiting_for_admin_id)
 
-async def handle_admin_id_input(message: Message, state: FSMContext, db: Database):
+async def handle_admin_id_input(message: Message, state: FSMContext, db: AsyncDatabase):
     """Handle admin ID input"""
     try:
         admin_id = int(message.text.strip())
 
-        if db.add_admin(admin_id):
+        if await db.add_admin(admin_id):
             await message.answer(
                 f"✅ **Admin Aggiunto!**\n\n"
                 f"🆔 ID: `{admin_id}`\n"
@@ -358,9 +373,9 @@ async def handle_admin_id_input(message: Message, state: FSMContext, db: Databas
             reply_markup=AdminKeyboard.cancel_add_item()
         )
 
-async def cmd_add_category(message: Message, db: Database, state: FSMContext):
+async def cmd_add_category(message: Message, db: AsyncDatabase, state: FSMContext):
     """Add new category - admin only"""
-    if not is_admin(message.from_user.id, db):
+    if not await is_admin(message.from_user.id, db):
         await message.answer("❌ Non hai i permessi per questo comando!")
         return
 
@@ -371,12 +386,12 @@ async def cmd_add_category(message: Message, db: Database, state: FSMContext):
     )
     await state.set_state(AdminStates.waiting_for_category_name)
 
-async def handle_category_name_input(message: Message, state: FSMContext, db: Database):
+async def handle_category_name_input(message: Message, state: FSMContext, db: AsyncDatabase):
     """Handle category name input"""
     category_name = message.text.strip()
 
     # Add category to menu
-    if db.add_category(category_name):
+    if await db.add_category(category_name):
         await message.answer(
             f"✅ **Categoria Aggiunta!**\n\n"
             f"📂 Nome: {category_name}\n"
@@ -389,9 +404,9 @@ async def handle_category_name_input(message: Message, state: FSMContext, db: Da
 
     await state.clear()
 
-async def cmd_setup_sponsor_channel(message: Message, db: Database, state: FSMContext):
+async def cmd_setup_sponsor_channel(message: Message, db: AsyncDatabase, state: FSMContext):
     """Setup sponsor channel - admin only"""
-    if not is_admin(message.from_user.id, db):
+    if not await is_admin(message.from_user.id, db):
         await message.answer("❌ Non hai i permessi per questo comando!")
         return
 
@@ -401,14 +416,14 @@ async def cmd_setup_sponsor_channel(message: Message, db: Database, state: FSMCo
     )
     await state.set_state(AdminStates.waiting_for_sponsor_channel)
 
-async def handle_sponsor_channel_input(message: Message, state: FSMContext, db: Database):
+async def handle_sponsor_channel_input(message: Message, state: FSMContext, db: AsyncDatabase):
     """Handle sponsor channel input"""
     if message.forward_from_chat:
         # Forwarded message from channel
         channel_id = message.forward_from_chat.id
         channel_title = message.forward_from_chat.title
 
-        db.set_sponsor_channel_id(channel_id)
+        await db.set_sponsor_channel_id(channel_id)
         await message.answer(
             f"✅ **Canale Sponsor Configurato!**\n\n"
             f"📢 Canale: {channel_title}\n"
@@ -419,7 +434,7 @@ async def handle_sponsor_channel_input(message: Message, state: FSMContext, db:
         try:
             # Manual ID input
             channel_id = int(message.text.strip())
-            db.set_sponsor_channel_id(channel_id)
+            await db.set_sponsor_channel_id(channel_id)
             await message.answer(
                 f"✅ **Canale Sponsor Configurato!**\n\n"
                 f"🆔 ID: `{channel_id}`\n\n"
@@ -433,9 +448,9 @@ async def handle_sponsor_channel_input(message: Message, state: FSMContext, db:
 
     await state.clear()
 
-async def cmd_remove_category(message: Message, db: Database):
+async def cmd_remove_category(message: Message, db: AsyncDatabase):
     """Remove menu category command"""
-    if message.from_user.id not in ADMIN_IDS and not db.is_admin(message.from_user.id):
+    if message.from_user.id not in ADMIN_IDS and not await db.is_admin(message.from_user.id):
         await message.answer("❌ Non hai i permessi per usare questo comando!")
         return
 
@@ -445,7 +460,7 @@ async def cmd_remove_category(message: Message, db: Database):
         return
 
     category_name = args[1]
-    categories = db.get_categories()
+    categories = await db.get_categories()
 
     if category_name not in categories:
         await message.answer(f"❌ Categoria '{category_name}' non trovata!")
@@ -453,13 +468,13 @@ async def cmd_remove_category(message: Message, db: Database):
 
     # Remove category from menu data
     del db.menu_data["categories"][category_name]
-    db.save_menu()
+    await db.save_menu()
 
     await message.answer(f"✅ Categoria '{category_name}' rimossa con successo!")
 
-async def cmd_remove_item(message: Message, db: Database):
+async def cmd_remove_item(message: Message, db: AsyncDatabase):
     """Remove menu item command"""
-    if message.from_user.id not in ADMIN_IDS and not db.is_admin(message.from_user.id):
+    if message.from_user.id not in ADMIN_IDS and not await db.is_admin(message.from_user.id):
         await message.answer("❌ Non hai i permessi per usare questo comando!")
         return
 
@@ -471,21 +486,21 @@ async def cmd_remove_item(message: Message, db: Database):
     category = args[1]
     item_name = args[2]
 
-    if category not in db.get_categories():
+    if category not in await db.get_categories():
         await message.answer(f"❌ Categoria '{category}' non trovata!")
         return
 
-    items = db.get_category_items(category)
+    items = await db.get_category_items(category)
     if item_name not in items:
         await message.answer(f"❌ Item '{item_name}' non trovato nella categoria '{category}'!")
         return
 
-    db.remove_menu_item(category, item_name)
+    await db.remove_menu_item(category, item_name)
     await message.answer(f"✅ Item '{item_name}' rimosso dalla categoria '{category}'!")
 
-async def cmd_edit_item(message: Message, db: Database):
+async def cmd_edit_item(message: Message, db: AsyncDatabase):
     """Edit menu item command"""
-    if message.from_user.id not in ADMIN_IDS and not db.is_admin(message.from_user.id):
+    if message.from_user.id not in ADMIN_IDS and not await db.is_admin(message.from_user.id):
         await message.answer("❌ Non hai i permessi per usare questo comando!")
         return
 
@@ -503,27 +518,61 @@ async def cmd_edit_item(message: Message, db: Database):
         return
     new_description = args[4]
 
-    if category not in db.get_categories():
+    if category not in await db.get_categories():
         await message.answer(f"❌ Categoria '{category}' non trovata!")
         return
 
-    items = db.get_category_items(category)
+    items = await db.get_category_items(category)
     if item_name not in items:
         await message.answer(f"❌ Item '{item_name}' non trovato nella categoria '{category}'!")
         return
 
-    # Update item
-    db.menu_data["categories"][category][item_name] = {
-        "price": new_price,
-        "description": new_description
-    }
-    db.save_menu()
+    # Update item, keeping its menu id
+    items[item_name] = dict(items[item_name], price=new_price, description=new_description)
+    await db.save_menu()
 
     await message.answer(f"✅ Item '{item_name}' aggiornato!\n💰 Prezzo: {new_price}€\n📝 Descrizione: {new_description}")
 
-async def handle_add_category_selection(callback: CallbackQuery, state: FSMContext, db: Database):
+async def cmd_throttle_stats(message: Message, db: AsyncDatabase, throttling: ThrottlingMiddleware,
+                             outbound: OutboundLimiter, outbound_queue: OutboundQueue, outbox: Outbox):
+    """Show inbound throttling and outbound pacing counters - admin only"""
+    if not await is_admin(message.from_user.id, db):
+        await message.answer("❌ Non hai i permessi per questo comando!")
+        return
+
+    stats = throttling.get_stats()
+    text = "⏳ **Throttling**\n\n"
+    text += f"✅ Aggiornamenti accettati: {stats['allowed']}\n"
+    text += f"🚫 Scartati (limite utente): {stats['dropped_user']}\n"
+    text += f"🚫 Scartati (limite azione): {stats['dropped_action']}\n"
+    text += f"🪣 Bucket attivi: {stats['buckets']} (rimossi: {stats['evicted']})"
+    top = sorted(stats["dropped_by_action"].items(), key=lambda entry: entry[1], reverse=True)[:10]
+    if top:
+        text += "\n\n**Azioni più scartate:**\n"
+        text += "\n".join(f"• {action}: {count}" for action, count in top)
+
+    stats = outbound.get_stats()
+    text += "\n\n📤 **Invii**\n\n"
+    text += f"✅ Inviati: {stats['sent']} (ritentati dopo 429: {stats['retried']}, falliti: {stats['failed']})\n"
+    text += f"📥 In coda: {stats['queued']} in {stats['lanes']} chat (massimo: {stats['max_queued']})\n"
+    text += f"⏱️ Attesa media: {stats['wait_mean']:.2f}s (massima: {stats['wait_max']:.2f}s)"
+
+    stats = outbound_queue.get_stats()
+    text += f"\n\n📬 **Coda invii** ({stats['pending']} in attesa, {stats['workers']} worker)\n"
+    for name in ("interactive", "staff", "notification"):
+        entry = stats[name]
+        text += (f"• {name}: {entry['sent']} inviati, {entry['failed']} falliti, "
+                 f"attesa media {entry['wait_mean']:.2f}s (massima {entry['wait_max']:.2f}s)\n")
+
+    stats = await outbox.get_stats()
+    text += "\n📮 **Outbox**\n\n"
+    text += f"✅ Consegnati: {stats['delivered']} (ritentati: {stats['retried']}, falliti: {stats['failed']})\n"
+    text += f"📥 Da consegnare: {stats['pending']} (in invio: {stats['in_flight']}, ripresi all'avvio: {stats['resumed']})"
+
+    await message.answer(text)
+
+async def handle_add_category_selection(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase, category: str):
     """Handle category selection for adding item"""
-    category = callback.data.split(":")[-1]
     await state.update_data(selected_category=category)
     await state.set_state(AdminStates.waiting_for_item_name)
 
@@ -538,7 +587,7 @@ async def handle_add_category_selection(callback: CallbackQuery, state: FSMConte
 
     await callback.answer()
 
-async def handle_item_name_input(message: Message, state: FSMContext, db: Database):
+async def handle_item_name_input(message: Message, state: FSMContext, db: AsyncDatabase):
     """Handle item name input"""
     await state.update_data(item_name=message.text)
     await state.set_state(AdminStates.waiting_for_item_price)
@@ -549,7 +598,7 @@ async def handle_item_name_input(message: Message, state: FSMContext, db: Databa
         reply_markup=AdminKeyboard.cancel_add_item()
     )
 
-async def handle_item_price_input(message: Message, state: FSMContext, db: Database):
+async def handle_item_price_input(message: Message, state: FSMContext, db: AsyncDatabase):
     """Handle item price input"""
     try:
         price = int(message.text)
@@ -570,12 +619,12 @@ async def handle_item_price_input(message: Message, state: FSMContext, db: Datab
             reply_markup=AdminKeyboard.cancel_add_item()
         )
 
-async def handle_item_description_input(message: Message, state: FSMContext, db: Database):
+async def handle_item_description_input(message: Message, state: FSMContext, db: AsyncDatabase):
     """Handle item description input"""
     data = await state.get_data()
 
     # Add item to database
-    success = db.add_menu_item(
+    success = await db.add_menu_item(
         category=data['selected_category'],
         name=data['item_name'],
         price=data['item_price'],
@@ -598,39 +647,43 @@ async def handle_item_description_input(message: Message, state: FSMContext, db:
             "Il piatto potrebbe già esistere."
         )
 
-async def handle_remove_item(callback: CallbackQuery, db: Database):
+async def handle_remove_item(callback: CallbackQuery, db: AsyncDatabase, item_id: int):
     """Handle item removal"""
-    parts = callback.data.split(":")
-    category = parts[1]
-    item_name = parts[2]
+    entry = await db.get_menu_item_by_id(item_id)
+    if entry is None:
+        await callback.answer("❌ Piatto non trovato!", show_alert=True)
+        return
 
-    success = db.remove_menu_item(category, item_name)
+    category, item_name = entry
+    success = await db.remove_menu_item(category, item_name)
 
     if success:
         await callback.answer(f"✅ {item_name} rimosso!", show_alert=True)
 
         # Update the view
-        items = db.get_category_items(category)
-        item_names = list(items.keys()) if items else []
+        items = await db.get_category_items(category)
+        category_id = (await db.get_category_ids())[category]
 
         try:
             await callback.message.edit_text(
                 f"📋 **Gestione: {category}**\n\n"
                 f"Gestisci i piatti di questa categoria:",
-                reply_markup=AdminKeyboard.category_items_management(category, item_names)
+                reply_markup=AdminKeyboard.category_items_management(category, category_id, items)
             )
         except TelegramBadRequest:
             pass
     else:
         await callback.answer("❌ Errore nella rimozione!", show_alert=True)
 
-async def handle_edit_item_selection(callback: CallbackQuery, state: FSMContext, db: Database):
+async def handle_edit_item_selection(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase, item_id: int):
     """Handle edit item selection"""
-    parts = callback.data.split(":")
-    category = parts[1]
-    item_name = parts[2]
+    entry = await db.get_menu_item_by_id(item_id)
+    if entry is None:
+        await callback.answer("❌ Piatto non trovato!", show_alert=True)
+        return
 
-    items = db.get_category_items(category)
+    category, item_name = entry
+    items = await db.get_category_items(category)
     item_data = items.get(item_name, {})
 
     await state.update_data(
@@ -655,7 +708,7 @@ async def handle_edit_item_selection(callback: CallbackQuery, state: FSMContext,
 
     await callback.answer()
 
-async def handle_edit_price_input(message: Message, state: FSMContext, db: Database):
+async def handle_edit_price_input(message: Message, state: FSMContext, db: AsyncDatabase):
     """Handle edit price input"""
     try:
         new_price = int(message.text.strip())
@@ -676,7 +729,7 @@ async def handle_edit_price_input(message: Message, state: FSMContext, db: Datab
             reply_markup=AdminKeyboard.cancel_add_item()
         )
 
-async def handle_edit_description_input(message: Message, state: FSMContext, db: Database):
+async def handle_edit_description_input(message: Message, state: FSMContext, db: AsyncDatabase):
     """Handle edit description input"""
     data = await state.get_data()
     new_description = message.text.strip()
@@ -692,12 +745,10 @@ async def handle_edit_description_input(message: Message, state: FSMContext, db:
         await state.clear()
         return
 
-    # Update the item
-    db.menu_data["categories"][data['edit_category']][data['edit_item_name']] = {
-        "price": data['new_price'],
-        "description": new_description
-    }
-    db.save_menu()
+    # Update the item, keeping its menu id
+    items = db.menu_data["categories"][data['edit_category']]
+    items[data['edit_item_name']] = dict(items[data['edit_item_name']], price=data['new_price'], description=new_description)
+    await db.save_menu()
 
     await state.clear()
 
@@ -709,9 +760,13 @@ async def handle_edit_description_input(message: Message, state: FSMContext, db:
         f"📄 **Nuova descrizione:** `{new_description}`"
     )
 
-async def handle_add_to_specific_category(callback: CallbackQuery, state: FSMContext, db: Database):
+async def handle_add_to_specific_category(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase, category_id: int):
     """Handle adding item to specific category"""
-    category = callback.data.split(":")[-1]
+    category = await db.get_category_by_id(category_id)
+    if category is None:
+        await callback.answer("❌ Categoria non trovata!", show_alert=True)
+        return
+
     await state.update_data(selected_category=category)
     await state.set_state(AdminStates.waiting_for_item_name)
 
@@ -726,17 +781,21 @@ async def handle_add_to_specific_category(callback: CallbackQuery, state: FSMCon
 
     await callback.answer()
 
-async def handle_remove_category(callback: CallbackQuery, db: Database):
+async def handle_remove_category(callback: CallbackQuery, db: AsyncDatabase, category_id: int):
     """Handle category removal"""
-    category = callback.data.split(":")[-1]
+    category = await db.get_category_by_id(category_id)
+    if category is None:
+        await callback.answer("❌ Categoria non trovata!", show_alert=True)
+        return
 
-    success = db.remove_category(category)
+
+    success = await db.remove_category(category)
 
     if success:
         await callback.answer(f"✅ Categoria {category} rimossa!", show_alert=True)
 
         # Update view
-        categories = db.get_categories()
+        categories = await db.get_category_ids()
         try:
             await callback.message.edit_text(
                 "📂 **Gestione Categorie**\n\n"
@@ -748,7 +807,7 @@ async def handle_remove_category(callback: CallbackQuery, db: Database):
     else:
         await callback.answer("❌ Errore nella rimozione!", show_alert=True)
 
-async def handle_add_new_category(callback: CallbackQuery, state: FSMContext, db: Database):
+async def handle_add_new_category(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Handle add new category"""
     await state.set_state(AdminStates.waiting_for_new_category)
 
@@ -763,11 +822,11 @@ async def handle_add_new_category(callback: CallbackQuery, state: FSMContext, db
 
     await callback.answer()
 
-async def handle_new_category_input(message: Message, state: FSMContext, db: Database):
+async def handle_new_category_input(message: Message, state: FSMContext, db: AsyncDatabase):
     """Handle new category name input"""
     category_name = message.text.strip()
 
-    success = db.add_category(category_name)
+    success = await db.add_category(category_name)
     await state.clear()
 
     if success:
@@ -781,8 +840,9 @@ async def handle_new_category_input(message: Message, state: FSMContext, db: Dat
             f"La categoria `{category_name}` già esiste."
         )
 
-def register_handlers(dp, db: Database, bot: Bot):
+def register_handlers(dp, db: AsyncDatabase, bot: Bot):
     """Register admin handlers"""
+    callbacks = callback_router(dp)
 
     @dp.message(Command("setup_staff"))
     async def setup_staff_handler(message: Message):
@@ -824,9 +884,14 @@ def register_handlers(dp, db: Database, bot: Bot):
     async def edit_item_handler(message: Message):
         await cmd_edit_item(message, db)
 
-    @dp.callback_query(lambda c: c.data.startswith("add_category:"))
-    async def category_for_new_item_handler(callback: CallbackQuery, state: FSMContext):
-        await handle_category_for_new_item(callback, state)
+    @dp.message(Command("throttle_stats"))
+    async def throttle_stats_handler(message: Message, throttling: ThrottlingMiddleware, outbound: OutboundLimiter,
+                                     outbound_queue: OutboundQueue, outbox: Outbox):
+        await cmd_throttle_stats(message, db, throttling, outbound, outbound_queue, outbox)
+
+    @callbacks.route("add_category")
+    async def category_for_new_item_handler(callback: CallbackQuery, category_id: int, state: FSMContext):
+        await handle_category_for_new_item(callback, state, db, category_id)
 
     @dp.message(AdminStates.waiting_for_item_name)
     async def item_name_handler(message: Message, state: FSMContext):
@@ -852,42 +917,42 @@ def register_handlers(dp, db: Database, bot: Bot):
     async def sponsor_channel_handler(message: Message, state: FSMContext):
         await handle_sponsor_channel_input(message, state, db)
 
-    @dp.callback_query(lambda c: c.data.startswith("view_category:"))
-    async def view_category_handler(callback: CallbackQuery):
-        await handle_view_category(callback, db)
+    @callbacks.route("view_category")
+    async def view_category_handler(callback: CallbackQuery, category_id: int):
+        await handle_view_category(callback, db, category_id)
 
-    @dp.callback_query(lambda c: c.data.startswith("remove_item:"))
-    async def remove_item_handler(callback: CallbackQuery):
-        await handle_remove_item(callback, db)
+    @callbacks.route("remove_item")
+    async def remove_item_handler(callback: CallbackQuery, item_id: int):
+        await handle_remove_item(callback, db, item_id)
 
-    @dp.callback_query(lambda c: c.data == "back_to_menu_management")
+    @callbacks.route("back_to_menu_management")
     async def back_to_menu_management_handler(callback: CallbackQuery):
         await handle_back_to_menu_management(callback, db)
 
-    @dp.callback_query(lambda c: c.data == "cancel_add_item")
+    @callbacks.route("cancel_add_item")
     async def cancel_add_item_handler(callback: CallbackQuery, state: FSMContext):
         await handle_cancel_add_item(callback, state)
 
-    @dp.callback_query(lambda c: c.data == "add_new_category")
+    @callbacks.route("add_new_category")
     async def add_new_category_handler(callback: CallbackQuery, state: FSMContext):
         await cmd_add_category(callback.message, db, state)
         await callback.answer()
 
-    @dp.callback_query(lambda c: c.data == "manage_categories")
+    @callbacks.route("manage_categories")
     async def manage_categories_handler(callback: CallbackQuery):
         await handle_manage_categories(callback, db)
 
-    @dp.callback_query(lambda c: c.data.startswith("remove_category:"))
-    async def remove_category_handler(callback: CallbackQuery):
-        await handle_remove_category_confirm(callback, db)
+    @callbacks.route("remove_category")
+    async def remove_category_handler(callback: CallbackQuery, category_id: int):
+        await handle_remove_category_confirm(callback, db, category_id)
 
-    @dp.callback_query(lambda c: c.data.startswith("edit_item:"))
-    async def edit_item_handler(callback: CallbackQuery, state: FSMContext):
-        await handle_edit_item_selection(callback, state, db)
+    @callbacks.route("edit_item")
+    async def edit_item_handler(callback: CallbackQuery, item_id: int, state: FSMContext):
+        await handle_edit_item_selection(callback, state, db, item_id)
 
-    @dp.callback_query(lambda c: c.data.startswith("add_to_category:"))
-    async def add_to_category_handler(callback: CallbackQuery, state: FSMContext):
-        await handle_add_to_specific_category(callback, state, db)
+    @callbacks.route("add_to_category")
+    async def add_to_category_handler(callback: CallbackQuery, category_id: int, state: FSMContext):
+        await handle_add_to_specific_category(callback, state, db, category_id)
 
     @dp.message(AdminStates.waiting_for_edit_price)
     async def edit_price_handler(message: Message, state: FSMContext):
@@ -897,7 +962,7 @@ def register_handlers(dp, db: Database, bot: Bot):
     async def edit_description_handler(message: Message, state: FSMContext):
         await handle_edit_description_input(message, state, db)
 
-    @dp.callback_query(lambda c: c.data == "add_new_item")
+    @callbacks.route("add_new_item")
     async def add_item_handler(callback: CallbackQuery, state: FSMContext):
         await cmd_aggiungi_piatto(callback.message, db, state)
         await callback.answer()
\ No newline at end of file
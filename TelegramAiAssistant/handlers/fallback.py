@@ -4,11 +4,11 @@ from aiogram.filters import Command
 
 from config import WELCOME_MESSAGE, EMOJI
 from utils.keyboards import MenuKeyboard
-from database import Database
+from storage.async_database import AsyncDatabase
 
 router = Router()
 
-async def handle_unknown_message(message: Message, db: Database):
+async def handle_unknown_message(message: Message, db: AsyncDatabase):
     """Handle any unrecognized message"""
     response_text = f"🤖 Non ho capito il tuo messaggio!\n\n"
     response_text += f"🔧 **Comandi disponibili:**\n"
@@ -23,14 +23,10 @@ async def handle_unknown_message(message: Message, db: Database):
         reply_markup=MenuKeyboard.help_menu()
     )
 
-def register_handlers(dp, db: Database, bot: Bot):
+def register_handlers(dp, db: AsyncDatabase, bot: Bot):
     """Register fallback handlers - should be registered LAST"""
 
     @dp.message()
     async def fallback_handler(message: Message):
-        # Check if user is banned
-        if db.is_user_banned(message.from_user.id):
-            await message.answer("🚫 Sei stato bannato dal bot!")
-            return
-
+        # Banned users are stopped earlier by middlewares.ban.BanMiddleware
         await handle_unknown_message(message, db)
\ No newline at end of file
@@ -5,27 +5,28 @@ from aiogram.exceptions import TelegramBadRequest
 
 from config import WELCOME_MESSAGE, EMOJI
 from utils.keyboards import MenuKeyboard
-from database import Database
+from utils.callback_router import callback_router
+from storage.async_database import AsyncDatabase
 
 router = Router()
 
-async def cmd_start(message: Message, db: Database):
+async def cmd_start(message: Message, db: AsyncDatabase):
     """Handle /start command"""
     await message.answer(
         WELCOME_MESSAGE,
         reply_markup=MenuKeyboard.home_menu()
     )
 
-async def cmd_menu(message: Message, db: Database):
+async def cmd_menu(message: Message, db: AsyncDatabase):
     """Handle /menu command"""
-    menu_data = db.get_menu()
-    categories = db.get_categories()
+    menu_data = await db.get_menu()
+    categories = await db.get_category_ids()
     
     if not categories:
         await message.answer("❌ Il menù non è ancora disponibile.")
         return
     
-    cart_count = db.get_cart_count(message.from_user.id)
+    cart_count = await db.get_cart_count(message.from_user.id)
     cart_text = f"\n\n🛒 Carrello: {cart_count} elementi" if cart_count > 0 else ""
     
     await message.answer(
@@ -34,64 +35,66 @@ async def cmd_menu(message: Message, db: Database):
         reply_markup=MenuKeyboard.categories(categories, cart_count > 0)
     )
 
-async def handle_category_selection(callback: CallbackQuery, db: Database):
+async def handle_category_selection(callback: CallbackQuery, db: AsyncDatabase, category_id: int):
     """Handle category selection"""
-    category = callback.data.split(":")[-1]
-    items = db.get_category_items(category)
+    category = await db.get_category_by_id(category_id)
+    if category is None:
+        await callback.answer("❌ Categoria non trovata!", show_alert=True)
+        return
+    
+    items = await db.get_category_items(category)
     
     if not items:
         await callback.answer("❌ Categoria vuota!", show_alert=True)
         return
     
-    cart_count = db.get_cart_count(callback.from_user.id)
+    cart_count = await db.get_cart_count(callback.from_user.id)
     cart_text = f"\n\n🛒 Carrello: {cart_count} elementi" if cart_count > 0 else ""
     
     try:
         await callback.message.edit_text(
             f"📋 **{category}**\n\n"
             f"Scegli un piatto:{cart_text}",
-            reply_markup=MenuKeyboard.items(category, items, cart_count > 0)
+            reply_markup=MenuKeyboard.items(items, cart_count > 0)
         )
     except TelegramBadRequest:
         pass
     
     await callback.answer()
 
-async def handle_item_selection(callback: CallbackQuery, db: Database):
+async def handle_item_selection(callback: CallbackQuery, db: AsyncDatabase, item_id: int):
     """Handle item selection - add to cart"""
-    data_parts = callback.data.split(":")
-    category = data_parts[1]
-    item_name = data_parts[2]
-    
-    items = db.get_category_items(category)
-    if item_name not in items:
+    entry = await db.get_menu_item_by_id(item_id)
+    if entry is None:
         await callback.answer("❌ Piatto non trovato!", show_alert=True)
         return
     
+    category, item_name = entry
+    items = await db.get_category_items(category)
     item_data = items[item_name]
     item_price = item_data["price"]
     
     # Add to cart
-    db.add_to_cart(callback.from_user.id, item_name, item_price, category)
+    await db.add_to_cart(callback.from_user.id, item_name, item_price, category)
     
     await callback.answer(f"✅ {item_name} aggiunto al carrello!", show_alert=True)
     
     # Update the message to show new cart count
-    cart_count = db.get_cart_count(callback.from_user.id)
+    cart_count = await db.get_cart_count(callback.from_user.id)
     cart_text = f"\n\n🛒 Carrello: {cart_count} elementi" if cart_count > 0 else ""
     
     try:
         await callback.message.edit_text(
             f"📋 **{category}**\n\n"
             f"Scegli un piatto:{cart_text}",
-            reply_markup=MenuKeyboard.items(category, items, cart_count > 0)
+            reply_markup=MenuKeyboard.items(items, cart_count > 0)
         )
     except TelegramBadRequest:
         pass
 
-async def handle_view_cart(callback: CallbackQuery, db: Database):
+async def handle_view_cart(callback: CallbackQuery, db: AsyncDatabase):
     """Handle view cart action"""
-    cart = db.get_user_cart(callback.from_user.id)
+    cart = await db.get_user_cart(callback.from_user.id)
     
     if not cart:
         await callback.answer("🛒 Il tuo carrello è vuoto!", show_alert=True)
@@ -117,23 +120,23 @@ async def handle_view_cart(callback: CallbackQuery, db: Database):
     
     await callback.answer()
 
-async def handle_clear_cart(callback: CallbackQuery, db: Database):
+async def handle_clear_cart(callback: CallbackQuery, db: AsyncDatabase):
     """Handle clear cart action"""
-    db.clear_cart(callback.from_user.id)
+    await db.clear_cart(callback.from_user.id)
     await callback.answer("🗑️ Carrello svuotato!", show_alert=True)
     
     # Go back to main menu
     await cmd_menu(callback.message, db)
 
-async def handle_back_to_menu(callback: CallbackQuery, db: Database):
+async def handle_back_to_menu(callback: CallbackQuery, db: AsyncDatabase):
     """Handle back to menu action"""
     await cmd_menu(callback.message, db)
     await callback.answer()
 
-async def handle_back_to_categories(callback: CallbackQuery, db: Database):
+async def handle_back_to_categories(callback: CallbackQuery, db: AsyncDatabase):
     """Handle back to categories action"""
-    categories = db.get_categories()
-    cart_count = db.get_cart_count(callback.from_user.id)
+    categories = await db.get_category_ids()
+    cart_count = await db.get_cart_count(callback.from_user.id)
     cart_text = f"\n\n🛒 Carrello: {cart_count} elementi" if cart_count > 0 else ""
     
     try:
@@ -147,7 +150,7 @@ async def handle_back_to_categories(callback: CallbackQuery, db: Database):
     
     await callback.answer()
 
-async def handle_back_to_home(callback: CallbackQuery, db: Database):
+async def handle_back_to_home(callback: CallbackQuery, db: AsyncDatabase):
     """Handle back to home"""
     try:
         await callback.message.edit_text(
@@ -161,7 +164,7 @@ async def handle_back_to_home(callback: CallbackQuery, db: Database):
     
     await callback.answer()
 
-async def handle_help(callback: CallbackQuery, db: Database):
+async def handle_help(callback: CallbackQuery, db: AsyncDatabase):
     """Handle help"""
     help_text = """ℹ️ **Aiuto - The Krusty Krab**
 
@@ -189,8 +192,9 @@ async def handle_help(callback: CallbackQuery, db: Database):
     
     await callback.answer()
 
-def register_handlers(dp, db: Database, bot: Bot):
+def register_handlers(dp, db: AsyncDatabase, bot: Bot):
     """Register menu handlers"""
+    callbacks = callback_router(dp)
     
     @dp.message(Command("start"))
     async def start_handler(message: Message):
@@ -200,39 +204,39 @@ def register_handlers(dp, db: Database, bot: Bot):
     async def menu_handler(message: Message):
         await cmd_menu(message, db)
     
-    @dp.callback_query(lambda c: c.data == "main_menu")
+    @callbacks.route("main_menu")
     async def main_menu_handler(callback: CallbackQuery):
         await cmd_menu(callback.message, db)
         await callback.answer()
     
-    @dp.callback_query(lambda c: c.data.startswith("category:"))
-    async def category_handler(callback: CallbackQuery):
-        await handle_category_selection(callback, db)
+    @callbacks.route("category")
+    async def category_handler(callback: CallbackQuery, category_id: int):
+        await handle_category_selection(callback, db, category_id)
     
-    @dp.callback_query(lambda c: c.data.startswith("item:"))
-    async def item_handler(callback: CallbackQuery):
-        await handle_item_selection(callback, db)
+    @callbacks.route("item")
+    async def item_handler(callback: CallbackQuery, item_id: int):
+        await handle_item_selection(callback, db, item_id)
     
-    @dp.callback_query(lambda c: c.data == "view_cart")
+    @callbacks.route("view_cart")
     async def cart_handler(callback: CallbackQuery):
         await handle_view_cart(callback, db)
     
-    @dp.callback_query(lambda c: c.data == "clear_cart")
+    @callbacks.route("clear_cart")
     async def clear_cart_handler(callback: CallbackQuery):
         await handle_clear_cart(callback, db)
     
-    @dp.callback_query(lambda c: c.data == "back_to_menu")
+    @callbacks.route("back_to_menu")
     async def back_menu_handler(callback: CallbackQuery):
         await handle_back_to_menu(callback, db)
     
-    @dp.callback_query(lambda c: c.data == "back_to_categories")
+    @callbacks.route("back_to_categories")
     async def back_categories_handler(callback: CallbackQuery):
         await handle_back_to_categories(callback, db)
     
-    @dp.callback_query(lambda c: c.data == "back_to_home")
+    @callbacks.route("back_to_home")
     async def back_home_handler(callback: CallbackQuery):
         await handle_back_to_home(callback, db)
     
-    @dp.callback_query(lambda c: c.data == "help")
+    @callbacks.route("help")
     async def help_handler(callback: CallbackQuery):
         await handle_help(callback, db)
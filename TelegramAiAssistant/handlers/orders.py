@@ -3,25 +3,42 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
+from aiogram.methods import ForwardMessage, SendMessage
 
-from config import EMOJI, ADMIN_IDS
+from config import EMOJI, ADMIN_IDS, MAX_ORDERS_PER_USER
 from utils.keyboards import OrderKeyboard
-from database import Database
+from utils.callback_router import callback_router
+from utils.outbound_queue import OutboundQueue, INTERACTIVE, STAFF, NOTIFICATION, outbound_queue
+from utils.outbox import Outbox, outbox
+from storage.async_database import AsyncDatabase
 from handlers.states import OrderStates
 
 router = Router()
 
-async def handle_checkout(callback: CallbackQuery, db: Database, bot: Bot):
+# Order statuses counted against MAX_ORDERS_PER_USER
+OPEN_ORDER_STATUSES = ("pending", "preparing", "ready")
+
+async def handle_checkout(callback: CallbackQuery, db: AsyncDatabase, bot: Bot):
     """Handle checkout process"""
-    cart = db.get_user_cart(callback.from_user.id)
+    cart = await db.get_user_cart(callback.from_user.id)
     
     if not cart:
         await callback.answer("🛒 Il tuo carrello è vuoto!", show_alert=True)
         return
     
+    # Limit the orders a user can have open at once
+    user_orders = await db.get_orders_by_user(callback.from_user.id)
+    open_orders = [order for order in user_orders if order["status"] in OPEN_ORDER_STATUSES]
+    if len(open_orders) >= MAX_ORDERS_PER_USER:
+        await callback.answer(
+            f"⚠️ Hai già {len(open_orders)} ordini in corso! Attendi che vengano completati.",
+            show_alert=True
+        )
+        return
+    
     # Check if user has minecraft name
-    minecraft_name = db.get_user_minecraft_name(callback.from_user.id)
-    if not minecraft_name:
+    profile = await db.get_user_profile(callback.from_user.id)
+    if not profile or not profile.minecraft_name:
         try:
             await callback.message.edit_text(
                 "⚠️ **`Nome Minecraft Richiesto`**\n\n"
@@ -35,7 +52,7 @@ async def handle_checkout(callback: CallbackQuery, db: Database, bot: Bot):
         await callback.answer()
         return
     
-    total = db.get_cart_total(callback.from_user.id)
+    total = await db.get_cart_total(callback.from_user.id)
     
     # Show order confirmation
     order_text = "📋 **Conferma il tuo ordine:**\n\n"
@@ -58,7 +75,7 @@ async def handle_checkout(callback: CallbackQuery, db: Database, bot: Bot):
     
     await callback.answer()
 
-async def handle_confirm_order(callback: CallbackQuery, db: Database, state: FSMContext):
+async def handle_confirm_order(callback: CallbackQuery, db: AsyncDatabase, state: FSMContext):
     """Handle order confirmation - request payment photo"""
     try:
         await callback.message.edit_text(
@@ -72,7 +89,8 @@ async def handle_confirm_order(callback: CallbackQuery, db: Database, state: FSM
     await callback.answer()
     await state.set_state(OrderStates.waiting_for_payment_photo)
 
-async def handle_order_payment_photo(message: Message, state: FSMContext, db: Database, bot: Bot):
+async def handle_order_payment_photo(message: Message, state: FSMContext, db: AsyncDatabase, bot: Bot,
+                                     sender: OutboundQueue, outbox: Outbox):
     """Handle payment photo for order"""
     if not message.photo:
         await message.answer(
@@ -82,35 +100,16 @@ async def handle_order_payment_photo(message: Message, state: FSMContext, db: Da
         return
     
     username = message.from_user.username or message.from_user.full_name
+    staff_group_id = await db.get_staff_group_id()
+    orders_topic_id = await db.get_topic_id("orders")
     
-    # Create order from cart
-    order_id = db.create_order_from_cart(message.from_user.id, username)
-    
-    if not order_id:
-        await message.answer("❌ Errore nella creazione dell'ordine!")
-        await state.clear()
-        return
-    
-    order = db.get_order(order_id)
-    await state.clear()
-    
-    # Send confirmation to user
-    await message.answer(
-        f"✅ **Ordine confermato!**\n\n"
-        f"🆔 Numero ordine: `{order_id}`\n"
-        f"⏳ Stato: In attesa\n"
-        f"💰 Totale: {order['total_price']}€\n\n"
-        f"📸 Foto di pagamento ricevuta!\n\n"
-        f"Ti aggiorneremo sullo stato del tuo ordine!",
-        reply_markup=OrderKeyboard.back_to_menu()
-    )
-    
-    # Send order to staff group if configured
-    staff_group_id = db.get_staff_group_id()
-    orders_topic_id = db.get_topic_id("orders")
-    
-    if staff_group_id:
-        try:
+    # Create order from cart, with its post to the staff group if configured:
+    # stored together, the post is sent even if the bot stops right after
+    async with db.batch():
+        order_id = await db.create_order_from_cart(message.from_user.id, username)
+        order = await db.get_order(order_id) if order_id else None
+        
+        if order and staff_group_id:
             # Create order message for staff
             staff_text = f"📦 **Nuovo Ordine**\n\n"
             staff_text += f"👤 Cliente: @{username}\n"
@@ -124,142 +123,149 @@ async def handle_order_payment_photo(message: Message, state: FSMContext, db: Da
             staff_text += f"📸 **Foto pagamento ricevuta**\n"
             staff_text += f"⏳ **Stato:** In attesa"
             
-            # Send text message to staff group
-            if orders_topic_id:
-                staff_message = await bot.send_message(
+            # Text message in the orders topic if there is one, then the payment photo
+            # as separate message; the text message's ID is saved once sent
+            await outbox.add(
+                STAFF,
+                SendMessage(
                     chat_id=staff_group_id,
                     message_thread_id=orders_topic_id,
                     text=staff_text,
                     reply_markup=OrderKeyboard.staff_order_actions(order_id)
-                )
-                
-                # Send the payment photo as separate message
-                await bot.forward_message(
+                ),
+                ForwardMessage(
                     chat_id=staff_group_id,
                     from_chat_id=message.chat.id,
                     message_id=message.message_id,
                     message_thread_id=orders_topic_id
-                )
-            else:
-                staff_message = await bot.send_message(
-                    chat_id=staff_group_id,
-                    text=staff_text,
-                    reply_markup=OrderKeyboard.staff_order_actions(order_id)
-                )
-                
-                # Send the payment photo as separate message
-                await bot.forward_message(
-                    chat_id=staff_group_id,
-                    from_chat_id=message.chat.id,
-                    message_id=message.message_id
-                )
-            
-            # Save staff message ID
-            db.set_order_staff_message(order_id, staff_message.message_id)
-            
-        except Exception as e:
-            print(f"Error sending order to staff group: {e}")
+                ),
+                after=["set_order_staff_message", order_id]
+            )
+    
+    if not order_id:
+        await message.answer("❌ Errore nella creazione dell'ordine!")
+        await state.clear()
+        return
+    
+    await state.clear()
+    
+    # Send confirmation to user
+    async def confirm():
+        await message.answer(
+            f"✅ **Ordine confermato!**\n\n"
+            f"🆔 Numero ordine: `{order_id}`\n"
+            f"⏳ Stato: In attesa\n"
+            f"💰 Totale: {order['total_price']}€\n\n"
+            f"📸 Foto di pagamento ricevuta!\n\n"
+            f"Ti aggiorneremo sullo stato del tuo ordine!",
+            reply_markup=OrderKeyboard.back_to_menu()
+        )
+
+    await sender.submit(INTERACTIVE, confirm, chat_id=message.chat.id, name=f"confirm order {order_id}")
     
     # No callback answer needed for message handlers
 
-async def handle_cancel_order(callback: CallbackQuery, db: Database):
+async def handle_cancel_order(callback: CallbackQuery, db: AsyncDatabase):
     """Handle order cancellation"""
     # Go back to cart view
     from handlers.menu import handle_view_cart
     await handle_view_cart(callback, db)
 
-async def handle_staff_order_action(callback: CallbackQuery, db: Database, bot: Bot):
+async def handle_staff_order_action(callback: CallbackQuery, db: AsyncDatabase, bot: Bot, sender: OutboundQueue,
+                                    outbox: Outbox, action: str, order_id: str):
     """Handle staff order actions"""
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("❌ Non hai i permessi per questa azione!", show_alert=True)
         return
     
-    action_data = callback.data.split(":")
-    action = action_data[1]
-    order_id = action_data[2]
-    
-    order = db.get_order(order_id)
+    order = await db.get_order(order_id)
     if not order:
         await callback.answer("❌ Ordine non trovato!", show_alert=True)
         return
     
+    if order["status"] == "expired":
+        await callback.answer("⏰ Ordine scaduto!", show_alert=True)
+        return
+    
     if action == "accept":
-        db.update_order_status(order_id, "preparing", callback.from_user.id)
+        status = "preparing"
         status_text = "🔥 In preparazione"
         user_message = f"🔥 Il tuo ordine `{order_id}` è ora in preparazione!"
         
     elif action == "ready":
-        db.update_order_status(order_id, "ready", callback.from_user.id)
+        status = "ready"
         status_text = "✅ Pronto"
         user_message = f"✅ Il tuo ordine `{order_id}` è pronto per il ritiro!"
         
     elif action == "complete":
-        db.update_order_status(order_id, "completed", callback.from_user.id)
+        status = "completed"
         status_text = "🎉 Completato"
         user_message = f"🎉 Il tuo ordine `{order_id}` è stato completato! Grazie!"
         
     elif action == "reject":
-        db.update_order_status(order_id, "rejected", callback.from_user.id)
+        status = "rejected"
         status_text = "❌ Rifiutato"
         user_message = f"❌ Il tuo ordine `{order_id}` è stato rifiutato. Ci scusiamo per l'inconveniente."
     
+    # Notification to the user, stored with the new status
+    async with db.batch():
+        await db.update_order_status(order_id, status, callback.from_user.id)
+        await outbox.add(NOTIFICATION, SendMessage(chat_id=order["user_id"], text=user_message))
+    
     # Update staff message
-    try:
-        staff_text = f"📦 **Ordine Aggiornato**\n\n"
-        staff_text += f"👤 Cliente: @{order['username']}\n"
-        staff_text += f"🆔 ID: `{order_id}`\n\n"
-        
-        for item in order["items"]:
-            item_total = item["item_price"] * item["quantity"]
-            staff_text += f"• {item['item_name']} x{item['quantity']} - {item_total}€\n"
-        
-        staff_text += f"\n💰 **Totale: {order['total_price']}€**\n"
-        staff_text += f"📊 **Stato:** {status_text}"
-        
-        # Update keyboard based on status
-        if order["status"] in ["completed", "rejected"]:
-            reply_markup = None
-        else:
-            reply_markup = OrderKeyboard.staff_order_actions(order_id)
-        
-        await callback.message.edit_text(
-            staff_text,
-            reply_markup=reply_markup
-        )
-        
-    except TelegramBadRequest:
-        pass
+    staff_text = f"📦 **Ordine Aggiornato**\n\n"
+    staff_text += f"👤 Cliente: @{order['username']}\n"
+    staff_text += f"🆔 ID: `{order_id}`\n\n"
     
-    # Send notification to user
-    try:
-        await bot.send_message(
-            chat_id=order["user_id"],
-            text=user_message
-        )
-    except Exception as e:
-        print(f"Error sending notification to user: {e}")
+    for item in order["items"]:
+        item_total = item["item_price"] * item["quantity"]
+        staff_text += f"• {item['item_name']} x{item['quantity']} - {item_total}€\n"
+    
+    staff_text += f"\n💰 **Totale: {order['total_price']}€**\n"
+    staff_text += f"📊 **Stato:** {status_text}"
+    
+    # Update keyboard based on status
+    if action in ["complete", "reject"]:
+        reply_markup = None
+    else:
+        reply_markup = OrderKeyboard.staff_order_actions(order_id)
+
+    async def update_staff_message():
+        try:
+            await callback.message.edit_text(
+                staff_text,
+                reply_markup=reply_markup
+            )
+        except TelegramBadRequest:
+            pass
+
+    await sender.submit(INTERACTIVE, update_staff_message, chat_id=callback.message.chat.id,
+                        name=f"staff message of order {order_id}")
     
     await callback.answer(f"✅ Ordine {action}!")
 
-def register_handlers(dp, db: Database, bot: Bot):
+def register_handlers(dp, db: AsyncDatabase, bot: Bot):
     """Register order handlers"""
+    callbacks = callback_router(dp)
+    sender = outbound_queue(dp)
+    messages = outbox(dp, db, bot)
     
-    @dp.callback_query(lambda c: c.data == "checkout")
+    @callbacks.route("checkout")
     async def checkout_handler(callback: CallbackQuery):
         await handle_checkout(callback, db, bot)
     
-    @dp.callback_query(lambda c: c.data == "confirm_order")
+    @callbacks.route("confirm_order")
     async def confirm_order_handler(callback: CallbackQuery, state: FSMContext):
         await handle_confirm_order(callback, db, state)
     
     @dp.message(OrderStates.waiting_for_payment_photo)
     async def payment_photo_handler(message: Message, state: FSMContext):
-        await handle_order_payment_photo(message, state, db, bot)
+        await handle_order_payment_photo(message, state, db, bot, sender, messages)
     
-    @dp.callback_query(lambda c: c.data == "cancel_order")
+    @callbacks.route("cancel_order")
     async def cancel_order_handler(callback: CallbackQuery):
         await handle_cancel_order(callback, db)
     
-    @dp.callback_query(lambda c: c.data.startswith("order_action:"))
-    async def staff_order_handler(callback: CallbackQuery):
-        await handle_staff_order_action(callback, db, bot)
+    @callbacks.route("order_action")
+    async def staff_order_handler(callback: CallbackQuery, action: str, order_id: str):
+        await handle_staff_order_action(callback, db, bot, sender, messages, action, order_id)
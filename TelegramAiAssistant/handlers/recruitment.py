@@ -3,16 +3,20 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import SendMessage
 
 from config import EMOJI, ADMIN_IDS
 from utils.keyboards import RecruitmentKeyboard
+from utils.callback_router import callback_router
+from utils.outbound_queue import OutboundQueue, INTERACTIVE, STAFF, NOTIFICATION, outbound_queue
+from utils.outbox import Outbox, outbox
 from handlers.states import RecruitmentStates
-from database import Database
+from storage.async_database import AsyncDatabase
 from datetime import datetime
 
 router = Router()
 
-async def cmd_curriculum(message: Message, db: Database, state: FSMContext):
+async def cmd_curriculum(message: Message, db: AsyncDatabase, state: FSMContext):
     """Handle /curriculum command"""
     curriculum_text = f"📝 **Candidatura Lavorativa - {message.from_user.full_name}**\n\n"
     curriculum_text += "🎯 **Posizioni Disponibili:**\n"
@@ -32,16 +36,27 @@ async def cmd_curriculum(message: Message, db: Database, state: FSMContext):
         reply_markup=RecruitmentKeyboard.start_application()
     )
 
-async def handle_start_application(callback: CallbackQuery, state: FSMContext):
+async def handle_start_application(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase):
     """Start the application process"""
-    await state.set_state(RecruitmentStates.waiting_for_minecraft_name)
-
-    try:
-        await callback.message.edit_text(
+    # A registered minecraft name answers question 1
+    profile = await db.get_user_profile(callback.from_user.id)
+    if profile and profile.minecraft_name:
+        await state.update_data(minecraft_name=profile.minecraft_name)
+        await state.set_state(RecruitmentStates.waiting_for_telegram)
+        text = (
+            f"🎮 **Nome Minecraft:** `{profile.minecraft_name}`\n\n"
+            "📱 **Domanda 2/9: @Telegram**\n\n"
+            "Scrivi il tuo username Telegram (con @):"
+        )
+    else:
+        await state.set_state(RecruitmentStates.waiting_for_minecraft_name)
+        text = (
             "🎮 **Domanda 1/9: Nome Minecraft**\n\n"
-            "Scrivi il tuo nome Minecraft:",
-            reply_markup=RecruitmentKeyboard.cancel_application()
+            "Scrivi il tuo nome Minecraft:"
         )
+
+    try:
+        await callback.message.edit_text(text, reply_markup=RecruitmentKeyboard.cancel_application())
     except TelegramBadRequest:
         pass
 
@@ -135,7 +150,8 @@ async def handle_bad_employee_input(message: Message, state: FSMContext):
         reply_markup=RecruitmentKeyboard.additional_info()
     )
 
-async def handle_additional_input(message: Message, state: FSMContext, db: Database, bot: Bot):
+async def handle_additional_input(message: Message, state: FSMContext, db: AsyncDatabase, bot: Bot,
+                                  sender: OutboundQueue, outbox: Outbox):
     """Handle additional information input"""
     data = await state.get_data()
     username = message.from_user.username or message.from_user.full_name
@@ -146,49 +162,40 @@ async def handle_additional_input(message: Message, state: FSMContext, db: Datab
         state, 
         db, 
         bot,
+        sender,
+        outbox,
         additional_info=message.text,
         user_id=message.from_user.id,
         username=username
     )
 
-async def submit_application(message, state: FSMContext, db: Database, bot: Bot, additional_info: str, user_id: int, username: str):
+async def submit_application(message, state: FSMContext, db: AsyncDatabase, bot: Bot, sender: OutboundQueue,
+                             outbox: Outbox, additional_info: str, user_id: int, username: str):
     """Submit application helper function"""
     data = await state.get_data()
 
-    # Create application
-    app_id = db.create_application(
-        user_id=user_id,
-        username=username,
-        full_name=message.from_user.full_name,
-        minecraft_name=data.get('minecraft_name', 'N/A'),
-        telegram=data.get('telegram', 'N/A'),
-        presentation=data.get('presentation', 'N/A'),
-        reason=data.get('reason', 'N/A'),
-        experience=data.get('experience', 'N/A'),
-        hours=data.get('hours', 'N/A'),
-        advice=data.get('advice', 'N/A'),
-        bad_employee=data.get('bad_employee', 'N/A'),
-        additional=additional_info
-    )
-
-    # Send confirmation to user
-    current_date = db.get_current_time().strftime("%Y-%m-%d")
-    await message.answer(
-        f"✅ **Candidatura Inviata!**\n\n"
-        f"🆔 ID Candidatura: `{app_id}`\n"
-        f"📅 Data: {current_date}\n\n"
-        f"La tua candidatura è stata inviata allo staff per la valutazione.\n"
-        f"Riceverai una risposta nelle prossime ore.",
-        reply_markup=RecruitmentKeyboard.back_to_menu()
-    )
-
-    # Send to staff group
-    staff_group_id = db.get_staff_group_id()
-    applications_topic_id = db.get_topic_id("applications")
+    current_date = (await db.get_current_time()).strftime("%Y-%m-%d")
+    staff_group_id = await db.get_staff_group_id()
+    applications_topic_id = await db.get_topic_id("applications")
+
+    # Create application, stored together with its post to the staff group
+    async with db.batch():
+        app_id = await db.create_application(
+            user_id=user_id,
+            username=username,
+            full_name=message.from_user.full_name,
+            minecraft_name=data.get('minecraft_name', 'N/A'),
+            telegram=data.get('telegram', 'N/A'),
+            presentation=data.get('presentation', 'N/A'),
+            reason=data.get('reason', 'N/A'),
+            experience=data.get('experience', 'N/A'),
+            hours=data.get('hours', 'N/A'),
+            advice=data.get('advice', 'N/A'),
+            bad_employee=data.get('bad_employee', 'N/A'),
+            additional=additional_info
+        )
 
-    if staff_group_id:
-        try:
-            current_date = db.get_current_time().strftime("%Y-%m-%d")
+        if staff_group_id:
             staff_text = f"📝 **Nuova Candidatura #{app_id}**\n\n"
             staff_text += f"👤 **Candidato:** {message.from_user.full_name} (@{message.from_user.username or 'N/A'})\n"
             staff_text += f"🆔 **User ID:** `{message.from_user.id}`\n"
@@ -207,21 +214,30 @@ async def submit_application(message, state: FSMContext, db: Database, bot: Bot,
 
             staff_text += f"⏳ **Stato:** In attesa di valutazione"
 
-            if applications_topic_id:
-                await bot.send_message(
+            # In the applications topic if there is one
+            await outbox.add(
+                STAFF,
+                SendMessage(
                     chat_id=staff_group_id,
                     message_thread_id=applications_topic_id,
                     text=staff_text,
                     reply_markup=RecruitmentKeyboard.staff_application_actions(app_id)
-                )
-            else:
-                await bot.send_message(
-                    chat_id=staff_group_id,
-                    text=staff_text,
-                    reply_markup=RecruitmentKeyboard.staff_application_actions(app_id)
-                )
-        except Exception as e:
-            print(f"Error sending application to staff group: {e}")
+                ),
+                after=["set_application_staff_message", app_id]
+            )
+
+    # Send confirmation to user
+    async def confirm():
+        await message.answer(
+            f"✅ **Candidatura Inviata!**\n\n"
+            f"🆔 ID Candidatura: `{app_id}`\n"
+            f"📅 Data: {current_date}\n\n"
+            f"La tua candidatura è stata inviata allo staff per la valutazione.\n"
+            f"Riceverai una risposta nelle prossime ore.",
+            reply_markup=RecruitmentKeyboard.back_to_menu()
+        )
+
+    await sender.submit(INTERACTIVE, confirm, chat_id=message.chat.id, name=f"confirm application {app_id}")
 
     await state.clear()
 
@@ -255,7 +271,8 @@ async def handle_write_additional_info(callback: CallbackQuery, state: FSMContex
     
     await callback.answer()
 
-async def handle_additional_text_input(message: Message, state: FSMContext, db: Database, bot: Bot):
+async def handle_additional_text_input(message: Message, state: FSMContext, db: AsyncDatabase, bot: Bot,
+                                       sender: OutboundQueue, outbox: Outbox):
     """Handle additional text input"""
     # Submit application with user input
     await submit_application(
@@ -263,12 +280,15 @@ async def handle_additional_text_input(message: Message, state: FSMContext, db:
         state, 
         db, 
         bot,
+        sender,
+        outbox,
         additional_info=f"`{message.text}`",
         user_id=message.from_user.id,
         username=message.from_user.username or message.from_user.full_name
     )
 
-async def handle_no_additional_info(callback: CallbackQuery, state: FSMContext, db: Database, bot: Bot):
+async def handle_no_additional_info(callback: CallbackQuery, state: FSMContext, db: AsyncDatabase, bot: Bot,
+                                    sender: OutboundQueue, outbox: Outbox):
     """Handle no additional info submission"""
     # Submit application automatically
     await submit_application(
@@ -276,6 +296,8 @@ async def handle_no_additional_info(callback: CallbackQuery, state: FSMContext,
         state, 
         db, 
         bot,
+        sender,
+        outbox,
         additional_info="`Non ho nulla da dire`",
         user_id=callback.from_user.id,
         username=callback.from_user.username or callback.from_user.full_name
@@ -283,59 +305,58 @@ async def handle_no_additional_info(callback: CallbackQuery, state: FSMContext,
 
     await callback.answer("✅ Candidatura inviata!")
 
-async def handle_staff_application_action(callback: CallbackQuery, db: Database, bot: Bot):
+async def handle_staff_application_action(callback: CallbackQuery, db: AsyncDatabase, bot: Bot, sender: OutboundQueue,
+                                          outbox: Outbox, action: str, app_id: str):
     """Handle staff application approval/rejection"""
-    action = callback.data.split(":")[1]
-    app_id = callback.data.split(":")[2]
-
-    application = db.get_application(app_id)
+    application = await db.get_application(app_id)
     if not application:
         await callback.answer("❌ Candidatura non trovata!", show_alert=True)
         return
 
     if action == "approve":
-        db.update_application_status(app_id, "approved")
+        status = "approved"
         status_text = "✅ Approvata"
         user_message = f"🎉 Congratulazioni! La tua candidatura `{app_id}` è stata approvata!\n\nVerrai contattato dallo staff per i prossimi passi."
     else:
-        db.update_application_status(app_id, "rejected")
+        status = "rejected"
         status_text = "❌ Rifiutata"
         user_message = f"😔 La tua candidatura `{app_id}` non è stata accettata questa volta.\n\nPuoi riprovare in futuro!"
 
-    # Update message
-    try:
-        current_text = callback.message.text
-        updated_text = current_text.replace("⏳ **Stato:** In attesa di valutazione", f"**Stato:** {status_text}")
+    # Notification to the user, stored with the new status
+    async with db.batch():
+        await db.update_application_status(app_id, status)
+        await outbox.add(NOTIFICATION, SendMessage(chat_id=application["user_id"], text=user_message))
 
-        await callback.message.edit_text(
-            updated_text,
-            reply_markup=None
-        )
+    # Update message
+    updated_text = callback.message.text.replace("⏳ **Stato:** In attesa di valutazione", f"**Stato:** {status_text}")
 
-    except TelegramBadRequest:
-        pass
+    async def update_staff_message():
+        try:
+            await callback.message.edit_text(
+                updated_text,
+                reply_markup=None
+            )
+        except TelegramBadRequest:
+            pass
 
-    # Send notification to user
-    try:
-        await bot.send_message(
-            chat_id=application["user_id"],
-            text=user_message
-        )
-    except Exception as e:
-        print(f"Error sending notification to user: {e}")
+    await sender.submit(INTERACTIVE, update_staff_message, chat_id=callback.message.chat.id,
+                        name=f"staff message of application {app_id}")
 
     await callback.answer(f"✅ Candidatura {action}!")
 
-def register_handlers(dp, db: Database, bot: Bot):
+def register_handlers(dp, db: AsyncDatabase, bot: Bot):
     """Register recruitment handlers"""
+    callbacks = callback_router(dp)
+    sender = outbound_queue(dp)
+    messages = outbox(dp, db, bot)
 
     @dp.message(Command("curriculum"))
     async def curriculum_handler(message: Message, state: FSMContext):
         await cmd_curriculum(message, db, state)
 
-    @dp.callback_query(lambda c: c.data == "start_application")
+    @callbacks.route("start_application")
     async def start_application_handler(callback: CallbackQuery, state: FSMContext):
-        await handle_start_application(callback, state)
+        await handle_start_application(callback, state, db)
 
     @dp.message(RecruitmentStates.waiting_for_minecraft_name)
     async def minecraft_name_handler(message: Message, state: FSMContext):
@@ -371,24 +392,24 @@ def register_handlers(dp, db: Database, bot: Bot):
 
     @dp.message(RecruitmentStates.waiting_for_additional)
     async def additional_handler(message: Message, state: FSMContext):
-        await handle_additional_input(message, state, db, bot)
+        await handle_additional_input(message, state, db, bot, sender, messages)
 
-    @dp.callback_query(lambda c: c.data == "cancel_application")
+    @callbacks.route("cancel_application")
     async def cancel_application_handler(callback: CallbackQuery, state: FSMContext):
         await handle_cancel_application(callback, state)
         
-    @dp.callback_query(lambda c: c.data == "write_additional")
+    @callbacks.route("write_additional")
     async def write_additional_handler(callback: CallbackQuery, state: FSMContext):
         await handle_write_additional_info(callback, state)
     
     @dp.message(RecruitmentStates.waiting_for_additional_text)
     async def additional_text_handler(message: Message, state: FSMContext):
-        await handle_additional_text_input(message, state, db, bot)
+        await handle_additional_text_input(message, state, db, bot, sender, messages)
     
-    @dp.callback_query(lambda c: c.data == "no_additional_info")
+    @callbacks.route("no_additional_info")
     async def no_additional_info_handler(callback: CallbackQuery, state: FSMContext):
-        await handle_no_additional_info(callback, state, db, bot)
+        await handle_no_additional_info(callback, state, db, bot, sender, messages)
 
-    @dp.callback_query(lambda c: c.data.startswith("app_action:"))
-    async def staff_application_handler(callback: CallbackQuery):
-        await handle_staff_application_action(callback, db, bot)
\ No newline at end of file
+    @callbacks.route("app_action")
+    async def staff_application_handler(callback: CallbackQuery, action: str, app_id: str):
+        await handle_staff_application_action(callback, db, bot, sender, messages, action, app_id)
\ No newline at end of file
@@ -3,19 +3,23 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
+from aiogram.methods import ForwardMessage, SendMessage
 
 from config import EMOJI, ADMIN_IDS
 from utils.keyboards import SponsorKeyboard
-from database import Database
+from utils.callback_router import callback_router
+from utils.outbound_queue import OutboundQueue, INTERACTIVE, STAFF, NOTIFICATION, outbound_queue
+from utils.outbox import Outbox, outbox
+from storage.async_database import AsyncDatabase
 from handlers.states import SponsorStates
 
 router = Router()
 
-async def cmd_sponsor(message: Message, db: Database, state: FSMContext):
+async def cmd_sponsor(message: Message, db: AsyncDatabase, state: FSMContext):
     """Handle /sponsor command"""
     # Check if user has minecraft name
-    minecraft_name = db.get_user_minecraft_name(message.from_user.id)
-    if not minecraft_name:
+    profile = await db.get_user_profile(message.from_user.id)
+    if not profile or not profile.minecraft_name:
         await message.answer(
             "⚠️ **`Nome Minecraft Richiesto`**\n\n"
             "`Per richiedere sponsor devi prima registrare il tuo nome Minecraft.`\n\n"
@@ -37,7 +41,7 @@ async def cmd_sponsor(message: Message, db: Database, state: FSMContext):
     await message.answer(sponsor_text)
     await state.set_state(SponsorStates.waiting_for_hours_info)
 
-async def handle_forward_message(message: Message, state: FSMContext, db: Database):
+async def handle_forward_message(message: Message, state: FSMContext, db: AsyncDatabase):
     """Handle forwarded message for sponsor request"""
     if not message.text and not message.caption:
         await message.answer(
@@ -60,7 +64,8 @@ async def handle_forward_message(message: Message, state: FSMContext, db: Databa
     )
     await state.set_state(SponsorStates.waiting_for_payment_photo)
 
-async def handle_payment_photo(message: Message, state: FSMContext, db: Database, bot: Bot):
+async def handle_payment_photo(message: Message, state: FSMContext, db: AsyncDatabase, bot: Bot,
+                               sender: OutboundQueue, outbox: Outbox):
     """Handle payment photo for sponsor request"""
     if not message.photo:
         await message.answer(
@@ -74,33 +79,21 @@ async def handle_payment_photo(message: Message, state: FSMContext, db: Database
     original_message_id = data.get('original_message_id')
     original_chat_id = data.get('original_chat_id')
     username = message.from_user.username or message.from_user.full_name
+    staff_group_id = await db.get_staff_group_id()
+    sponsors_topic_id = await db.get_topic_id("sponsors")
     
-    # Create sponsor request with message content and forwarding info
-    sponsor_id = db.create_sponsor_request(
-        message.from_user.id, 
-        username, 
-        sponsor_message, 
-        original_message_id, 
-        original_chat_id
-    )
-    
-    await state.clear()
-    
-    # Send confirmation to user
-    await message.answer(
-        f"✅ **Richiesta Sponsor Inviata!**\n\n"
-        f"🆔 ID Richiesta: `{sponsor_id}`\n"
-        f"⏳ Stato: In attesa di valutazione\n\n"
-        f"Ti contatteremo presto con una risposta!",
-        reply_markup=SponsorKeyboard.back_to_menu()
-    )
-    
-    # Send to staff group if configured
-    staff_group_id = db.get_staff_group_id()
-    sponsors_topic_id = db.get_topic_id("sponsors")
-    
-    if staff_group_id:
-        try:
+    # Create sponsor request with message content and forwarding info, stored
+    # together with its post to the staff group if configured
+    async with db.batch():
+        sponsor_id = await db.create_sponsor_request(
+            message.from_user.id, 
+            username, 
+            sponsor_message, 
+            original_message_id, 
+            original_chat_id
+        )
+        
+        if staff_group_id:
             staff_text = f"📣 **Nuova Richiesta Sponsor**\n\n"
             staff_text += f"👤 Da: @{username}\n"
             staff_text += f"🆔 ID: `{sponsor_id}`\n"
@@ -109,62 +102,49 @@ async def handle_payment_photo(message: Message, state: FSMContext, db: Database
             staff_text += f"📸 **Foto pagamento ricevuta**\n"
             staff_text += f"⏳ **Stato:** In attesa"
             
-            # Send text message to staff group
-            if sponsors_topic_id:
-                staff_message = await bot.send_message(
-                    chat_id=staff_group_id,
-                    message_thread_id=sponsors_topic_id,
-                    text=staff_text,
-                    reply_markup=SponsorKeyboard.staff_sponsor_actions(sponsor_id)
-                )
-                
-                # Forward the original sponsor message
-                if original_message_id and original_chat_id:
-                    await bot.forward_message(
-                        chat_id=staff_group_id,
-                        from_chat_id=original_chat_id,
-                        message_id=original_message_id,
-                        message_thread_id=sponsors_topic_id
-                    )
-                
-                # Send the payment photo as separate message
-                await bot.forward_message(
+            # Text message in the sponsors topic if there is one, whose ID is saved once sent
+            calls = [SendMessage(
+                chat_id=staff_group_id,
+                message_thread_id=sponsors_topic_id,
+                text=staff_text,
+                reply_markup=SponsorKeyboard.staff_sponsor_actions(sponsor_id)
+            )]
+            
+            # Forward the original sponsor message
+            if original_message_id and original_chat_id:
+                calls.append(ForwardMessage(
                     chat_id=staff_group_id,
-                    from_chat_id=message.chat.id,
-                    message_id=message.message_id,
+                    from_chat_id=original_chat_id,
+                    message_id=original_message_id,
                     message_thread_id=sponsors_topic_id
-                )
-            else:
-                staff_message = await bot.send_message(
-                    chat_id=staff_group_id,
-                    text=staff_text,
-                    reply_markup=SponsorKeyboard.staff_sponsor_actions(sponsor_id)
-                )
-                
-                # Forward the original sponsor message
-                if original_message_id and original_chat_id:
-                    await bot.forward_message(
-                        chat_id=staff_group_id,
-                        from_chat_id=original_chat_id,
-                        message_id=original_message_id
-                    )
-                
-                # Send the payment photo as separate message
-                await bot.forward_message(
-                    chat_id=staff_group_id,
-                    from_chat_id=message.chat.id,
-                    message_id=message.message_id
-                )
+                ))
             
-            # Save staff message ID
-            db.set_sponsor_staff_message(sponsor_id, staff_message.message_id)
-            
-        except Exception as e:
-            print(f"Error sending sponsor request to staff group: {e}")
+            # Send the payment photo as separate message
+            calls.append(ForwardMessage(
+                chat_id=staff_group_id,
+                from_chat_id=message.chat.id,
+                message_id=message.message_id,
+                message_thread_id=sponsors_topic_id
+            ))
+            await outbox.add(STAFF, *calls, after=["set_sponsor_staff_message", sponsor_id])
+    
+    await state.clear()
+    
+    # Send confirmation to user
+    async def confirm():
+        await message.answer(
+            f"✅ **Richiesta Sponsor Inviata!**\n\n"
+            f"🆔 ID Richiesta: `{sponsor_id}`\n"
+            f"⏳ Stato: In attesa di valutazione\n\n"
+            f"Ti contatteremo presto con una risposta!",
+            reply_markup=SponsorKeyboard.back_to_menu()
+        )
+
+    await sender.submit(INTERACTIVE, confirm, chat_id=message.chat.id, name=f"confirm sponsor {sponsor_id}")
     
     # Message handlers don't need callback.answer()
 
-async def handle_sponsor_cancel(callback: CallbackQuery, db: Database):
+async def handle_sponsor_cancel(callback: CallbackQuery, db: AsyncDatabase):
     """Handle sponsor request cancellation"""
     try:
         await callback.message.edit_text(
@@ -177,90 +157,84 @@ async def handle_sponsor_cancel(callback: CallbackQuery, db: Database):
     
     await callback.answer("❌ Richiesta annullata")
 
-async def handle_staff_sponsor_action(callback: CallbackQuery, db: Database, bot: Bot):
+async def handle_staff_sponsor_action(callback: CallbackQuery, db: AsyncDatabase, bot: Bot, sender: OutboundQueue,
+                                      outbox: Outbox, action: str, sponsor_id: str):
     """Handle staff sponsor actions"""
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("❌ Non hai i permessi per questa azione!", show_alert=True)
         return
     
-    action_data = callback.data.split(":")
-    action = action_data[1]
-    sponsor_id = action_data[2]
-    
-    sponsor = db.get_sponsor_request(sponsor_id)
+    sponsor = await db.get_sponsor_request(sponsor_id)
     if not sponsor:
         await callback.answer("❌ Richiesta sponsor non trovata!", show_alert=True)
         return
     
-    if action == "approve":
-        db.update_sponsor_status(sponsor_id, "approved")
-        status_text = "✅ Approvato"
-        user_message = f"🎉 La tua richiesta sponsor `{sponsor_id}` è stata approvata! Ti contatteremo presto per i dettagli."
-        
-        # Send to sponsor channel if configured
-        sponsor_channel_id = db.get_sponsor_channel_id()
-        if sponsor_channel_id:
-            try:
+    # The new status is stored together with the messages it triggers
+    async with db.batch():
+        if action == "approve":
+            await db.update_sponsor_status(sponsor_id, "approved")
+            status_text = "✅ Approvato"
+            user_message = f"🎉 La tua richiesta sponsor `{sponsor_id}` è stata approvata! Ti contatteremo presto per i dettagli."
+            
+            # Send to sponsor channel if configured
+            sponsor_channel_id = await db.get_sponsor_channel_id()
+            if sponsor_channel_id:
                 # Forward the original message to sponsor channel
                 original_chat_id = sponsor.get('original_chat_id')
                 original_message_id = sponsor.get('original_message_id')
                 
                 if original_chat_id and original_message_id:
                     # Forward the original message with images/media
-                    await bot.forward_message(
+                    channel_post = ForwardMessage(
                         chat_id=sponsor_channel_id,
                         from_chat_id=original_chat_id,
                         message_id=original_message_id
                     )
                 else:
                     # Fallback to text message if forwarding info not available
-                    await bot.send_message(
+                    channel_post = SendMessage(
                         chat_id=sponsor_channel_id,
                         text=sponsor.get('message', 'Messaggio sponsor non disponibile')
                     )
-            except Exception as e:
-                print(f"Error sending to sponsor channel: {e}")
+                await outbox.add(NOTIFICATION, channel_post)
+            
+        elif action == "reject":
+            await db.update_sponsor_status(sponsor_id, "rejected")
+            status_text = "❌ Rifiutato"
+            user_message = f"❌ La tua richiesta sponsor `{sponsor_id}` è stata rifiutata. Grazie comunque per l'interesse!"
         
-    elif action == "reject":
-        db.update_sponsor_status(sponsor_id, "rejected")
-        status_text = "❌ Rifiutato"
-        user_message = f"❌ La tua richiesta sponsor `{sponsor_id}` è stata rifiutata. Grazie comunque per l'interesse!"
+        # Send notification to user
+        await outbox.add(NOTIFICATION, SendMessage(chat_id=sponsor["user_id"], text=user_message))
     
     # Update staff message
-    try:
-        staff_text = f"📣 **Richiesta Sponsor Aggiornata**\n\n"
-        staff_text += f"👤 Da: @{sponsor['username']}\n"
-        staff_text += f"🆔 ID: `{sponsor_id}`\n"
-        staff_text += f"📅 Data: {sponsor['created_at'][:10]}\n\n"
-        staff_text += f"💡 **Dettaglio:** Richiesta sponsor generico\n"
-        staff_text += f"📊 **Stato:** {status_text}"
-        
-        # Remove keyboard after action
-        await callback.message.edit_text(
-            staff_text,
-            reply_markup=None
-        )
-        
-    except TelegramBadRequest:
-        pass
-    
-    # Send notification to user
-    try:
-        await bot.send_message(
-            chat_id=sponsor["user_id"],
-            text=user_message
-        )
-    except Exception as e:
-        print(f"Error sending notification to user: {e}")
+    staff_text = f"📣 **Richiesta Sponsor Aggiornata**\n\n"
+    staff_text += f"👤 Da: @{sponsor['username']}\n"
+    staff_text += f"🆔 ID: `{sponsor_id}`\n"
+    staff_text += f"📅 Data: {sponsor['created_at'][:10]}\n\n"
+    staff_text += f"💡 **Dettaglio:** Richiesta sponsor generico\n"
+    staff_text += f"📊 **Stato:** {status_text}"
+
+    async def update_staff_message():
+        try:
+            # Remove keyboard after action
+            await callback.message.edit_text(
+                staff_text,
+                reply_markup=None
+            )
+        except TelegramBadRequest:
+            pass
+
+    await sender.submit(INTERACTIVE, update_staff_message, chat_id=callback.message.chat.id,
+                        name=f"staff message of sponsor {sponsor_id}")
     
     await callback.answer(f"✅ Richiesta {action}!")
 
-async def handle_minecraft_name_sponsor(message: Message, state: FSMContext, db: Database):
+async def handle_minecraft_name_sponsor(message: Message, state: FSMContext, db: AsyncDatabase):
     """Handle minecraft name input for sponsor"""
     minecraft_name = message.text.strip()
     
     # Save minecraft name
-    db.set_user_minecraft_name(
+    await db.set_user_minecraft_name(
         message.from_user.id, 
         minecraft_name, 
         message.from_user.username or message.from_user.full_name
@@ -273,7 +247,7 @@ async def handle_minecraft_name_sponsor(message: Message, state: FSMContext, db:
     )
     await state.set_state(SponsorStates.waiting_for_hours_info)
 
-async def handle_hours_info(message: Message, state: FSMContext, db: Database):
+async def handle_hours_info(message: Message, state: FSMContext, db: AsyncDatabase):
     """Handle hours and duration info for sponsor"""
     hours_info = message.text.strip()
     await state.update_data(hours_info=hours_info)
@@ -284,8 +258,11 @@ async def handle_hours_info(message: Message, state: FSMContext, db: Database):
     )
     await state.set_state(SponsorStates.waiting_for_forward_message)
 
-def register_handlers(dp, db: Database, bot: Bot):
+def register_handlers(dp, db: AsyncDatabase, bot: Bot):
     """Register sponsor handlers"""
+    callbacks = callback_router(dp)
+    sender = outbound_queue(dp)
+    messages = outbox(dp, db, bot)
     
     @dp.message(Command("sponsor"))
     async def sponsor_handler(message: Message, state: FSMContext):
@@ -305,17 +282,17 @@ def register_handlers(dp, db: Database, bot: Bot):
     
     @dp.message(SponsorStates.waiting_for_payment_photo)
     async def payment_photo_handler(message: Message, state: FSMContext):
-        await handle_payment_photo(message, state, db, bot)
+        await handle_payment_photo(message, state, db, bot, sender, messages)
     
-    @dp.callback_query(lambda c: c.data == "request_sponsor")
+    @callbacks.route("request_sponsor")
     async def sponsor_request_handler(callback: CallbackQuery, state: FSMContext):
         await cmd_sponsor(callback.message, db, state)
         await callback.answer()
     
-    @dp.callback_query(lambda c: c.data == "cancel_sponsor")
+    @callbacks.route("cancel_sponsor")
     async def sponsor_cancel_handler(callback: CallbackQuery):
         await handle_sponsor_cancel(callback, db)
     
-    @dp.callback_query(lambda c: c.data.startswith("sponsor_action:"))
-    async def staff_sponsor_handler(callback: CallbackQuery):
-        await handle_staff_sponsor_action(callback, db, bot)
+    @callbacks.route("sponsor_action")
+    async def staff_sponsor_handler(callback: CallbackQuery, action: str, sponsor_id: str):
+        await handle_staff_sponsor_action(callback, db, bot, sender, messages, action, sponsor_id)
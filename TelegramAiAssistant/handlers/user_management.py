@@ -4,110 +4,126 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
+from aiogram.methods import SendMessage
 
 from config import ADMIN_IDS
 from utils.keyboards import RecruitmentKeyboard
-from database import Database
+from utils.callback_router import callback_router
+from utils.outbound_queue import OutboundQueue, INTERACTIVE, NOTIFICATION, outbound_queue
+from utils.outbox import Outbox, outbox
+from storage.async_database import AsyncDatabase
 from handlers.states import ReplyStates
 
 router = Router()
 
-async def cmd_list_users(message: Message, db: Database, bot: Bot):
+async def cmd_list_users(message: Message, db: AsyncDatabase, bot: Bot, sender: OutboundQueue):
     """List all registered users"""
     if message.from_user.id not in ADMIN_IDS:
         await message.answer("❌ Non hai i permessi per questo comando!")
         return
     
-    users = db.get_all_users()
+    users = await db.get_all_users()
     if not users:
         await message.answer("`❌ Nessun utente registrato`")
         return
     
     # Send to users topic
-    users_topic_id = db.get_topic_id("users")
-    staff_group_id = db.get_staff_group_id()
+    users_topic_id = await db.get_topic_id("users")
+    staff_group_id = await db.get_staff_group_id()
     
     if staff_group_id and users_topic_id:
-        for user_id, user_data in users.items():
-            minecraft_name = user_data.get("minecraft_name", "N/A")
-            username = user_data.get("username", "N/A")
-            banned = user_data.get("banned", False)
+        for user_id, profile in users.items():
+            minecraft_name = profile.minecraft_name or "N/A"
+            username = profile.username or "N/A"
+            banned = profile.banned
             status = "🚫 Bannato" if banned else "✅ Attivo"
             
             user_text = f"`👤` **`Utente: {username}`**\n\n"
             user_text += f"`🆔` **`ID:`** `{user_id}`\n"
             user_text += f"`🎮` **`Minecraft:`** `{minecraft_name}`\n"
             user_text += f"`📊` **`Stato:`** {status}\n"
-            user_text += f"`📅` **`Registrato:`** `{user_data.get('registered_at', 'N/A')[:10]}`"
+            user_text += f"`📅` **`Registrato:`** `{profile.get('registered_at', 'N/A')[:10]}`"
             
-            await bot.send_message(
-                chat_id=staff_group_id,
-                message_thread_id=users_topic_id,
-                text=user_text,
-                reply_markup=RecruitmentKeyboard.user_management_actions(user_id, banned)
-            )
+            async def post_user(user_text=user_text, user_id=user_id, banned=banned):
+                await bot.send_message(
+                    chat_id=staff_group_id,
+                    message_thread_id=users_topic_id,
+                    text=user_text,
+                    reply_markup=RecruitmentKeyboard.user_management_actions(user_id, banned)
+                )
+
+            await sender.submit(NOTIFICATION, post_user, chat_id=staff_group_id, name=f"user list entry {user_id}")
 
-async def handle_ban_user(callback: CallbackQuery, db: Database, bot: Bot):
+async def handle_ban_user(callback: CallbackQuery, db: AsyncDatabase, bot: Bot, sender: OutboundQueue,
+                          outbox: Outbox, user_id: int):
     """Handle user ban"""
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("❌ Non autorizzato!", show_alert=True)
         return
     
-    user_id = int(callback.data.split(":")[-1])
-    db.ban_user(user_id)
-    
-    try:
+    # Notify user, stored with the ban
+    async with db.batch():
+        await db.ban_user(user_id)
+        await outbox.add(
+            NOTIFICATION,
+            SendMessage(
+                chat_id=user_id,
+                text="`🚫` **`Sei stato bannato dal bot`**\n\n`Non puoi più usare i comandi.`"
+            )
+        )
+
+    async def update_staff_message():
         await callback.message.edit_text(
             callback.message.text.replace("✅ Attivo", "🚫 Bannato"),
             reply_markup=RecruitmentKeyboard.user_management_actions(str(user_id), True)
         )
-        
-        # Notify user
-        await bot.send_message(
-            chat_id=user_id,
-            text="`🚫` **`Sei stato bannato dal bot`**\n\n`Non puoi più usare i comandi.`"
-        )
-    except Exception as e:
-        print(f"Error banning user: {e}")
+
+    await sender.submit(INTERACTIVE, update_staff_message, chat_id=callback.message.chat.id, name=f"ban message of {user_id}")
     
     await callback.answer("✅ Utente bannato!")
 
-async def handle_unban_user(callback: CallbackQuery, db: Database, bot: Bot):
+async def handle_unban_user(callback: CallbackQuery, db: AsyncDatabase, bot: Bot, sender: OutboundQueue,
+                            outbox: Outbox, user_id: int):
     """Handle user unban"""
     if callback.from_user.id not in ADMIN_IDS:
         await callback.answer("❌ Non autorizzato!", show_alert=True)
         return
     
-    user_id = int(callback.data.split(":")[-1])
-    db.unban_user(user_id)
-    
-    try:
+    # Notify user, stored with the unban
+    async with db.batch():
+        await db.unban_user(user_id)
+        await outbox.add(
+            NOTIFICATION,
+            SendMessage(
+                chat_id=user_id,
+                text="`✅` **`Sei stato sbannato dal bot`**\n\n`Puoi tornare ad usare tutti i comandi.`"
+            )
+        )
+
+    async def update_staff_message():
         await callback.message.edit_text(
             callback.message.text.replace("🚫 Bannato", "✅ Attivo"),
             reply_markup=RecruitmentKeyboard.user_management_actions(str(user_id), False)
         )
-        
-        # Notify user
-        await bot.send_message(
-            chat_id=user_id,
-            text="`✅` **`Sei stato sbannato dal bot`**\n\n`Puoi tornare ad usare tutti i comandi.`"
-        )
-    except Exception as e:
-        print(f"Error unbanning user: {e}")
+
+    await sender.submit(INTERACTIVE, update_staff_message, chat_id=callback.message.chat.id, name=f"unban message of {user_id}")
     
     await callback.answer("✅ Utente sbannato!")
 
-def register_handlers(dp, db: Database, bot: Bot):
+def register_handlers(dp, db: AsyncDatabase, bot: Bot):
     """Register user management handlers"""
+    callbacks = callback_router(dp)
+    sender = outbound_queue(dp)
+    messages = outbox(dp, db, bot)
     
     @dp.message(Command("list_users"))
     async def list_users_handler(message: Message):
-        await cmd_list_users(message, db, bot)
+        await cmd_list_users(message, db, bot, sender)
     
-    @dp.callback_query(lambda c: c.data.startswith("ban_user:"))
-    async def ban_user_handler(callback: CallbackQuery):
-        await handle_ban_user(callback, db, bot)
+    @callbacks.route("ban_user")
+    async def ban_user_handler(callback: CallbackQuery, user_id: int):
+        await handle_ban_user(callback, db, bot, sender, messages, user_id)
     
-    @dp.callback_query(lambda c: c.data.startswith("unban_user:"))
-    async def unban_user_handler(callback: CallbackQuery):
-        await handle_unban_user(callback, db, bot)
+    @callbacks.route("unban_user")
+    async def unban_user_handler(callback: CallbackQuery, user_id: int):
+        await handle_unban_user(callback, db, bot, sender, messages, user_id)
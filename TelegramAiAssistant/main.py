@@ -3,10 +3,21 @@ import logging
 import os
 from aiogram import Bot, Dispatcher
 from aiogram.types import BotCommand
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import BOT_TOKEN, ADMIN_IDS
-from database import Database
+from config import BOT_TOKEN, BOT_API_URL, ADMIN_IDS, BOT_MODE, BOT_WORKERS, BOT_WORKER
+from database import create_database
+from storage.async_database import AsyncDatabase
+from utils.sweeper import run_sweeper
+from utils.outbound_queue import outbound_queue
+from utils.outbox import outbox
+from utils.webhook import WebhookServer
+from utils.workers import Supervisor, UpdateFeeder, worker_limits
+from middlewares.ban import BanMiddleware
+from middlewares.throttling import ThrottlingMiddleware
+from middlewares.outbound import OutboundLimiter
 from handlers import menu, orders, sponsor, recruitment, admin, fallback, user_management
 
 # Configure logging
@@ -16,11 +27,39 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def create_bot() -> Bot:
+    """Bot talking to BOT_API_URL, or to api.telegram.org"""
+    if BOT_API_URL:
+        return Bot(token=BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(BOT_API_URL)))
+    return Bot(token=BOT_TOKEN)
+
 class KrustyKrabBot:
     def __init__(self):
-        self.bot = Bot(token=BOT_TOKEN)
+        self.bot = create_bot()
+        # The single process, or the first worker: sets the commands and runs the sweeper
+        self.primary = BOT_WORKER <= 0
+        # Every request of the bot goes through the session middlewares; workers
+        # share the global and group limits
+        self.outbound = OutboundLimiter(**worker_limits(BOT_WORKERS)) if BOT_WORKER >= 0 else OutboundLimiter()
+        self.bot.session.middleware(self.outbound)
         self.dp = Dispatcher(storage=MemoryStorage())
-        self.db = Database()
+        self.db = AsyncDatabase(create_database())
+        self.sweeper_task = None
+        self.throttling = ThrottlingMiddleware(exempt=ADMIN_IDS)
+        # Injected into handlers asking for a `throttling` argument
+        self.dp["throttling"] = self.throttling
+        self.dp["outbound"] = self.outbound
+        self.sender = outbound_queue(self.dp)
+        # Staff posts and notifications, stored with the changes they report
+        self.outbox = outbox(self.dp, self.db, self.bot)
+        self.webhook = None
+        self.feeder = None
+        if BOT_WORKER >= 0:
+            # Updates come from the supervisor, routed by user id
+            self.feeder = UpdateFeeder(self.dp, self.bot)
+        elif BOT_MODE == "webhook":
+            # Updates come from Telegram's requests to an embedded server instead of polling
+            self.webhook = WebhookServer(self.dp, self.bot)
 
     async def setup_bot_commands(self):
         """Setup bot commands menu"""
@@ -39,7 +78,7 @@ class KrustyKrabBot:
     async def setup_staff_group(self):
         """Setup staff group - requires manual group creation"""
         try:
-            staff_group_id = self.db.get_staff_group_id()
+            staff_group_id = await self.db.get_staff_group_id()
 
             if not staff_group_id:
                 logger.info("Staff group not configured.")
@@ -56,9 +95,9 @@ class KrustyKrabBot:
                 logger.info(f"Staff group configured: {staff_group_id}")
 
                 # Verify topics exist, if not skip topic creation
-                orders_topic = self.db.get_topic_id("orders") 
-                sponsors_topic = self.db.get_topic_id("sponsors")
-                recruitment_topic = self.db.get_topic_id("recruitment")
+                orders_topic = await self.db.get_topic_id("orders") 
+                sponsors_topic = await self.db.get_topic_id("sponsors")
+                recruitment_topic = await self.db.get_topic_id("recruitment")
 
                 if not all([orders_topic, sponsors_topic, recruitment_topic]):
                     logger.info("Some topics not configured - staff features may not work fully")
@@ -71,6 +110,10 @@ class KrustyKrabBot:
         # Register handlers
         from handlers import menu, orders, sponsor, recruitment, admin, fallback, user_management
 
+        # Outer middlewares run before any handler filter
+        BanMiddleware(self.db.banned_users).setup(self.dp)
+        self.throttling.setup(self.dp)
+
         menu.register_handlers(self.dp, self.db, self.bot)
         orders.register_handlers(self.dp, self.db, self.bot)
         sponsor.register_handlers(self.dp, self.db, self.bot)
@@ -83,20 +126,59 @@ class KrustyKrabBot:
         """Start the bot"""
         logger.info("Starting The Krusty Krab Bot...")
 
-        await self.setup_bot_commands()
-        await self.setup_staff_group()
+        if self.primary:
+            await self.setup_bot_commands()
+            await self.setup_staff_group()
         await self.register_handlers()
+        self.db.start_flusher()
+        self.sender.start()
+        # Also sends the messages left undelivered when the bot last stopped
+        self.outbox.start()
+        if self.primary:
+            self.sweeper_task = asyncio.create_task(run_sweeper(self.db, self.outbox))
 
         logger.info("Bot started successfully!")
+        if self.feeder:
+            # Until the supervisor closes our stdin
+            await self.feeder.run()
+            return
+        if self.webhook:
+            await self.webhook.serve()
+            return
+        # getUpdates is refused while a webhook is set, e.g. after running in webhook mode
+        await self.bot.delete_webhook()
         await self.dp.start_polling(self.bot)
 
     async def stop(self):
         """Stop the bot"""
         logger.info("Stopping bot...")
+        if self.webhook:
+            # Updates already answered are processed before their senders stop
+            await self.webhook.close()
+        if self.sweeper_task:
+            self.sweeper_task.cancel()
+        # Jobs may still write to the database; outbox messages not sent by then
+        # stay stored and go out after the next start
+        await self.outbox.close()
+        await self.sender.close()
+        await self.db.close()
         await self.bot.session.close()
 
+async def supervise():
+    """Receive the updates and run BOT_WORKERS worker processes handling them"""
+    bot = create_bot()
+    supervisor = Supervisor(bot)
+    try:
+        await supervisor.serve()
+    finally:
+        await supervisor.close()
+        await bot.session.close()
+
 async def main():
     """Main function"""
+    if BOT_WORKERS > 0 and BOT_WORKER < 0:
+        await supervise()
+        return
     bot = KrustyKrabBot()
     try:
         await bot.start()
@@ -0,0 +1,42 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict, Set
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+logger = logging.getLogger(__name__)
+
+BANNED_TEXT = "🚫 Sei stato bannato dal bot!"
+
+class BanMiddleware(BaseMiddleware):
+    """Outer middleware dropping messages and callback queries of banned users.
+
+    Runs before any filter or handler. The check is a lookup in the
+    backend's banned_users set, which ban_user()/unban_user() keep current,
+    so it costs no storage call per update. Banned users get one short
+    reply: an alert for callbacks, a message in private chats only.
+    """
+
+    def __init__(self, banned_users: Set[int]):
+        self.banned_users = banned_users
+        self.rejected = 0
+
+    def setup(self, dp: Dispatcher):
+        dp.message.outer_middleware(self)
+        dp.callback_query.outer_middleware(self)
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is None or user.id not in self.banned_users:
+            return await handler(event, data)
+
+        self.rejected += 1
+        try:
+            if isinstance(event, CallbackQuery):
+                await event.answer(BANNED_TEXT, show_alert=True)
+            elif isinstance(event, Message) and event.chat.type == "private":
+                await event.answer(BANNED_TEXT)
+        except Exception as e:
+            logger.warning(f"Could not notify banned user {user.id}: {e}")
+        return None
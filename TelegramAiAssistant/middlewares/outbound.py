@@ -0,0 +1,134 @@
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from config import (
+    OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST,
+    OUTBOUND_GROUP_RATE, OUTBOUND_GROUP_BURST, OUTBOUND_MAX_RETRIES, THROTTLE_MAX_BUCKETS
+)
+from middlewares.throttling import BucketCache, TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Methods posting or changing messages in a chat, the ones Telegram limits
+PACED_PREFIXES = ("Send", "Forward", "Copy", "Edit")
+
+def is_group(chat_id: Union[int, str]) -> bool:
+    """Groups and channels have negative ids or are addressed by @username"""
+    return not isinstance(chat_id, int) or chat_id < 0
+
+class _Lane:
+    """Requests to one chat, sent one at a time in arrival order"""
+
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+class OutboundLimiter(BaseRequestMiddleware):
+    """Session middleware pacing messages sent by the bot within Telegram's limits.
+
+    Requests to a chat (send, forward, copy, edit) queue in its lane and go
+    one at a time in order: each takes a slot in the chat's bucket (private
+    chats and groups have their own limits) and then in the global one, so
+    a burst of staff posts is spread out instead of being answered 429. A
+    request answered 429 anyway holds its lane for retry_after and is sent
+    again, up to max_retries times, instead of being lost. Other methods
+    (answerCallbackQuery, getters) go through untouched.
+    """
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, global_burst: int = OUTBOUND_GLOBAL_BURST,
+                 chat_rate: float = OUTBOUND_CHAT_RATE, chat_burst: int = OUTBOUND_CHAT_BURST,
+                 group_rate: float = OUTBOUND_GROUP_RATE, group_burst: int = OUTBOUND_GROUP_BURST,
+                 max_retries: int = OUTBOUND_MAX_RETRIES, max_buckets: int = THROTTLE_MAX_BUCKETS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.global_bucket = TokenBucket(global_rate, global_burst, clock())
+        self.chat_limit = (chat_rate, chat_burst)
+        self.group_limit = (group_rate, group_burst)
+        self.chat_buckets = BucketCache(max_buckets)
+        self.max_retries = max_retries
+        # Lanes of the chats with requests queued or in flight
+        self.lanes: Dict[Union[int, str], _Lane] = {}
+        # Requests waiting for their turn or being sent
+        self.queued = 0
+        self.stats = {"paced": 0, "sent": 0, "retried": 0, "failed": 0, "max_queued": 0,
+                      "wait_total": 0.0, "wait_max": 0.0}
+
+    def get_stats(self) -> Dict:
+        """Sent, retried and failed counts, queue depth and wait times in seconds"""
+        paced = self.stats["paced"]
+        return dict(self.stats, queued=self.queued, lanes=len(self.lanes),
+                    wait_mean=self.stats["wait_total"] / paced if paced else 0.0)
+
+    async def _wait_slot(self, chat_id: Optional[Union[int, str]]):
+        """Wait for a slot in the chat's bucket, then in the global one"""
+        if chat_id is not None:
+            limit = self.group_limit if is_group(chat_id) else self.chat_limit
+            delay = self.chat_buckets.get(chat_id, *limit, self.clock()).reserve(self.clock())
+            if delay > 0:
+                await asyncio.sleep(delay)
+        delay = self.global_bucket.reserve(self.clock())
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _send(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                    method: TelegramMethod[TelegramType], chat_id: Optional[Union[int, str]],
+                    started: float) -> Response[TelegramType]:
+        await self._wait_slot(chat_id)
+        waited = self.clock() - started
+        self.stats["paced"] += 1
+        self.stats["wait_total"] += waited
+        self.stats["wait_max"] = max(self.stats["wait_max"], waited)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    self.stats["failed"] += 1
+                    logger.error(f"{type(method).__name__} to {chat_id} still limited after {attempt} retries")
+                    raise
+                self.stats["retried"] += 1
+                logger.warning(f"{type(method).__name__} to {chat_id} limited, retrying in {e.retry_after}s")
+                # Telegram counted the rejected request too: a new slot after the pause
+                await asyncio.sleep(e.retry_after)
+                await self._wait_slot(chat_id)
+            else:
+                self.stats["sent"] += 1
+                return response
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        if not type(method).__name__.startswith(PACED_PREFIXES):
+            return await make_request(bot, method)
+
+        chat_id = getattr(method, "chat_id", None)
+        started = self.clock()
+        self.queued += 1
+        self.stats["max_queued"] = max(self.stats["max_queued"], self.queued)
+        try:
+            if chat_id is None:
+                # Inline message edits: no chat to queue on, only the global limit
+                return await self._send(make_request, bot, method, None, started)
+            lane = self.lanes.get(chat_id)
+            if lane is None:
+                lane = self.lanes[chat_id] = _Lane()
+            lane.users += 1
+            try:
+                async with lane.lock:
+                    return await self._send(make_request, bot, method, chat_id, started)
+            finally:
+                lane.users -= 1
+                if not lane.users:
+                    del self.lanes[chat_id]
+        finally:
+            self.queued -= 1
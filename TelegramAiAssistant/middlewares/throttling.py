@@ -0,0 +1,168 @@
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from config import (
+    THROTTLE_USER_RATE, THROTTLE_USER_BURST, THROTTLE_ACTION_RATE, THROTTLE_ACTION_BURST,
+    THROTTLE_ACTION_LIMITS, THROTTLE_MAX_BUCKETS
+)
+from utils.callback_data import unpack
+
+logger = logging.getLogger(__name__)
+
+SLOW_DOWN_TEXT = "⏳ Stai andando troppo veloce! Riprova tra qualche secondo."
+# Distinct actions counted in dropped_by_action, the rest count as "other"
+MAX_COUNTED_ACTIONS = 256
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, int]]:
+    """Per-action (rate, burst) from "action=rate/burst,..." (THROTTLE_ACTION_LIMITS)"""
+    limits = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        action, _, limit = entry.partition("=")
+        rate, _, burst = limit.partition("/")
+        limits[action.strip()] = (float(rate), int(burst))
+    return limits
+
+def action_of(event: TelegramObject) -> str:
+    """Throttled action of an update: the callback action, the command or "message" """
+    if isinstance(event, CallbackQuery):
+        return unpack(event.data or "")[0]
+    if isinstance(event, Message) and event.text and event.text.startswith("/"):
+        return event.text.split(maxsplit=1)[0].split("@", 1)[0]
+    return "message"
+
+class TokenBucket:
+    """Token bucket refilled lazily on take()"""
+
+    __slots__ = ("tokens", "updated", "rate", "burst", "warned")
+
+    def __init__(self, rate: float, burst: int, now: float):
+        self.tokens = float(burst)
+        self.updated = now
+        self.rate = rate
+        self.burst = burst
+        # Set once the owner got the slow down answer for the current burst
+        self.warned = False
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def reserve(self, now: float) -> float:
+        """Take a token even if none is left, seconds to wait until it is due.
+
+        The balance goes negative, so callers reserving in turn get
+        successive slots at the refill rate: first come, first served.
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate) - 1
+        self.updated = now
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+class BucketCache:
+    """Bucket states by key, bounded: the least recently used key is dropped past max_size.
+
+    A dropped key starts again from a full bucket, so memory stays flat
+    with many users and only users idle long enough to be evicted lose
+    their state.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.buckets: "OrderedDict[Hashable, TokenBucket]" = OrderedDict()
+        self.evicted = 0
+
+    def get(self, key: Hashable, rate: float, burst: int, now: float) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            self.buckets.move_to_end(key)
+            return bucket
+        bucket = self.buckets[key] = TokenBucket(rate, burst, now)
+        if len(self.buckets) > self.max_size:
+            self.buckets.popitem(last=False)
+            self.evicted += 1
+        return bucket
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Outer middleware dropping messages and callback queries of users over their rate.
+
+    Every update takes a token from the user's bucket and from the bucket
+    of the user and its action (callback action or command, see
+    action_of()), so spamming one button is limited tighter than using the
+    bot normally. Admins are never throttled. The first dropped update of
+    a burst gets a "slow down" answer, the following ones are dropped
+    silently until an update goes through again.
+    """
+
+    def __init__(self, exempt: Iterable[int] = (),
+                 user_rate: float = THROTTLE_USER_RATE, user_burst: int = THROTTLE_USER_BURST,
+                 action_rate: float = THROTTLE_ACTION_RATE, action_burst: int = THROTTLE_ACTION_BURST,
+                 action_limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 max_buckets: int = THROTTLE_MAX_BUCKETS, clock: Callable[[], float] = time.monotonic):
+        self.exempt = frozenset(exempt)
+        self.user_limit = (user_rate, user_burst)
+        self.action_limit = (action_rate, action_burst)
+        self.action_limits = parse_limits(THROTTLE_ACTION_LIMITS) if action_limits is None else action_limits
+        self.user_buckets = BucketCache(max_buckets)
+        self.action_buckets = BucketCache(max_buckets)
+        self.clock = clock
+        self.stats = {"allowed": 0, "dropped_user": 0, "dropped_action": 0}
+        self.dropped_by_action: Dict[str, int] = {}
+
+    def setup(self, dp: Dispatcher):
+        dp.message.outer_middleware(self)
+        dp.callback_query.outer_middleware(self)
+
+    def get_stats(self) -> Dict:
+        """Allowed and dropped update counters, dropped per action and bucket evictions"""
+        return dict(
+            self.stats,
+            evicted=self.user_buckets.evicted + self.action_buckets.evicted,
+            buckets=len(self.user_buckets.buckets) + len(self.action_buckets.buckets),
+            dropped_by_action=dict(self.dropped_by_action)
+        )
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is None or user.id in self.exempt:
+            return await handler(event, data)
+
+        action = action_of(event)
+        now = self.clock()
+        user_bucket = self.user_buckets.get(user.id, *self.user_limit, now)
+        action_limit = self.action_limits.get(action, self.action_limit)
+        if not user_bucket.take(now):
+            dropped = "dropped_user"
+        elif not self.action_buckets.get((user.id, action), *action_limit, now).take(now):
+            dropped = "dropped_action"
+        else:
+            self.stats["allowed"] += 1
+            user_bucket.warned = False
+            return await handler(event, data)
+
+        self.stats[dropped] += 1
+        if action not in self.dropped_by_action and len(self.dropped_by_action) >= MAX_COUNTED_ACTIONS:
+            action = "other"
+        self.dropped_by_action[action] = self.dropped_by_action.get(action, 0) + 1
+        if not user_bucket.warned:
+            user_bucket.warned = True
+            logger.info(f"Throttling user {user.id} on {action}")
+            await self.slow_down(event)
+        return None
+
+    async def slow_down(self, event: TelegramObject):
+        try:
+            if isinstance(event, CallbackQuery):
+                await event.answer(SLOW_DOWN_TEXT)
+            elif isinstance(event, Message) and event.chat.type == "private":
+                await event.answer(SLOW_DOWN_TEXT)
+        except Exception as e:
+            logger.warning(f"Could not send slow down answer: {e}")
@@ -1,85 +1,100 @@
+import sys
 from dataclasses import dataclass
-from typing import Dict, List, Optional
-from datetime import datetime
+from typing import Dict, Optional, Tuple
 
-@dataclass
-class OrderItem:
-    """Order item model"""
+from models.record import MICROSECONDS, Record, local_minute, to_iso, to_timestamp
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return None if value is None else sys.intern(value)
+
+@dataclass(slots=True)
+class OrderItem(Record):
+    """Order item model, item and category names interned"""
     item_name: str
     item_price: int
     quantity: int
-    category: str
-    
+    category: str = ""
+    added_at: Optional[int] = None
+
+    timestamps = ("added_at",)
+
     @property
     def total_price(self) -> int:
         return self.item_price * self.quantity
-    
+
     def to_dict(self) -> Dict:
-        return {
+        data = {
             "item_name": self.item_name,
             "item_price": self.item_price,
-            "quantity": self.quantity,
-            "category": self.category
+            "category": self.category,
+            "quantity": self.quantity
         }
-    
+        if self.added_at is not None:
+            data["added_at"] = to_iso(self.added_at)
+        return data
+
     @classmethod
     def from_dict(cls, data: Dict) -> 'OrderItem':
         return cls(
-            item_name=data["item_name"],
-            item_price=data["item_price"],
-            quantity=data["quantity"],
-            category=data.get("category", "")
+            sys.intern(data["item_name"]),
+            data["item_price"],
+            data["quantity"],
+            sys.intern(data.get("category") or ""),
+            to_timestamp(data.get("added_at"))
         )
 
-@dataclass
-class Order:
-    """Order model"""
+@dataclass(slots=True)
+class Order(Record):
+    """Order model, held in memory by the database and stored as its dict"""
     id: str
     user_id: int
-    username: str
-    items: List[OrderItem]
-    status: str  # pending, preparing, ready, completed, rejected
-    created_at: datetime
+    username: Optional[str]
+    items: Tuple[OrderItem, ...]
+    total_price: int
+    status: str  # pending, preparing, ready, completed, rejected, expired
+    created_at: int  # epoch microseconds, like updated_at
     staff_message_id: Optional[int] = None
     assigned_to: Optional[int] = None
-    updated_at: Optional[datetime] = None
-    
-    @property
-    def total_price(self) -> int:
-        return sum(item.total_price for item in self.items)
-    
+    updated_at: Optional[int] = None
+
+    timestamps = ("created_at", "updated_at")
+
     @property
     def total_items(self) -> int:
         return sum(item.quantity for item in self.items)
-    
+
+    @property
+    def created_day(self) -> str:
+        return local_minute(self.created_at // MICROSECONDS // 60)[:10]
+
     def to_dict(self) -> Dict:
-        return {
+        data = {
             "id": self.id,
             "user_id": self.user_id,
             "username": self.username,
             "items": [item.to_dict() for item in self.items],
             "total_price": self.total_price,
             "status": self.status,
-            "created_at": self.created_at.isoformat(),
+            "created_at": to_iso(self.created_at),
             "staff_message_id": self.staff_message_id,
-            "assigned_to": self.assigned_to,
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+            "assigned_to": self.assigned_to
         }
-    
+        if self.updated_at is not None:
+            data["updated_at"] = to_iso(self.updated_at)
+        return data
+
     @classmethod
     def from_dict(cls, data: Dict) -> 'Order':
-        items = [OrderItem.from_dict(item) for item in data.get("items", [])]
-        created_at = datetime.fromisoformat(data["created_at"])
-        updated_at = datetime.fromisoformat(data["updated_at"]) if data.get("updated_at") else None
-        
+        items = tuple(OrderItem.from_dict(item) for item in data.get("items", []))
         return cls(
-            id=data["id"],
-            user_id=data["user_id"],
-            username=data["username"],
-            items=items,
-            status=data["status"],
-            created_at=created_at,
-            staff_message_id=data.get("staff_message_id"),
-            assigned_to=data.get("assigned_to"),
-            updated_at=updated_at
+            data["id"],
+            data["user_id"],
+            _intern(data.get("username")),
+            items,
+            data.get("total_price", sum(item.total_price for item in items)),
+            sys.intern(data["status"]),
+            to_timestamp(data["created_at"]),
+            data.get("staff_message_id"),
+            data.get("assigned_to"),
+            to_timestamp(data.get("updated_at"))
         )
@@ -0,0 +1,78 @@
+import time
+import dataclasses
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional
+
+# Timestamps are held as epoch microseconds, the precision of the stored ISO strings
+MICROSECONDS = 1_000_000
+
+def to_timestamp(value: Optional[str]) -> Optional[int]:
+    """Epoch microseconds of a stored ISO timestamp"""
+    if value is None:
+        return None
+    return datetime_timestamp(datetime.fromisoformat(value))
+
+def datetime_timestamp(moment: datetime) -> int:
+    """Epoch microseconds of a datetime, without float rounding"""
+    return int(moment.replace(microsecond=0).timestamp()) * MICROSECONDS + moment.microsecond
+
+@lru_cache(maxsize=4096)
+def local_minute(minute: int) -> str:
+    """Local "YYYY-MM-DDTHH:MM" of an epoch minute, cached: records share few distinct minutes"""
+    return time.strftime("%Y-%m-%dT%H:%M", time.localtime(minute * 60))
+
+def to_iso(timestamp: int) -> str:
+    """Stored ISO form of epoch microseconds, as datetime.fromtimestamp(timestamp / 1e6).isoformat()"""
+    seconds, microseconds = divmod(timestamp, MICROSECONDS)
+    iso = f"{local_minute(seconds // 60)}:{seconds % 60:02d}"
+    return f"{iso}.{microseconds:06d}" if microseconds else iso
+
+def now_timestamp() -> int:
+    return time.time_ns() // 1000
+
+class Record:
+    """Read-only dict access to a slotted record.
+
+    Handlers and storage code written against the stored dicts keep working:
+    record["field"], record.get() and `in` return the stored form, with
+    timestamps as ISO strings and unset timestamps reported as missing keys.
+    Records are replaced with updated copies (replace()), never changed in
+    place, like the dicts they stand for.
+    """
+
+    __slots__ = ()
+    # Fields holding epoch microseconds, stored as ISO strings
+    timestamps = ()
+
+    def __getitem__(self, key: str):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        value = getattr(self, key)
+        if key in self.timestamps:
+            if value is None:
+                raise KeyError(key)
+            return to_iso(value)
+        return value
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__slots__ and (key not in self.timestamps or getattr(self, key) is not None)
+
+    def keys(self) -> List[str]:
+        return [key for key in self.__slots__ if key in self]
+
+    def replace(self, **fields):
+        """Updated copy of the record"""
+        return dataclasses.replace(self, **fields)
+
+def json_default(value):
+    """json.dumps() default: records are stored as their dicts"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
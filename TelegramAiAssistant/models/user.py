@@ -0,0 +1,34 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from models.record import Record, to_iso, to_timestamp
+
+@dataclass(slots=True)
+class UserProfile(Record):
+    """User profile model, stored in config["users"] under the user id"""
+    minecraft_name: Optional[str] = None
+    username: Optional[str] = None
+    banned: bool = False
+    registered_at: Optional[int] = None  # epoch microseconds
+
+    timestamps = ("registered_at",)
+
+    def to_dict(self) -> Dict:
+        data = {}
+        if self.minecraft_name is not None:
+            data["minecraft_name"] = self.minecraft_name
+        if self.username is not None:
+            data["username"] = self.username
+        data["banned"] = self.banned
+        if self.registered_at is not None:
+            data["registered_at"] = to_iso(self.registered_at)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'UserProfile':
+        return cls(
+            data.get("minecraft_name"),
+            data.get("username"),
+            data.get("banned", False),
+            to_timestamp(data.get("registered_at"))
+        )
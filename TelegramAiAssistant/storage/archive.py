@@ -0,0 +1,149 @@
+import os
+import json
+import gzip
+import logging
+from typing import Dict, Iterator, List, Optional, Tuple
+from collections import OrderedDict, defaultdict
+
+from storage.journal import Journal
+
+logger = logging.getLogger(__name__)
+
+# Location of an archived order: month, member offset and member length
+Location = Tuple[str, int, int]
+
+class OrderArchive:
+    """Cold storage for terminal orders in compressed monthly segments.
+
+    Orders are appended to orders-YYYY-MM.jsonl.gz (by creation month), one
+    gzip member per archiver run, so segments are never rewritten. index.tsv
+    holds one "order_id<TAB>month<TAB>offset<TAB>length" line per archived
+    order and is appended only after the member is on disk, so every indexed
+    order can be read back by decompressing just its member.
+    """
+
+    # Decompressed members kept for repeated lookups
+    cache_members = 4
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.index_file = os.path.join(directory, "index.tsv")
+        os.makedirs(directory, exist_ok=True)
+        self.index: Dict[str, Location] = {}
+        # End of the last indexed member of every segment
+        self._segment_ends: Dict[str, int] = {}
+        # Bytes of index.tsv loaded so far, up to the last complete line
+        self._index_size = 0
+        self._cache: "OrderedDict[Location, Dict[str, Dict]]" = OrderedDict()
+        self._load_index()
+
+    def _load_index(self):
+        """Load the index lines appended since the last load, skipping a torn trailing line"""
+        try:
+            with open(self.index_file, 'rb') as f:
+                f.seek(self._index_size)
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            order_id, month, offset, length = line.decode('utf-8').rstrip("\n").split("\t")
+            self.index[order_id] = (month, int(offset), int(length))
+            end = int(offset) + int(length)
+            if end > self._segment_ends.get(month, 0):
+                self._segment_ends[month] = end
+            self._index_size += len(line)
+
+    def refresh(self):
+        """Pick up orders archived by another process since the last load"""
+        self._load_index()
+
+    def segment_file(self, month: str) -> str:
+        return os.path.join(self.directory, f"orders-{month}.jsonl.gz")
+
+    def __contains__(self, order_id: str) -> bool:
+        return order_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def append(self, orders: List[Dict]) -> int:
+        """Writer thread: append orders to their monthly segments and the index, returns bytes written.
+
+        Bytes past the last indexed member (left by a crash before the index
+        was written) are truncated first, so they never hide later members.
+        """
+        by_month = defaultdict(list)
+        for order in orders:
+            by_month[order["created_at"][:7]].append(order)
+
+        written = 0
+        lines = []
+        for month, records in by_month.items():
+            data = gzip.compress(b"".join(Journal.encode(record) for record in records))
+            offset = self._segment_ends.get(month, 0)
+            with open(self.segment_file(month), 'ab') as f:
+                if f.tell() != offset:
+                    logger.warning(f"Truncating {f.tell() - offset} unindexed bytes of {self.segment_file(month)}")
+                    f.truncate(offset)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            written += len(data)
+            lines.extend(f"{record['id']}\t{month}\t{offset}\t{len(data)}\n" for record in records)
+            by_month[month] = (offset, len(data))
+
+        index_data = "".join(lines).encode('utf-8')
+        with open(self.index_file, 'ab') as f:
+            if f.tell() != self._index_size:
+                f.truncate(self._index_size)
+            f.write(index_data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._index_size += len(index_data)
+        for month, (offset, length) in by_month.items():
+            self._segment_ends[month] = offset + length
+        for order in orders:
+            month = order["created_at"][:7]
+            self.index[order["id"]] = (month, *by_month[month])
+        return written + len(index_data)
+
+    def get(self, order_id: str) -> Optional[Dict]:
+        """Read an archived order from its member"""
+        location = self.index.get(order_id)
+        if location is None:
+            return None
+
+        orders = self._cache.get(location)
+        if orders is None:
+            orders = self._read_member(*location)
+            self._cache[location] = orders
+            if len(self._cache) > self.cache_members:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(location)
+        return orders.get(order_id)
+
+    def __iter__(self) -> Iterator[Dict]:
+        """Every archived order, reading each indexed member once"""
+        members = defaultdict(set)
+        for order_id, location in self.index.items():
+            members[location].add(order_id)
+        for location, order_ids in members.items():
+            for order_id, order in self._read_member(*location).items():
+                if order_id in order_ids:
+                    yield order
+
+    def _read_member(self, month: str, offset: int, length: int) -> Dict[str, Dict]:
+        """Decompress one gzip member of a segment"""
+        with open(self.segment_file(month), 'rb') as f:
+            f.seek(offset)
+            data = gzip.decompress(f.read(length))
+        orders = {}
+        for line in data.splitlines():
+            order = json.loads(line)
+            orders[order["id"]] = order
+        return orders
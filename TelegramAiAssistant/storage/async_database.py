@@ -0,0 +1,158 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Set
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from storage.base import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# StorageBackend methods that change state
+MUTATIONS = frozenset({
+    "save_menu", "add_menu_item", "remove_menu_item", "add_category", "remove_category",
+    "set_staff_group_id", "set_topic_id", "set_sponsor_channel_id",
+    "add_to_cart", "increment_cart_item", "decrement_cart_item", "remove_from_cart", "clear_cart",
+    "create_order_from_cart", "create_order", "update_order_status", "set_order_staff_message",
+    "create_sponsor_request", "update_sponsor_status", "set_sponsor_staff_message",
+    "create_application", "update_application_status", "set_application_staff_message",
+    "add_admin", "remove_admin", "set_user_minecraft_name", "ban_user", "unban_user",
+    "sweep_expired", "add_outbox_message", "update_outbox_message", "remove_outbox_message",
+})
+
+class AsyncDatabase:
+    """Awaitable facade over a StorageBackend for use inside handlers.
+
+    Every StorageBackend method is available as a coroutine with the same
+    signature. In-memory backends (memory, JSON) run the call on the loop,
+    which keeps mutations in call order, and persistence is awaited through
+    flush_async(), which serializes and writes on the backend's single writer
+    thread. Backends doing blocking I/O on every call (SQLite, shared JSON)
+    run all calls on one dedicated thread, in submission order, which also
+    runs their blocking background work if they have a call_executor; if
+    such a backend can be shared by several processes (it has sync()), it
+    also picks up their changes every sync_interval from that thread.
+
+    `async with db.batch():` groups the awaited calls in the block into one
+    backend batch (one journal append or one SQLite transaction). Mutations
+    from other tasks wait until the batch ends, so a rollback only undoes
+    the batch's own changes; keep Telegram calls outside the block.
+    """
+
+    def __init__(self, db: StorageBackend):
+        self.db = db
+        self.db.defer_flush = True
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-calls") if db.blocking_calls else None
+        if self._executor and hasattr(db, "call_executor"):
+            db.call_executor = self._executor
+        self._methods: Dict[str, object] = {}
+        self._batch_lock = asyncio.Lock()
+        self._batch_owner: Optional[asyncio.Task] = None
+        self._sync_task: Optional[asyncio.Task] = None
+
+    @property
+    def menu_data(self) -> Dict:
+        return self.db.menu_data
+
+    @property
+    def banned_users(self) -> Set[int]:
+        return self.db.banned_users
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        method = self._methods.get(name)
+        if method is None:
+            method = self._wrap(name, getattr(self.db, name))
+            self._methods[name] = method
+        return method
+
+    def _wrap(self, name: str, func):
+        if asyncio.iscoroutinefunction(func):
+            return func
+
+        if self._executor:
+            async def call(*args, **kwargs):
+                if name in MUTATIONS:
+                    await self._wait_for_batch()
+                return await self._call(lambda: func(*args, **kwargs))
+        elif name in MUTATIONS:
+            async def call(*args, **kwargs):
+                await self._wait_for_batch()
+                result = func(*args, **kwargs)
+                if self.db.needs_flush():
+                    await self.db.flush_async()
+                return result
+        else:
+            async def call(*args, **kwargs):
+                return func(*args, **kwargs)
+
+        call.__name__ = name
+        call.__doc__ = func.__doc__
+        return call
+
+    async def _call(self, func, *args):
+        """Run a backend call on the call thread, or inline for in-memory backends"""
+        if self._executor:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        return func(*args)
+
+    async def _wait_for_batch(self):
+        """Wait until no other task has a batch open"""
+        while self._batch_owner is not None and self._batch_owner is not asyncio.current_task():
+            async with self._batch_lock:
+                pass
+
+    @asynccontextmanager
+    async def batch(self):
+        """Group the mutations awaited in the block into one persisted write"""
+        task = asyncio.current_task()
+        if self._batch_owner is task:
+            yield self
+            return
+
+        async with self._batch_lock:
+            self._batch_owner = task
+            try:
+                await self._call(self.db.begin_batch)
+                try:
+                    yield self
+                except BaseException:
+                    await self._call(self.db.end_batch, False)
+                    raise
+                await self._call(self.db.end_batch)
+            finally:
+                self._batch_owner = None
+
+        if self.db.needs_flush():
+            await self.db.flush_async()
+
+    def start_flusher(self):
+        self.db.start_flusher()
+        if self._executor and hasattr(self.db, "sync") and not self._sync_task:
+            self._sync_task = asyncio.create_task(self._run_sync())
+
+    async def _run_sync(self):
+        """Pick up the other processes' changes between our own calls"""
+        while True:
+            await asyncio.sleep(self.db.sync_interval)
+            try:
+                await self._call(self.db.sync)
+            except Exception as e:
+                logger.error(f"Error syncing database: {e}")
+
+    async def close(self):
+        """Close the backend and stop the call thread"""
+        if self._sync_task:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+        if self._executor:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._executor, self.db.flush)
+        # Closing may still compact on the call thread
+        await self.db.close()
+        if self._executor:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,104 @@
+import os
+import re
+import zlib
+import shutil
+import logging
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# First line of every file written by write_atomic(): checksum and length of the rest
+HEADER = b"#crc32 %08x %d\n"
+_HEADER_PATTERN = re.compile(rb"#crc32 ([0-9a-f]{8}) (\d+)\n")
+
+def generation_files(path: str, generations: int) -> List[str]:
+    """path followed by its kept older versions, newest first"""
+    return [path] + [f"{path}.{k}" for k in range(1, generations + 1)]
+
+def _fsync_directory(directory: str):
+    fd = os.open(directory or ".", os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_atomic(path: str, data: bytes, generations: int = 0) -> int:
+    """Replace path with data behind a checksum header, returns bytes written.
+
+    data goes to path.tmp, is fsynced and renamed over path, so path always
+    holds either the old or the new content in full. The replaced version
+    is kept as path.1 (hard-linked before the rename, so path never goes
+    missing) and older ones shift up to path.<generations>.
+    """
+    header = HEADER % (zlib.crc32(data), len(data))
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        # Two writes: prepending the header would copy a large shard once more
+        f.write(header)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    if generations and os.path.exists(path):
+        files = generation_files(path, generations)
+        for newer, older in zip(reversed(files[1:-1]), reversed(files[2:])):
+            if os.path.exists(newer):
+                os.replace(newer, older)
+        if os.path.exists(files[1]):
+            os.remove(files[1])
+        try:
+            os.link(path, files[1])
+        except OSError:
+            shutil.copyfile(path, files[1])
+
+    os.replace(tmp, path)
+    _fsync_directory(os.path.dirname(path))
+    return len(header) + len(data)
+
+def verify(data: bytes) -> bytes:
+    """Payload of a file written by write_atomic(), raises ValueError if it fails its checksum.
+
+    Files without a header (written before checksums were added) are
+    returned unchanged and left to the decoder to validate.
+    """
+    match = _HEADER_PATTERN.match(data)
+    if match is None:
+        if data.startswith(b"#crc32 "):
+            raise ValueError("Malformed checksum header")
+        return data
+    payload = data[match.end():]
+    if len(payload) != int(match.group(2)):
+        raise ValueError(f"Expected {int(match.group(2))} bytes, found {len(payload)}")
+    if zlib.crc32(payload) != int(match.group(1), 16):
+        raise ValueError("Checksum mismatch")
+    return payload
+
+def read_newest_valid(path: str, generations: int,
+                      decode: Optional[Callable[[bytes], object]] = None) -> Tuple[object, Optional[str]]:
+    """Decoded payload of the newest generation of path that verifies and decodes, and its file name.
+
+    Returns (None, None) when no generation exists and raises ValueError
+    when some exist but none is valid, so a damaged file is never mistaken
+    for an empty one.
+    """
+    found = False
+    for candidate in generation_files(path, generations):
+        try:
+            with open(candidate, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            continue
+        found = True
+        try:
+            payload = verify(data)
+            value = decode(payload) if decode else payload
+        except ValueError as e:
+            logger.error(f"Skipping damaged {candidate}: {e}")
+            continue
+        if candidate != path:
+            logger.warning(f"Loaded {candidate} instead of damaged {path}")
+        return value, candidate
+
+    if found:
+        raise ValueError(f"No valid generation of {path}")
+    return None, None
@@ -0,0 +1,124 @@
+from typing import ContextManager, Dict, List, Optional, Protocol, Set, Tuple
+from datetime import date, datetime
+
+from models.user import UserProfile
+
+class StorageBackend(Protocol):
+    """Storage API used by the handlers.
+
+    Implemented by storage.memory.MemoryDatabase, database.Database (JSON
+    files) and storage.sqlite_database.SqliteDatabase.
+    """
+
+    menu_data: Dict
+    # Ids of the banned users, kept current by ban_user()/unban_user()
+    banned_users: Set[int]
+    # True when every call does blocking I/O (see storage.async_database)
+    blocking_calls: bool
+    # When True, mutations never flush inline and the caller awaits flush_async()
+    defer_flush: bool
+
+    # Persistence lifecycle
+    def flush(self): ...
+    async def flush_async(self): ...
+    def needs_flush(self) -> bool: ...
+    def is_dirty(self) -> bool: ...
+    def get_persistence_stats(self) -> Dict: ...
+    def start_flusher(self): ...
+    async def close(self): ...
+
+    # Batches: group mutations into one persisted write, rolled back on exception
+    def batch(self) -> ContextManager: ...
+    def begin_batch(self) -> bool: ...
+    def end_batch(self, commit: bool = True): ...
+
+    # Menu management
+    def save_menu(self): ...
+    def add_menu_item(self, category: str, name: str, price: int, description: str) -> bool: ...
+    def remove_menu_item(self, category: str, item_name: str) -> bool: ...
+    def add_category(self, category_name: str) -> bool: ...
+    def remove_category(self, category_name: str) -> bool: ...
+    def get_menu(self) -> Dict: ...
+    def get_categories(self) -> List[str]: ...
+    def get_category_items(self, category: str) -> Dict: ...
+    # Menu ids (see storage.indexes.MenuIndex), used in callback_data
+    def get_category_ids(self) -> Dict[str, int]: ...
+    def get_category_by_id(self, category_id: int) -> Optional[str]: ...
+    def get_menu_item_by_id(self, item_id: int) -> Optional[Tuple[str, str]]: ...
+
+    # Staff group management
+    def get_staff_group_id(self) -> Optional[int]: ...
+    def set_staff_group_id(self, group_id: int): ...
+    def get_topic_id(self, topic_name: str) -> Optional[int]: ...
+    def set_topic_id(self, topic_name: str, topic_id: int): ...
+    def set_sponsor_channel_id(self, channel_id: int): ...
+    def get_sponsor_channel_id(self) -> Optional[int]: ...
+
+    # Cart management
+    def get_user_cart(self, user_id: int) -> List[Dict]: ...
+    def add_to_cart(self, user_id: int, item_name: str, item_price: int, category: str): ...
+    def increment_cart_item(self, user_id: int, item_name: str) -> int: ...
+    def decrement_cart_item(self, user_id: int, item_name: str) -> int: ...
+    def remove_from_cart(self, user_id: int, item_name: str): ...
+    def clear_cart(self, user_id: int): ...
+    def get_cart_total(self, user_id: int) -> int: ...
+    def get_cart_count(self, user_id: int) -> int: ...
+
+    # Order management
+    def create_order_from_cart(self, user_id: int, username: str) -> Optional[str]: ...
+    def create_order(self, user_id: int, username: str, item_name: str, item_price: int) -> str: ...
+    def get_order(self, order_id: str) -> Optional[Dict]: ...
+    def update_order_status(self, order_id: str, status: str, staff_user_id: Optional[int] = None): ...
+    def set_order_staff_message(self, order_id: str, message_id: int): ...
+
+    # Sponsor management
+    def create_sponsor_request(self, user_id: int, username: str, message: str,
+                               original_message_id: int = None, original_chat_id: int = None) -> str: ...
+    def get_sponsor_request(self, sponsor_id: str) -> Optional[Dict]: ...
+    def update_sponsor_status(self, sponsor_id: str, status: str): ...
+    def set_sponsor_staff_message(self, sponsor_id: str, message_id: int): ...
+
+    # Application management
+    def create_application(self, user_id: int, username: str, full_name: str, minecraft_name: str,
+                           telegram: str, presentation: str, reason: str, experience: str,
+                           hours: str, advice: str, bad_employee: str, additional: str) -> str: ...
+    def get_application(self, app_id: str) -> Optional[Dict]: ...
+    def update_application_status(self, app_id: str, status: str): ...
+    def set_application_staff_message(self, app_id: str, message_id: int): ...
+
+    # Expiry of idle carts and pending orders
+    def sweep_expired(self, cart_ttl_hours: float, order_timeout_hours: float) -> Tuple[List[int], List[Dict]]: ...
+
+    # Outbox of serialized Telegram methods delivered by utils.outbox.Outbox
+    def add_outbox_message(self, chat_id: int, priority: int, methods: List[Dict], after: Optional[List] = None,
+                           worker: int = 0) -> str: ...
+    def get_outbox_messages(self) -> List[Dict]: ...
+    def update_outbox_message(self, outbox_id: str, **fields): ...
+    def remove_outbox_message(self, outbox_id: str): ...
+
+    # Queries served by secondary indexes
+    def get_orders_by_status(self, status: str) -> List[Dict]: ...
+    def get_orders_by_user(self, user_id: int) -> List[Dict]: ...
+    def get_orders_by_day(self, day: date) -> List[Dict]: ...
+    def get_sponsors_by_status(self, status: str) -> List[Dict]: ...
+    def get_sponsors_by_user(self, user_id: int) -> List[Dict]: ...
+    def get_sponsors_by_day(self, day: date) -> List[Dict]: ...
+    def get_applications_by_status(self, status: str) -> List[Dict]: ...
+    def get_applications_by_user(self, user_id: int) -> List[Dict]: ...
+    def get_applications_by_day(self, day: date) -> List[Dict]: ...
+
+    # Admin management
+    def add_admin(self, user_id: int) -> bool: ...
+    def remove_admin(self, user_id: int) -> bool: ...
+    def get_admins(self) -> list: ...
+    def is_admin(self, user_id: int) -> bool: ...
+    def get_current_time(self) -> datetime: ...
+
+    # User management
+    def get_user_profile(self, user_id: int) -> Optional[UserProfile]: ...
+    def set_user_minecraft_name(self, user_id: int, minecraft_name: str, username: str = None): ...
+    def get_user_minecraft_name(self, user_id: int) -> str: ...
+    def ban_user(self, user_id: int): ...
+    def unban_user(self, user_id: int): ...
+    def is_user_banned(self, user_id: int) -> bool: ...
+    def get_all_users(self) -> Dict[str, UserProfile]: ...
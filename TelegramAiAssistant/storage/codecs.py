@@ -0,0 +1,159 @@
+import re
+import json
+import zlib
+import codecs
+from typing import Dict, Iterator, Tuple
+
+from models.record import json_default
+
+# Whitespace between the tokens of a JSON document
+_WHITESPACE = re.compile(r"\s*")
+# Characters that may follow a complete value inside an object
+_DELIMITERS = frozenset(" \t\r\n,}]:")
+
+class JsonCodec:
+    """Indented JSON document, readable by hand and the historical shard format"""
+
+    name = "json"
+    extension = ".json"
+    read_size = 1024 * 1024
+
+    def dumps(self, value) -> bytes:
+        return json.dumps(value, indent=2, ensure_ascii=False, default=json_default).encode('utf-8')
+
+    def loads(self, data: bytes):
+        return json.loads(data.decode('utf-8'))
+
+    def iter_items(self, data: bytes) -> Iterator[Tuple[str, object]]:
+        """Decode a JSON object one entry at a time.
+
+        The text is decoded a slice at a time and each key and value goes
+        through the C decoder on its own, so a caller can stop between
+        entries instead of holding the interpreter for the whole document.
+        """
+        stream = _TextStream(self._decode_slices(data))
+        if stream.peek() != "{":
+            raise ValueError("Shard is not a JSON object")
+        stream.skip()
+        if stream.peek() == "}":
+            return
+        while True:
+            key = stream.value()
+            if stream.peek() != ":":
+                raise ValueError("Expected ':' after a shard key")
+            stream.skip()
+            yield key, stream.value()
+            separator = stream.peek()
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError("Expected ',' between shard entries")
+            stream.skip()
+
+    def _decode_slices(self, data: bytes) -> Iterator[str]:
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        for start in range(0, len(data), self.read_size):
+            yield decoder.decode(data[start:start + self.read_size])
+        yield decoder.decode(b"", final=True)
+
+class _TextStream:
+    """JSON tokens read from a sequence of text pieces"""
+
+    def __init__(self, pieces: Iterator[str]):
+        self.pieces = pieces
+        self.text = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder()
+
+    def _extend(self) -> bool:
+        """Append the next piece to the unread text, returns False at the end"""
+        piece = next(self.pieces, None)
+        if piece is None:
+            return False
+        self.text = self.text[self.pos:] + piece
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, "" at the end"""
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text) or not self._extend():
+                return self.text[self.pos:self.pos + 1]
+
+    def skip(self):
+        self.pos += 1
+
+    def value(self):
+        """Decode the next value, reading on while it may continue in the next piece"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if self._extend():
+                    continue
+                raise
+            # A number cut short by the end of the text ("1." of "1.5") decodes too
+            if self.text[end:end + 1] in _DELIMITERS or not self._extend():
+                self.pos = end
+                return value
+
+class CompactCodec:
+    """zlib-compressed JSON lines, one compact [key, value] entry per line.
+
+    A shard that is not an object (the admin list) is stored as a single
+    [null, value] line. Lines are decoded as the stream is decompressed,
+    so large shards can be loaded incrementally like with JsonCodec.
+    """
+
+    name = "compact"
+    extension = ".jsonl.z"
+    level = 6
+    read_size = 256 * 1024
+
+    def dumps(self, value) -> bytes:
+        entries = value.items() if isinstance(value, dict) else [(None, value)]
+        compressor = zlib.compressobj(self.level)
+        chunks = [
+            compressor.compress(json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=json_default).encode('utf-8') + b"\n")
+            for entry in entries
+        ]
+        chunks.append(compressor.flush())
+        return b"".join(chunks)
+
+    def loads(self, data: bytes):
+        entries = self.iter_items(data)
+        first = next(entries, None)
+        if first is None:
+            return {}
+        if first[0] is None:
+            return first[1]
+        value: Dict = {first[0]: first[1]}
+        value.update(entries)
+        return value
+
+    def iter_items(self, data: bytes) -> Iterator[Tuple[str, object]]:
+        decompressor = zlib.decompressobj()
+        tail = b""
+        try:
+            for start in range(0, len(data), self.read_size):
+                lines = (tail + decompressor.decompress(data[start:start + self.read_size])).split(b"\n")
+                tail = lines.pop()
+                for line in lines:
+                    key, value = json.loads(line)
+                    yield key, value
+            tail += decompressor.flush()
+        except zlib.error as e:
+            raise ValueError(f"Corrupt compressed shard: {e}") from e
+        if tail or not decompressor.eof:
+            raise ValueError("Truncated compressed shard")
+
+CODECS = {codec.name: codec for codec in (JsonCodec(), CompactCodec())}
+
+def get_codec(name: str):
+    """Snapshot codec selected by SNAPSHOT_CODEC"""
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Unknown snapshot codec: {name}") from None
@@ -0,0 +1,138 @@
+import heapq
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+# Collections of records with id, user_id, status and created_at
+INDEXED_COLLECTIONS = ("orders", "sponsors", "applications")
+
+class RecordIndex:
+    """Secondary indexes of one collection by status, user_id and creation day.
+
+    Every index maps a key to the ids of its records, kept in a dict so ids
+    stay in insertion order and can be removed in O(1). Lookups cost O(k)
+    in the number of matching records, independent of the collection size.
+    """
+
+    def __init__(self):
+        self.by_status: Dict[str, Dict[str, None]] = {}
+        self.by_user: Dict[int, Dict[str, None]] = {}
+        self.by_day: Dict[str, Dict[str, None]] = {}
+
+    @staticmethod
+    def _keys(record: Dict):
+        if isinstance(record, dict):
+            return record.get("status"), record.get("user_id"), record.get("created_at", "")[:10]
+        return record.status, record.user_id, record.created_day
+
+    def add(self, record: Dict):
+        record_id = record["id"]
+        for index, key in zip((self.by_status, self.by_user, self.by_day), self._keys(record)):
+            index.setdefault(key, {})[record_id] = None
+
+    def remove(self, record: Dict):
+        record_id = record["id"]
+        for index, key in zip((self.by_status, self.by_user, self.by_day), self._keys(record)):
+            ids = index.get(key)
+            if ids is not None:
+                ids.pop(record_id, None)
+                if not ids:
+                    del index[key]
+
+    def replace(self, old: Optional[Dict], new: Optional[Dict]):
+        """Update the indexes for a record stored in place of another"""
+        if old is not None:
+            self.remove(old)
+        if new is not None:
+            self.add(new)
+
+    def rebuild(self, records: Iterable[Dict]):
+        self.by_status.clear()
+        self.by_user.clear()
+        self.by_day.clear()
+        for record in records:
+            self.add(record)
+
+def lookup(records: Dict[str, Dict], ids: Optional[Dict[str, None]]) -> List[Dict]:
+    """Records for the ids of an index entry"""
+    if not ids:
+        return []
+    return [records[record_id] for record_id in ids]
+
+class ExpiryQueue:
+    """Min-heap of (timestamp, key) entries with at most one entry per key.
+
+    Timestamps are ISO strings (carts) or epoch microseconds (orders), both
+    sorting chronologically. A sweep pops
+    only the entries older than its cutoff, so its cost depends on what
+    expires rather than on the number of tracked keys. Entries are not
+    removed when their key changes; the sweeper re-checks every popped key.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[Union[str, int], str]] = []
+        self._keys: Set[str] = set()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, timestamp: Union[str, int], key: str):
+        if key not in self._keys:
+            self._keys.add(key)
+            heapq.heappush(self._heap, (timestamp, key))
+
+    def pop_older_than(self, cutoff: Union[str, int]) -> List[Tuple[Union[str, int], str]]:
+        """Remove and return the entries with a timestamp before cutoff"""
+        expired = []
+        while self._heap and self._heap[0][0] < cutoff:
+            entry = heapq.heappop(self._heap)
+            self._keys.discard(entry[1])
+            expired.append(entry)
+        return expired
+
+    def rebuild(self, entries: Iterable[Tuple[Union[str, int], str]]):
+        self._heap = []
+        self._keys = set()
+        for timestamp, key in entries:
+            if key not in self._keys:
+                self._keys.add(key)
+                self._heap.append((timestamp, key))
+        heapq.heapify(self._heap)
+
+class MenuIndex:
+    """Stable numeric ids of the menu categories and items, and their reverse lookup.
+
+    Ids live in the menu document: menu["category_ids"] maps category
+    names to ids, every item dict holds its own "id", and menu["next_id"]
+    is the next id to hand out. Categories and items share one sequence, so
+    an id names exactly one entry and a removed entry's id is never reused.
+    Entries without an id get one on rebuild(), in menu order; until the
+    menu is next saved the same ids are assigned again on every load.
+    """
+
+    def __init__(self):
+        self.categories: Dict[int, str] = {}
+        self.items: Dict[int, Tuple[str, str]] = {}
+
+    def rebuild(self, menu: Dict):
+        """Assign ids to new entries, drop those of removed categories and rebuild the lookup"""
+        categories = menu.get("categories", {})
+        old_ids = menu.get("category_ids", {})
+        next_id = menu.get("next_id", 1)
+        category_ids = {}
+        self.categories.clear()
+        self.items.clear()
+        for category, items in categories.items():
+            category_id = old_ids.get(category)
+            if category_id is None:
+                category_id, next_id = next_id, next_id + 1
+            category_ids[category] = category_id
+            self.categories[category_id] = category
+            for item_name, item in items.items():
+                if "id" not in item:
+                    item["id"], next_id = next_id, next_id + 1
+                self.items[item["id"]] = (category, item_name)
+        menu["category_ids"] = category_ids
+        menu["next_id"] = next_id
+
+    def category_ids(self) -> Dict[str, int]:
+        """Category ids by name, in menu order"""
+        return {category: category_id for category_id, category in self.categories.items()}
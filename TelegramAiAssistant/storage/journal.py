@@ -0,0 +1,148 @@
+import json
+import os
+import logging
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from models.record import json_default
+
+logger = logging.getLogger(__name__)
+
+class Journal:
+    """Append-only mutation journal stored as one compact JSON record per line.
+
+    Records are either {"op": "set", "path": [...], "value": ...} or
+    {"op": "del", "path": [...]}. Values are absolute, so replaying a record
+    twice gives the same result and a crash during compaction is harmless.
+    Each append is written as one line ({"op": "batch", "records": [...]}
+    when it holds several records), so a torn append is dropped as a whole.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    @staticmethod
+    def encode(record: Dict) -> bytes:
+        """Encode a record as a single journal line"""
+        return (json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=json_default) + "\n").encode('utf-8')
+
+    def append(self, records: List[Dict], sync: bool = True) -> int:
+        """Append records to the journal and fsync unless sync is False, returns bytes written"""
+        if not records:
+            return 0
+
+        if len(records) == 1:
+            data = self.encode(records[0])
+        else:
+            data = self.encode({"op": "batch", "records": records})
+        with open(self.path, 'ab') as f:
+            f.write(data)
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+        return len(data)
+
+    def sync(self):
+        """fsync records appended with sync=False"""
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def size(self) -> int:
+        """Get journal size in bytes"""
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def reset(self):
+        """Drop all records, called after a snapshot has been written"""
+        with open(self.path, 'wb') as f:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self, offset: int = 0) -> List[Dict]:
+        """Decode the journal records from a byte offset in append order.
+
+        Reading stops at the first incomplete or corrupt record (e.g. a crash
+        in the middle of an append) and the journal is truncated there, so
+        the next append starts on a clean line.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        records = []
+        pos = 0
+        while pos < len(data):
+            end = data.find(b"\n", pos)
+            if end == -1:
+                break
+            try:
+                record = json.loads(data[pos:end].decode('utf-8'))
+                check_record(record)
+            except (ValueError, KeyError, TypeError):
+                break
+            records.append(record)
+            pos = end + 1
+
+        if pos < len(data):
+            logger.warning(f"Truncating journal {self.path}: {len(data) - pos} bytes of incomplete records")
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset + pos)
+
+        return records
+
+def make_record(state: Dict, path: Sequence[str]) -> Dict:
+    """Build a record holding the current value at path in state"""
+    node = state
+    for key in path[:-1]:
+        node = node.get(key) if isinstance(node, dict) else None
+        if node is None:
+            return {"op": "del", "path": list(path)}
+
+    if isinstance(node, dict) and path[-1] in node:
+        return {"op": "set", "path": list(path), "value": node[path[-1]]}
+    return {"op": "del", "path": list(path)}
+
+def flatten(records: Iterable[Dict]) -> Iterator[Dict]:
+    """The set/del records of journal records, unpacking batches in order"""
+    for record in records:
+        if record["op"] == "batch":
+            yield from flatten(record["records"])
+        else:
+            yield record
+
+def check_record(record: Dict):
+    """Raise ValueError unless record can be applied"""
+    for inner in flatten([record]):
+        if not isinstance(inner.get("path"), list) or not inner["path"]:
+            raise ValueError(f"Journal record without path: {inner}")
+        if inner["op"] not in ("set", "del") or (inner["op"] == "set" and "value" not in inner):
+            raise ValueError(f"Malformed journal record: {inner}")
+
+def apply_record(state: Dict, record: Dict, decode: Optional[Callable] = None):
+    """Apply a single journal record to state, storing decode(path, value) if given"""
+    if record["op"] == "batch":
+        for inner in record["records"]:
+            apply_record(state, inner, decode)
+        return
+
+    path = record["path"]
+    node = state
+    for key in path[:-1]:
+        node = node.setdefault(key, {})
+
+    if record["op"] == "set":
+        node[path[-1]] = decode(tuple(path), record["value"]) if decode else record["value"]
+    elif record["op"] == "del":
+        node.pop(path[-1], None)
+    else:
+        raise ValueError(f"Unknown journal op: {record['op']}")
@@ -0,0 +1,803 @@
+import copy
+from typing import Dict, List, Optional, Set, Tuple
+from datetime import date, datetime, timedelta
+from contextlib import contextmanager
+
+from models.order import Order, OrderItem
+from models.user import UserProfile
+from models.record import Record, datetime_timestamp, now_timestamp
+from storage.indexes import INDEXED_COLLECTIONS, RecordIndex, ExpiryQueue, MenuIndex, lookup
+
+DEFAULT_CONFIG = {
+    "staff_group_id": None,
+    "topics": {},
+    "orders": {},
+    "sponsors": {},
+    "applications": {},
+    "carts": {},
+    "user_states": {},
+    "admins": [],
+    "outbox": {},
+    "order_counter": 0,
+    "sponsor_counter": 0,
+    "application_counter": 0,
+    "outbox_counter": 0
+}
+
+DEFAULT_MENU = {
+    "categories": {
+        "🍔 Panini": {
+            "Hamburger Classico": {"price": 8, "description": "Hamburger con carne, lattuga e pomodoro"},
+            "Hamburger Deluxe": {"price": 12, "description": "Hamburger con doppia carne e formaggio"},
+            "Cheeseburger": {"price": 10, "description": "Hamburger con formaggio fuso"}
+        },
+        "🥤 Bevande": {
+            "Coca Cola": {"price": 3, "description": "Bibita fresca"},
+            "Acqua": {"price": 2, "description": "Acqua naturale"},
+            "Birra": {"price": 5, "description": "Birra fresca"}
+        },
+        "🍟 Extra": {
+            "Patatine Fritte": {"price": 4, "description": "Patatine croccanti"},
+            "Onion Rings": {"price": 4, "description": "Anelli di cipolla fritti"},
+            "Salse Varie": {"price": 1, "description": "Ketchup, maionese, senape"}
+        }
+    }
+}
+
+# Undo value for a path that did not exist before the batch changed it
+_MISSING = object()
+
+# Carts are {"items": {item_name: item}, "count": ..., "total": ..., "updated_at": ...}
+EMPTY_CART = {"items": {}, "count": 0, "total": 0}
+
+# Collections held in memory as typed records and stored as their dicts
+RECORD_TYPES = {"orders": Order, "users": UserProfile}
+
+def to_record(path: Tuple[str, ...], value):
+    """Value to hold in memory for a stored value at a config path"""
+    record_type = RECORD_TYPES.get(path[0])
+    if record_type is None or not isinstance(value, dict):
+        return value
+    if len(path) == 1:
+        return {key: record_type.from_dict(entry) for key, entry in value.items()}
+    if len(path) == 2:
+        return record_type.from_dict(value)
+    return value
+
+def migrate_carts(config: Dict) -> int:
+    """Convert carts stored as item lists to the item-keyed format, returns the number converted"""
+    carts = config.get("carts", {})
+    migrated = 0
+    for user_id, cart in carts.items():
+        if isinstance(cart, list):
+            carts[user_id] = {
+                "items": {item["item_name"]: item for item in cart},
+                "count": sum(item["quantity"] for item in cart),
+                "total": sum(item["item_price"] * item["quantity"] for item in cart),
+                "updated_at": max((item.get("added_at", "") for item in cart), default="") or datetime.now().isoformat()
+            }
+            migrated += 1
+    return migrated
+
+def migrate_users(config: Dict) -> int:
+    """Merge the legacy minecraft_names map into the user profiles, returns the number of names merged"""
+    names = config.pop("minecraft_names", None) or {}
+    users = config.setdefault("users", {})
+    for user_key, minecraft_name in names.items():
+        profile = users.get(user_key)
+        if profile is None:
+            users[user_key] = UserProfile(minecraft_name)
+        elif not profile.minecraft_name:
+            users[user_key] = profile.replace(minecraft_name=minecraft_name)
+    return len(names)
+
+class MemoryDatabase:
+    """In-memory storage backend holding all domain logic.
+
+    State lives in the `config` and `menu_data` dicts, orders as the slotted
+    records of models.order (see RECORD_TYPES and to_record(), which every
+    value loaded from storage goes through). Mutations write config
+    through _set()/_delete() and report the paths they changed through
+    save_config(), which subclasses override to persist them (see
+    database.Database). Inside batch() those reports are collected and
+    persisted as a single mutation when the batch ends. _set()/_delete()
+    also maintain the secondary indexes of orders, sponsors and
+    applications (see storage.indexes) and `profiles`, the user profiles
+    keyed by integer user id that every per-update user lookup reads.
+
+    Entries stored in config (orders, carts, users, admin list, ...) are
+    replaced with updated copies and never changed in place, so a shallow
+    copy of the collections is a consistent snapshot that a writer thread
+    can serialize while the event loop keeps mutating.
+    """
+
+    # Calls only touch memory, so the async facade can run them on the loop
+    blocking_calls = False
+
+    def __init__(self):
+        self.persistence_stats: Dict[str, int] = {"mutations": 0}
+        # Set by storage.async_database.AsyncDatabase, which awaits flushes itself
+        self.defer_flush = False
+        # Values overwritten by the current batch, None outside a batch
+        self._undo: Optional[Dict[Tuple[str, ...], object]] = None
+        self.indexes = {name: RecordIndex() for name in INDEXED_COLLECTIONS}
+        # The records of config["users"] by integer user id
+        self.profiles: Dict[int, UserProfile] = {}
+        # Ids of the banned users; updated in place, so holders of the set stay current
+        self.banned_users: Set[int] = set()
+        # Carts by last change and pending orders by creation, for sweep_expired()
+        self.cart_expiry = ExpiryQueue()
+        self.order_expiry = ExpiryQueue()
+        # Numeric ids of menu categories and items, used in callback_data
+        self.menu_index = MenuIndex()
+        self.load_data()
+        self.menu_index.rebuild(self.menu_data)
+        migrate_carts(self.config)
+        migrate_users(self.config)
+        self.rebuild_indexes()
+
+    def load_data(self):
+        """Start from the default configuration and menu"""
+        self.config = copy.deepcopy(DEFAULT_CONFIG)
+        self.menu_data = copy.deepcopy(DEFAULT_MENU)
+
+    def rebuild_indexes(self):
+        """Rebuild the secondary indexes from config"""
+        for name, index in self.indexes.items():
+            index.rebuild(self.config.get(name, {}).values())
+        self.profiles = {int(user_key): profile for user_key, profile in self.config.get("users", {}).items()}
+        self.banned_users.clear()
+        self.banned_users.update(user_id for user_id, profile in self.profiles.items() if profile.banned)
+        self.cart_expiry.rebuild(
+            (cart["updated_at"], user_key) for user_key, cart in self.config.get("carts", {}).items()
+        )
+        self.order_expiry.rebuild(
+            (order.created_at, order_id) for order_id, order in self.config.get("orders", {}).items()
+            if order.status == "pending"
+        )
+
+    # Persistence hooks
+    def save_config(self, *paths: Tuple[str, ...]):
+        """Record a mutation of the given config paths, a batch counts once"""
+        if self._undo is None:
+            self.persistence_stats["mutations"] += 1
+
+    def save_menu(self):
+        """Menu lives in memory only, only its ids are refreshed"""
+        self.menu_index.rebuild(self.menu_data)
+
+    def flush(self):
+        """Nothing to flush for in-memory storage"""
+
+    async def flush_async(self):
+        """Nothing to flush for in-memory storage"""
+
+    def needs_flush(self) -> bool:
+        return False
+
+    def is_dirty(self) -> bool:
+        return False
+
+    def get_persistence_stats(self) -> Dict:
+        return dict(self.persistence_stats)
+
+    def start_flusher(self):
+        """No background flusher is needed for in-memory storage"""
+
+    async def close(self):
+        """Nothing to release for in-memory storage"""
+
+    # Batches
+    def begin_batch(self) -> bool:
+        """Start a batch, returns False when one is already open"""
+        if self._undo is not None:
+            return False
+        self._undo = {}
+        return True
+
+    def end_batch(self, commit: bool = True):
+        """Persist the batch as one mutation, or restore the values it overwrote"""
+        undo, self._undo = self._undo, None
+        if commit:
+            if undo:
+                self.save_config()
+            return
+
+        # Restored paths stay dirty, so the next write stores the pre-batch values
+        for path, value in reversed(list(undo.items())):
+            node = self.config
+            for key in path[:-1]:
+                node = node.setdefault(key, {})
+            old = node.get(path[-1])
+            if value is _MISSING:
+                node.pop(path[-1], None)
+                self._reindex(path, old, None)
+            else:
+                node[path[-1]] = value
+                self._reindex(path, old, value)
+
+    @contextmanager
+    def batch(self):
+        """Group mutations into one persisted write, rolled back on exception.
+
+        A nested batch joins the outer one. Only config is covered, menu
+        edits are still saved by save_menu().
+        """
+        started = self.begin_batch()
+        try:
+            yield self
+        except BaseException:
+            if started:
+                self.end_batch(commit=False)
+            raise
+        if started:
+            self.end_batch()
+
+    def _set(self, path: Tuple[str, ...], value):
+        """Store value at a config path, remembering the old value inside a batch"""
+        node = self.config
+        for key in path[:-1]:
+            node = node.setdefault(key, {})
+        old = node.get(path[-1], _MISSING)
+        if self._undo is not None and path not in self._undo:
+            self._undo[path] = old
+        node[path[-1]] = value
+        self._reindex(path, None if old is _MISSING else old, value)
+
+    def _delete(self, path: Tuple[str, ...]):
+        """Remove a config path, remembering the old value inside a batch"""
+        node = self.config
+        for key in path[:-1]:
+            node = node.get(key)
+            if node is None:
+                return
+        if path[-1] not in node:
+            return
+        old = node.pop(path[-1])
+        if self._undo is not None and path not in self._undo:
+            self._undo[path] = old
+        self._reindex(path, old, None)
+
+    def _reindex(self, path: Tuple[str, ...], old, new):
+        """Update the secondary indexes when a record is replaced"""
+        if len(path) != 2:
+            return
+        if path[0] in self.indexes:
+            self.indexes[path[0]].replace(old, new)
+        elif path[0] == "users":
+            user_id = int(path[1])
+            if new is None:
+                self.profiles.pop(user_id, None)
+            else:
+                self.profiles[user_id] = new
+            if new is not None and new.banned:
+                self.banned_users.add(user_id)
+            else:
+                self.banned_users.discard(user_id)
+        if new is None:
+            return
+        # Also requeues what a rolled back sweep popped: end_batch() restores through here
+        if path[0] == "carts":
+            self.cart_expiry.push(new["updated_at"], path[1])
+        elif path[0] == "orders" and new.status == "pending" and (old is None or old.status != "pending"):
+            self.order_expiry.push(new.created_at, path[1])
+
+    def _collection(self, name: str) -> Dict:
+        """Top-level config collection; orders and applications are always read through here.
+
+        Backends that load the order and application history after startup
+        override this to finish loading a collection on first use.
+        """
+        return self.config.get(name, {})
+
+    def _update_entry(self, collection: str, key: str, **fields):
+        """Replace an entry with an updated copy"""
+        entry = self.config[collection][key]
+        self._set((collection, key), entry.replace(**fields) if isinstance(entry, Record) else dict(entry, **fields))
+
+    def add_menu_item(self, category: str, name: str, price: int, description: str) -> bool:
+        """Add new item to menu"""
+        if "categories" not in self.menu_data:
+            self.menu_data["categories"] = {}
+        if category not in self.menu_data["categories"]:
+            self.menu_data["categories"][category] = {}
+
+        if name in self.menu_data["categories"][category]:
+            return False  # Item already exists
+
+        self.menu_data["categories"][category][name] = {
+            "price": price,
+            "description": description
+        }
+        self.save_menu()
+        return True
+
+    def remove_menu_item(self, category: str, item_name: str) -> bool:
+        """Remove item from menu"""
+        if "categories" not in self.menu_data or category not in self.menu_data["categories"]:
+            return False
+
+        if item_name in self.menu_data["categories"][category]:
+            del self.menu_data["categories"][category][item_name]
+            self.save_menu()
+            return True
+        return False
+
+    def add_category(self, category_name: str) -> bool:
+        """Add new category"""
+        if "categories" not in self.menu_data:
+            self.menu_data["categories"] = {}
+
+        if category_name in self.menu_data["categories"]:
+            return False  # Category already exists
+
+        self.menu_data["categories"][category_name] = {}
+        self.save_menu()
+        return True
+
+    def remove_category(self, category_name: str) -> bool:
+        """Remove category"""
+        if "categories" not in self.menu_data or category_name not in self.menu_data["categories"]:
+            return False
+
+        del self.menu_data["categories"][category_name]
+        self.save_menu()
+        return True
+
+    # Staff group management
+    def get_staff_group_id(self) -> Optional[int]:
+        return self.config.get("staff_group_id")
+
+    def set_staff_group_id(self, group_id: int):
+        self._set(("staff_group_id",), group_id)
+        self.save_config(("staff_group_id",))
+
+    def get_topic_id(self, topic_name: str) -> Optional[int]:
+        return self.config.get("topics", {}).get(topic_name)
+
+    def set_topic_id(self, topic_name: str, topic_id: int):
+        self._set(("topics", topic_name), topic_id)
+        self.save_config(("topics", topic_name))
+
+    # Menu management
+    def get_menu(self) -> Dict:
+        return self.menu_data
+
+    def get_categories(self) -> List[str]:
+        return list(self.menu_data.get("categories", {}).keys())
+
+    def get_category_items(self, category: str) -> Dict:
+        return self.menu_data.get("categories", {}).get(category, {})
+
+    def get_category_ids(self) -> Dict[str, int]:
+        return self.menu_index.category_ids()
+
+    def get_category_by_id(self, category_id: int) -> Optional[str]:
+        return self.menu_index.categories.get(category_id)
+
+    def get_menu_item_by_id(self, item_id: int) -> Optional[Tuple[str, str]]:
+        """Category and name of a menu item"""
+        return self.menu_index.items.get(item_id)
+
+    # Cart management
+    def _cart(self, user_id: int) -> Dict:
+        return self.config.get("carts", {}).get(str(user_id)) or EMPTY_CART
+
+    def _save_cart(self, user_id: int, items: Dict[str, Dict], count: int, total: int):
+        """Store a cart with its cached count and total, dropping it once empty"""
+        path = ("carts", str(user_id))
+        if items:
+            self._set(path, {"items": items, "count": count, "total": total, "updated_at": datetime.now().isoformat()})
+        else:
+            self._delete(path)
+        self.save_config(path)
+
+    def get_user_cart(self, user_id: int) -> List[Dict]:
+        """Get user's cart items"""
+        return list(self._cart(user_id)["items"].values())
+
+    def add_to_cart(self, user_id: int, item_name: str, item_price: int, category: str):
+        """Add item to user's cart"""
+        if self.increment_cart_item(user_id, item_name):
+            return
+
+        cart = self._cart(user_id)
+        items = dict(cart["items"])
+        items[item_name] = {
+            "item_name": item_name,
+            "item_price": item_price,
+            "category": category,
+            "quantity": 1,
+            "added_at": datetime.now().isoformat()
+        }
+        self._save_cart(user_id, items, cart["count"] + 1, cart["total"] + item_price)
+
+    def increment_cart_item(self, user_id: int, item_name: str) -> int:
+        """Add one more of an item already in the cart, returns its new quantity (0 if not in cart)"""
+        cart = self._cart(user_id)
+        item = cart["items"].get(item_name)
+        if item is None:
+            return 0
+
+        items = dict(cart["items"])
+        items[item_name] = dict(item, quantity=item["quantity"] + 1)
+        self._save_cart(user_id, items, cart["count"] + 1, cart["total"] + item["item_price"])
+        return item["quantity"] + 1
+
+    def decrement_cart_item(self, user_id: int, item_name: str) -> int:
+        """Remove one of an item from the cart, returns its new quantity"""
+        cart = self._cart(user_id)
+        item = cart["items"].get(item_name)
+        if item is None:
+            return 0
+
+        items = dict(cart["items"])
+        if item["quantity"] > 1:
+            items[item_name] = dict(item, quantity=item["quantity"] - 1)
+        else:
+            del items[item_name]
+        self._save_cart(user_id, items, cart["count"] - 1, cart["total"] - item["item_price"])
+        return item["quantity"] - 1
+
+    def remove_from_cart(self, user_id: int, item_name: str):
+        """Remove item from user's cart"""
+        cart = self._cart(user_id)
+        item = cart["items"].get(item_name)
+        if item is None:
+            return
+
+        items = dict(cart["items"])
+        del items[item_name]
+        self._save_cart(user_id, items, cart["count"] - item["quantity"],
+                        cart["total"] - item["item_price"] * item["quantity"])
+
+    def clear_cart(self, user_id: int):
+        """Clear user's cart"""
+        if str(user_id) in self.config.get("carts", {}):
+            self._delete(("carts", str(user_id)))
+            self.save_config(("carts", str(user_id)))
+
+    def get_cart_total(self, user_id: int) -> int:
+        """Get total price of items in cart"""
+        return self._cart(user_id)["total"]
+
+    def get_cart_count(self, user_id: int) -> int:
+        """Get total number of items in cart"""
+        return self._cart(user_id)["count"]
+
+    # Order management
+    def create_order_from_cart(self, user_id: int, username: str) -> Optional[str]:
+        """Create order from user's cart"""
+        cart = self.get_user_cart(user_id)
+        if not cart:
+            return None
+
+        with self.batch():
+            # Increment order counter for sequential numbering
+            order_number = self.config.get("order_counter", 0) + 1
+            order_id = f"{order_number}"
+            self._set(("order_counter",), order_number)
+            self._set(("orders", order_id), Order(
+                id=order_id,
+                user_id=user_id,
+                username=username,
+                items=tuple(OrderItem.from_dict(item) for item in cart),
+                total_price=self.get_cart_total(user_id),
+                status="pending",
+                created_at=now_timestamp()
+            ))
+            self.clear_cart(user_id)  # Clear cart after creating order
+            self.save_config(("order_counter",), ("orders", order_id))
+        return order_id
+
+    def create_order(self, user_id: int, username: str, item_name: str, item_price: int) -> str:
+        """Legacy method for single item orders"""
+        order_id = f"order_{user_id}_{int(datetime.now().timestamp())}"
+        order_data = Order(
+            id=order_id,
+            user_id=user_id,
+            username=username,
+            items=(OrderItem(item_name, item_price, 1),),
+            total_price=item_price,
+            status="pending",
+            created_at=now_timestamp()
+        )
+
+        self._set(("orders", order_id), order_data)
+        self.save_config(("orders", order_id))
+        return order_id
+
+    def set_sponsor_channel_id(self, channel_id: int):
+        """Set sponsor channel ID"""
+        self._set(("sponsor_channel_id",), channel_id)
+        self.save_config(("sponsor_channel_id",))
+
+    def get_sponsor_channel_id(self) -> Optional[int]:
+        """Get sponsor channel ID"""
+        return self.config.get("sponsor_channel_id")
+
+    def get_order(self, order_id: str) -> Optional[Dict]:
+        return self._collection("orders").get(order_id)
+
+    def update_order_status(self, order_id: str, status: str, staff_user_id: Optional[int] = None):
+        if order_id in self._collection("orders"):
+            fields = {"status": status, "updated_at": now_timestamp()}
+            if staff_user_id:
+                fields["assigned_to"] = staff_user_id
+            self._update_entry("orders", order_id, **fields)
+            self.save_config(("orders", order_id))
+
+    def set_order_staff_message(self, order_id: str, message_id: int):
+        if order_id in self._collection("orders"):
+            self._update_entry("orders", order_id, staff_message_id=message_id)
+            self.save_config(("orders", order_id))
+
+    # Sponsor management
+    def create_sponsor_request(self, user_id: int, username: str, message: str, original_message_id: int = None, original_chat_id: int = None) -> str:
+        # Increment sponsor counter for sequential numbering
+        sponsor_number = self.config.get("sponsor_counter", 0) + 1
+        sponsor_id = f"S{sponsor_number}"
+        sponsor_data = {
+            "id": sponsor_id,
+            "user_id": user_id,
+            "username": username,
+            "message": message,
+            "original_message_id": original_message_id,
+            "original_chat_id": original_chat_id,
+            "status": "pending",
+            "created_at": datetime.now().isoformat(),
+            "staff_message_id": None
+        }
+
+        with self.batch():
+            self._set(("sponsor_counter",), sponsor_number)
+            self._set(("sponsors", sponsor_id), sponsor_data)
+            self.save_config(("sponsor_counter",), ("sponsors", sponsor_id))
+        return sponsor_id
+
+    def get_sponsor_request(self, sponsor_id: str) -> Optional[Dict]:
+        return self.config.get("sponsors", {}).get(sponsor_id)
+
+    def update_sponsor_status(self, sponsor_id: str, status: str):
+        if sponsor_id in self.config.get("sponsors", {}):
+            self._update_entry("sponsors", sponsor_id, status=status, updated_at=datetime.now().isoformat())
+            self.save_config(("sponsors", sponsor_id))
+
+    def set_sponsor_staff_message(self, sponsor_id: str, message_id: int):
+        if sponsor_id in self.config.get("sponsors", {}):
+            self._update_entry("sponsors", sponsor_id, staff_message_id=message_id)
+            self.save_config(("sponsors", sponsor_id))
+
+    # Application management
+    def create_application(self, user_id: int, username: str, full_name: str, minecraft_name: str, 
+                         telegram: str, presentation: str, reason: str, experience: str, 
+                         hours: str, advice: str, bad_employee: str, additional: str) -> str:
+        app_number = self.config.get("application_counter", 0) + 1
+        app_id = f"A{app_number}"
+        app_data = {
+            "id": app_id,
+            "user_id": user_id,
+            "username": username,
+            "full_name": full_name,
+            "minecraft_name": minecraft_name,
+            "telegram": telegram,
+            "presentation": presentation,
+            "reason": reason,
+            "experience": experience,
+            "hours": hours,
+            "advice": advice,
+            "bad_employee": bad_employee,
+            "additional": additional,
+            "status": "pending",
+            "created_at": datetime.now().isoformat(),
+            "staff_message_id": None
+        }
+
+        with self.batch():
+            self._set(("application_counter",), app_number)
+            self._set(("applications", app_id), app_data)
+            self.save_config(("application_counter",), ("applications", app_id))
+        return app_id
+
+    def get_application(self, app_id: str) -> Optional[Dict]:
+        return self._collection("applications").get(app_id)
+
+    def update_application_status(self, app_id: str, status: str):
+        if app_id in self._collection("applications"):
+            self._update_entry("applications", app_id, status=status, updated_at=datetime.now().isoformat())
+            self.save_config(("applications", app_id))
+
+    def set_application_staff_message(self, app_id: str, message_id: int):
+        if app_id in self._collection("applications"):
+            self._update_entry("applications", app_id, staff_message_id=message_id)
+            self.save_config(("applications", app_id))
+
+    # Expiry
+    def sweep_expired(self, cart_ttl_hours: float, order_timeout_hours: float) -> Tuple[List[int], List[Dict]]:
+        """Drop carts idle for cart_ttl_hours and expire orders pending for order_timeout_hours.
+
+        Only queue entries older than the cutoffs are visited, and all
+        changes are persisted as one batch. Returns the user ids of the
+        dropped carts and the expired orders.
+        """
+        now = datetime.now()
+        cart_cutoff = (now - timedelta(hours=cart_ttl_hours)).isoformat()
+        order_cutoff = datetime_timestamp(now - timedelta(hours=order_timeout_hours))
+        expired_carts, expired_orders = [], []
+
+        with self.batch():
+            for _, user_key in self.cart_expiry.pop_older_than(cart_cutoff):
+                cart = self.config.get("carts", {}).get(user_key)
+                if cart is None:
+                    continue
+                if cart["updated_at"] >= cart_cutoff:
+                    self.cart_expiry.push(cart["updated_at"], user_key)  # changed since it was queued
+                    continue
+                self._delete(("carts", user_key))
+                self.save_config(("carts", user_key))
+                expired_carts.append(int(user_key))
+
+            for _, order_id in self.order_expiry.pop_older_than(order_cutoff):
+                order = self._collection("orders").get(order_id)
+                if order is not None and order.status == "pending":
+                    self.update_order_status(order_id, "expired")
+                    expired_orders.append(self._collection("orders")[order_id])
+
+        return expired_carts, expired_orders
+
+    # Outbox of messages to send (see utils.outbox)
+    def add_outbox_message(self, chat_id: int, priority: int, methods: List[Dict], after: Optional[List] = None,
+                           worker: int = 0) -> str:
+        """Queue serialized Telegram methods for chat_id, join a batch to store them with the state they report"""
+        outbox_number = self.config.get("outbox_counter", 0) + 1
+        outbox_id = f"M{outbox_number}"
+        with self.batch():
+            self._set(("outbox_counter",), outbox_number)
+            self._set(("outbox", outbox_id), {
+                "id": outbox_id,
+                "chat_id": chat_id,
+                "priority": priority,
+                "methods": methods,
+                "after": after,
+                "worker": worker,
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": datetime.now().timestamp(),
+                "sent": 0,
+                "message_id": None,
+                "error": None,
+                "created_at": datetime.now().isoformat()
+            })
+            self.save_config(("outbox_counter",), ("outbox", outbox_id))
+        return outbox_id
+
+    def get_outbox_messages(self) -> List[Dict]:
+        """Outbox messages not delivered yet, oldest first"""
+        return list(self.config.get("outbox", {}).values())
+
+    def update_outbox_message(self, outbox_id: str, **fields):
+        if outbox_id in self.config.get("outbox", {}):
+            self._update_entry("outbox", outbox_id, **fields)
+            self.save_config(("outbox", outbox_id))
+
+    def remove_outbox_message(self, outbox_id: str):
+        """Drop a delivered message"""
+        if outbox_id in self.config.get("outbox", {}):
+            self._delete(("outbox", outbox_id))
+            self.save_config(("outbox", outbox_id))
+
+    # Queries served by the secondary indexes
+    def _find(self, collection: str, index: str, key) -> List[Dict]:
+        return lookup(self._collection(collection), getattr(self.indexes[collection], index).get(key))
+
+    def get_orders_by_status(self, status: str) -> List[Dict]:
+        """Get orders with the given status"""
+        return self._find("orders", "by_status", status)
+
+    def get_orders_by_user(self, user_id: int) -> List[Dict]:
+        """Get orders placed by a user"""
+        return self._find("orders", "by_user", user_id)
+
+    def get_orders_by_day(self, day: date) -> List[Dict]:
+        """Get orders created on a day"""
+        return self._find("orders", "by_day", day.strftime("%Y-%m-%d"))
+
+    def get_sponsors_by_status(self, status: str) -> List[Dict]:
+        """Get sponsor requests with the given status"""
+        return self._find("sponsors", "by_status", status)
+
+    def get_sponsors_by_user(self, user_id: int) -> List[Dict]:
+        """Get sponsor requests sent by a user"""
+        return self._find("sponsors", "by_user", user_id)
+
+    def get_sponsors_by_day(self, day: date) -> List[Dict]:
+        """Get sponsor requests created on a day"""
+        return self._find("sponsors", "by_day", day.strftime("%Y-%m-%d"))
+
+    def get_applications_by_status(self, status: str) -> List[Dict]:
+        """Get applications with the given status"""
+        return self._find("applications", "by_status", status)
+
+    def get_applications_by_user(self, user_id: int) -> List[Dict]:
+        """Get applications sent by a user"""
+        return self._find("applications", "by_user", user_id)
+
+    def get_applications_by_day(self, day: date) -> List[Dict]:
+        """Get applications created on a day"""
+        return self._find("applications", "by_day", day.strftime("%Y-%m-%d"))
+
+    # Admin management
+    def add_admin(self, user_id: int) -> bool:
+        """Add a new admin"""
+        admins = self.config.get("admins", [])
+        if user_id not in admins:
+            self._set(("admins",), admins + [user_id])
+            self.save_config(("admins",))
+            return True
+        return False
+
+    def remove_admin(self, user_id: int) -> bool:
+        """Remove an admin"""
+        if "admins" not in self.config:
+            return False
+
+        if user_id in self.config["admins"]:
+            self._set(("admins",), [admin for admin in self.config["admins"] if admin != user_id])
+            self.save_config(("admins",))
+            return True
+        return False
+
+    def get_admins(self) -> list:
+        """Get list of admin user IDs"""
+        return self.config.get("admins", [])
+
+    def is_admin(self, user_id: int) -> bool:
+        """Check if user is admin"""
+        return user_id in self.config.get("admins", [])
+
+    def get_current_time(self) -> datetime:
+        """Get current datetime"""
+        return datetime.now()
+
+    # User management
+    def get_user_profile(self, user_id: int) -> Optional[UserProfile]:
+        """Profile of a user, banned users included; None if the user neither registered nor was ever banned"""
+        return self.profiles.get(user_id)
+
+    def _save_profile(self, user_id: int, profile: UserProfile):
+        self._set(("users", str(user_id)), profile)
+        self.save_config(("users", str(user_id)))
+
+    def set_user_minecraft_name(self, user_id: int, minecraft_name: str, username: str = None):
+        """Set user minecraft name, keeping the ban and registration date of a known user"""
+        profile = self.profiles.get(user_id)
+        if profile is None:
+            profile = UserProfile(minecraft_name, username, registered_at=now_timestamp())
+        else:
+            profile = profile.replace(
+                minecraft_name=minecraft_name,
+                username=username or profile.username,
+                registered_at=profile.registered_at or now_timestamp()
+            )
+        self._save_profile(user_id, profile)
+
+    def get_user_minecraft_name(self, user_id: int) -> str:
+        """Get user minecraft name"""
+        profile = self.profiles.get(user_id)
+        return profile.minecraft_name if profile else None
+
+    def ban_user(self, user_id: int):
+        """Ban user from bot"""
+        self._save_profile(user_id, (self.profiles.get(user_id) or UserProfile()).replace(banned=True))
+
+    def unban_user(self, user_id: int):
+        """Unban user from bot"""
+        self._save_profile(user_id, (self.profiles.get(user_id) or UserProfile()).replace(banned=False))
+
+    def is_user_banned(self, user_id: int) -> bool:
+        """Check if user is banned"""
+        return user_id in self.banned_users
+
+    def get_all_users(self) -> Dict[str, UserProfile]:
+        """Get all registered users"""
+        return self.config.get("users", {})
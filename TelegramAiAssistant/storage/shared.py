@@ -0,0 +1,300 @@
+import os
+import copy
+import fcntl
+import asyncio
+import logging
+import threading
+import functools
+from typing import Dict, Optional, Tuple
+from contextlib import contextmanager
+
+from config import SNAPSHOT_CODEC, SHARED_SYNC_INTERVAL_SECONDS
+from database import Database, SETTINGS_SHARD
+from storage.memory import migrate_carts, migrate_users, to_record
+from storage.async_database import MUTATIONS
+from storage.atomic import write_atomic, verify
+from storage.journal import apply_record, flatten
+
+logger = logging.getLogger(__name__)
+
+# Calls that run as one locked batch, on top of the StorageBackend mutations;
+# save_menu() writes the menu edited in place without syncing it first
+LOCKED_CALLS = (MUTATIONS - {"save_menu"}) | {"archive_orders"}
+
+class SharedDatabase(Database):
+    """JSON backend for several bot processes sharing one data/ directory.
+
+    Every mutation runs as a batch holding an exclusive flock() on
+    data/config.lock: begin_batch() first catches up with the changes of
+    the other processes (sync()) and end_batch() appends the batch to the
+    journal before the lock is released. Each mutation therefore works on
+    the latest state, and order and sponsor numbers stay sequential and
+    unique across processes. With SAVE_MODE=write_behind the append is
+    fsynced by the flusher, as for a single process.
+
+    Waiting for the lock blocks, so every call is a blocking call:
+    AsyncDatabase runs them, and sync() every sync_interval, on its call
+    thread, and points call_executor at it so compactions and archiving
+    run there too, never on the loop.
+
+    Compactions also run under the lock and bump data/config.generation;
+    a process seeing a new generation re-reads the shards whose files
+    changed and the new journal from its start. Between its own mutations
+    a process syncs every SHARED_SYNC_INTERVAL_SECONDS, so reads lag the
+    other processes by at most that much. Shards are always loaded eagerly.
+    """
+
+    # Mutations wait for the lock, so the async facade runs every call on its thread
+    blocking_calls = True
+
+    def __init__(self, codec: str = SNAPSHOT_CODEC):
+        os.makedirs("data", exist_ok=True)
+        self.lock_file = "data/config.lock"
+        self.generation_file = "data/config.generation"
+        self.sync_interval = SHARED_SYNC_INTERVAL_SECONDS
+        self._lock_fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        # flock() does not exclude threads of this process sharing the descriptor
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        # Thread compact_async() and archive_orders_async() run on, set by AsyncDatabase
+        self.call_executor = None
+        # State seen by the last sync: compaction generation, journal bytes, shard and menu file stats
+        self._generation = 0
+        self._journal_offset = 0
+        self._file_stats: Dict[str, Optional[Tuple[int, int]]] = {}
+        # Records appended without fsync (write_behind)
+        self._unsynced = False
+
+        with self._locked():
+            super().__init__(codec, startup_load="eager")
+
+    def load_data(self):
+        super().load_data()
+        self._mark_synced()
+        self._journal_offset = 0  # replayed by recover()
+
+    def recover(self):
+        """Replay the journal through sync(), without compacting under the other processes"""
+        self.persistence_stats.update({"syncs": 0, "synced_records": 0, "shard_reloads": 0})
+        self._catch_up()
+        # Records written before the item-keyed cart format hold list carts
+        migrate_carts(self.config)
+        if migrate_users(self.config):
+            self.rebuild_indexes()
+        if self._merge_legacy_users():
+            self.compact()  # once, by the first process started after the upgrade
+
+    # Locking
+    def _acquire(self, exclusive: bool = True):
+        self._thread_lock.acquire()
+        try:
+            if self._lock_depth == 0:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._lock_depth += 1
+
+    def _release(self):
+        self._lock_depth -= 1
+        if self._lock_depth == 0:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        """Hold the store lock, re-entrant within this process"""
+        self._acquire(exclusive)
+        try:
+            yield
+        finally:
+            self._release()
+
+    # Synchronization with the other processes
+    @staticmethod
+    def _stat(filename: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(filename)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _read_generation(self) -> int:
+        try:
+            with open(self.generation_file, 'rb') as f:
+                return int(verify(f.read()) or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _write_generation(self, generation: int):
+        write_atomic(self.generation_file, str(generation).encode('utf-8'))
+        self._generation = generation
+
+    def _shard_files(self) -> Dict[str, str]:
+        return {name: self._shard_file(name, codec) for name, codec in self._find_shards().items()}
+
+    def _mark_synced(self):
+        """Remember the files as they are now, lock held"""
+        self._generation = self._read_generation()
+        self._journal_offset = self.journal.size()
+        self._file_stats = {path: self._stat(path) for path in self._shard_files().values()}
+        self._file_stats[self.menu_file] = self._stat(self.menu_file)
+
+    def sync(self):
+        """Apply the changes other processes made since the last sync"""
+        with self._locked(exclusive=False):
+            self._catch_up()
+
+    def _catch_up(self):
+        """Apply the changes other processes made since the last sync, lock held"""
+        generation = self._read_generation()
+        if generation != self._generation:
+            # Another process compacted: everything journaled so far is in its shards
+            self._reload_changed_shards()
+            self._generation = generation
+            self._journal_offset = 0
+            self._dirty_shards.clear()
+
+        if self.journal.size() > self._journal_offset:
+            records = self.journal.read(self._journal_offset)
+            for record in flatten(records):
+                self._apply_synced(record)
+            self._journal_offset = self.journal.size()
+            self.persistence_stats["synced_records"] += len(records)
+
+        menu_stat = self._stat(self.menu_file)
+        if menu_stat != self._file_stats.get(self.menu_file):
+            self.menu_data = self.load_json(self.menu_file, self.menu_data)
+            self.menu_index.rebuild(self.menu_data)
+            self._file_stats[self.menu_file] = menu_stat
+        self.archive.refresh()
+        self.persistence_stats["syncs"] += 1
+
+    def _apply_synced(self, record: Dict):
+        """Apply a record appended by another process, keeping indexes and dirty shards current"""
+        path = tuple(record["path"])
+        collection = self.config.get(path[0])
+        old = collection.get(path[1]) if len(path) == 2 and isinstance(collection, dict) else None
+        apply_record(self.config, record, to_record)
+        new = self.config[path[0]].get(path[1]) if len(path) == 2 else None
+        self._reindex(path, old, new)
+        # The journal is only reset by a compaction writing every shard it touched
+        self._dirty_shards.add(self._shard_of(path[0]))
+
+    def _reload_changed_shards(self):
+        """Re-read the shards whose files changed since the last sync"""
+        self._shard_codecs = self._find_shards()
+        reloaded = 0
+        for name, path in self._shard_files().items():
+            stat = self._stat(path)
+            if stat == self._file_stats.get(path):
+                continue
+            if name == SETTINGS_SHARD:
+                self.config.update(self._load_shard(name, {}))
+            else:
+                self.config[name] = self._load_shard(name, {})
+            self._file_stats[path] = stat
+            reloaded += 1
+        if reloaded:
+            self.rebuild_indexes()
+            self.persistence_stats["shard_reloads"] += reloaded
+
+    # Batches hold the lock and are appended before releasing it
+    def begin_batch(self) -> bool:
+        if self._undo is not None:
+            return False
+        self._acquire()
+        try:
+            self._catch_up()
+        except BaseException:
+            self._release()
+            raise
+        return super().begin_batch()
+
+    def end_batch(self, commit: bool = True):
+        try:
+            super().end_batch(commit)
+            self._append_pending()
+        finally:
+            self._release()
+
+    def _append_pending(self):
+        """Append the committed mutations to the journal, lock held"""
+        if not self._pending_mutations:
+            return
+        records = self._take_pending()
+        written = self.journal.append(records, sync=not self.write_behind)
+        self._unsynced = self._unsynced or self.write_behind
+        self._journal_offset = self.journal.size()
+        self._record_flush(records, written)
+        if self._journal_offset >= self.compact_bytes:
+            self.compact()
+
+    def needs_flush(self) -> bool:
+        return False  # batches are appended before the lock is released
+
+    def flush(self):
+        """fsync the records appended since the last flush"""
+        if self._unsynced:
+            self._unsynced = False
+            self._writer.submit(self.journal.sync).result()
+
+    async def flush_async(self):
+        """fsync the records appended since the last flush from the writer thread"""
+        if self._unsynced:
+            self._unsynced = False
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self._writer, self.journal.sync)
+
+    # Compaction
+    def _write_snapshot(self, shards: Dict) -> int:
+        """Writer thread: write the dirty shards, bump the generation, then reset the journal.
+
+        A crash before the new generation is written leaves the journal in
+        place; after it, other processes re-read the shards and replay
+        whatever is left of the journal, which holds absolute values.
+        """
+        written = self._write_shards(shards)
+        self._write_generation(self._generation + 1)
+        self.journal.reset()
+        return written
+
+    def compact(self):
+        """Write the shards changed by any process and reset the shared journal"""
+        with self._locked():
+            self._catch_up()
+            super().compact()
+            self._mark_synced()
+
+    async def _off_loop(self, func, *args):
+        """Run a locked blocking call on call_executor, the lock is never held across an await"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.call_executor, func, *args)
+
+    async def compact_async(self):
+        await self._off_loop(self.compact)
+
+    def save_menu(self):
+        """Write the menu as edited in place under the lock, without syncing it from the file first"""
+        with self._locked():
+            self.menu_index.rebuild(self.menu_data)
+            self._write_menu(copy.deepcopy(self.menu_data))
+            self._file_stats[self.menu_file] = self._stat(self.menu_file)
+
+    async def archive_orders_async(self, max_age_days: Optional[int] = None) -> int:
+        """Archive under the lock: other processes must not archive the same orders"""
+        return await self._off_loop(self.archive_orders, max_age_days)
+
+    async def close(self):
+        await super().close()
+        os.close(self._lock_fd)
+
+def _locked_call(method):
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        with self.batch():
+            return method(self, *args, **kwargs)
+    return call
+
+for _name in LOCKED_CALLS:
+    setattr(SharedDatabase, _name, _locked_call(getattr(SharedDatabase, _name)))
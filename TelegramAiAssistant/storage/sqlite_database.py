@@ -0,0 +1,804 @@
+import os
+import json
+import copy
+import sqlite3
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+from contextlib import contextmanager
+
+from config import SHARED_SYNC_INTERVAL_SECONDS
+from models.user import UserProfile
+from models.record import to_timestamp
+from storage.memory import DEFAULT_MENU
+from storage.indexes import MenuIndex
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS topics (
+    name TEXT PRIMARY KEY,
+    topic_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cart_items (
+    user_id INTEGER NOT NULL,
+    item_name TEXT NOT NULL,
+    item_price INTEGER NOT NULL,
+    category TEXT,
+    quantity INTEGER NOT NULL,
+    added_at TEXT NOT NULL,
+    UNIQUE (user_id, item_name)
+);
+CREATE INDEX IF NOT EXISTS idx_cart_items_added_at ON cart_items (added_at);
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id);
+CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status);
+CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at);
+CREATE INDEX IF NOT EXISTS idx_orders_status_created_at ON orders (status, created_at);
+CREATE TABLE IF NOT EXISTS sponsors (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sponsors_user_id ON sponsors (user_id);
+CREATE INDEX IF NOT EXISTS idx_sponsors_status ON sponsors (status);
+CREATE INDEX IF NOT EXISTS idx_sponsors_created_at ON sponsors (created_at);
+CREATE TABLE IF NOT EXISTS applications (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_applications_user_id ON applications (user_id);
+CREATE INDEX IF NOT EXISTS idx_applications_status ON applications (status);
+CREATE INDEX IF NOT EXISTS idx_applications_created_at ON applications (created_at);
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    minecraft_name TEXT,
+    username TEXT,
+    banned INTEGER,
+    registered_at TEXT
+);
+CREATE TABLE IF NOT EXISTS admins (
+    user_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS outbox (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+"""
+
+class SqliteDatabase:
+    """SQLite implementation of storage.base.StorageBackend.
+
+    Every mutation is a single-row statement inside its own transaction
+    instead of a whole-document dump, and batch() runs several mutations in
+    one transaction. Orders, sponsors and applications keep
+    their full record as JSON in `data`, with the filterable fields copied
+    into indexed columns. The menu is small and edited in place by the admin
+    handlers, so it is kept in memory as `menu_data` and stored as one row.
+
+    Several bot processes may share the file: transactions take the write
+    lock when they begin, and sync(), run by AsyncDatabase every
+    SHARED_SYNC_INTERVAL_SECONDS, reloads the menu and the banned users when
+    another process committed since.
+    """
+
+    # Every call hits the database file, so the async facade runs them on its thread
+    blocking_calls = True
+
+    def __init__(self, db_file: str = "data/krusty_krab.db"):
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        # The connection is shared with AsyncDatabase's single call thread
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.persistence_stats = {"mutations": 0}
+        self.defer_flush = False
+        self._in_batch = False
+        self.menu_index = MenuIndex()
+        self.sync_interval = SHARED_SYNC_INTERVAL_SECONDS
+        # Ids of the banned users, kept in memory for the per-update ban check
+        self.banned_users = set()
+        self._data_version = None
+        self._menu_row = None
+        self.load_data()
+        self.sync()
+
+    def load_data(self):
+        """Load the menu document"""
+        row = self.conn.execute("SELECT value FROM settings WHERE key = 'menu'").fetchone()
+        self._menu_row = row[0] if row else None
+        self.menu_data = json.loads(row[0]) if row else copy.deepcopy(DEFAULT_MENU)
+        self.menu_index.rebuild(self.menu_data)
+
+    def sync(self):
+        """Reload the banned users and the menu if another connection committed since the last sync"""
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+        banned = {row[0] for row in self.conn.execute("SELECT user_id FROM users WHERE banned")}
+        # Updated in place: BanMiddleware holds this set
+        self.banned_users.intersection_update(banned)
+        self.banned_users.update(banned)
+        row = self.conn.execute("SELECT value FROM settings WHERE key = 'menu'").fetchone()
+        if (row[0] if row else None) != self._menu_row:
+            self.load_data()
+
+    # Persistence API shared with Database
+    def flush(self):
+        """Mutations are committed immediately, nothing to flush"""
+
+    async def flush_async(self):
+        """Mutations are committed immediately, nothing to flush"""
+
+    def needs_flush(self) -> bool:
+        return False
+
+    def is_dirty(self) -> bool:
+        return False
+
+    def get_persistence_stats(self) -> Dict:
+        return dict(self.persistence_stats)
+
+    def start_flusher(self):
+        """No background flusher is needed for SQLite"""
+
+    async def close(self):
+        """Close the database connection"""
+        self.conn.close()
+        logger.info(f"SQLite database closed: {self.get_persistence_stats()}")
+
+    # Batches
+    def begin_batch(self) -> bool:
+        """Open a transaction for a batch, returns False when one is already open"""
+        if self._in_batch:
+            return False
+        # IMMEDIATE takes the write lock now: a transaction reading before it writes
+        # would otherwise fail with SQLITE_BUSY once another process committed
+        self.conn.execute("BEGIN IMMEDIATE")
+        self._in_batch = True
+        return True
+
+    def end_batch(self, commit: bool = True):
+        """Commit or roll back the batch transaction"""
+        self._in_batch = False
+        if commit:
+            self.conn.commit()
+            self.persistence_stats["mutations"] += 1
+        else:
+            self.conn.rollback()
+            # Bans made in the batch were already applied to banned_users
+            self._data_version = None
+            self.sync()
+
+    @contextmanager
+    def batch(self):
+        """Run mutations in one transaction, rolled back on exception"""
+        started = self.begin_batch()
+        try:
+            yield self
+        except BaseException:
+            if started:
+                self.end_batch(commit=False)
+            raise
+        if started:
+            self.end_batch()
+
+    @contextmanager
+    def _transaction(self):
+        """Transaction for one mutation, or the open batch transaction"""
+        if self._in_batch:
+            yield
+            return
+        with self.batch():
+            yield
+
+    def _write(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        """Run a single mutation in its own transaction"""
+        with self._transaction():
+            return self.conn.execute(sql, params)
+
+    def _get_setting(self, key: str):
+        row = self.conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set_setting(self, key: str, value):
+        self._write(
+            "INSERT INTO settings (key, value) VALUES (?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+            (key, json.dumps(value, ensure_ascii=False))
+        )
+
+    def _next_counter(self, name: str) -> int:
+        """Atomically increment a counter, must run inside a transaction"""
+        return self.conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT (name) DO UPDATE SET value = value + 1 RETURNING value",
+            (name,)
+        ).fetchone()[0]
+
+    # Menu management
+    def save_menu(self):
+        """Save menu document"""
+        self.menu_index.rebuild(self.menu_data)
+        self._set_setting("menu", self.menu_data)
+
+    def add_menu_item(self, category: str, name: str, price: int, description: str) -> bool:
+        """Add new item to menu"""
+        categories = self.menu_data.setdefault("categories", {})
+        items = categories.setdefault(category, {})
+        if name in items:
+            return False  # Item already exists
+
+        items[name] = {"price": price, "description": description}
+        self.save_menu()
+        return True
+
+    def remove_menu_item(self, category: str, item_name: str) -> bool:
+        """Remove item from menu"""
+        items = self.menu_data.get("categories", {}).get(category)
+        if items is None or item_name not in items:
+            return False
+
+        del items[item_name]
+        self.save_menu()
+        return True
+
+    def add_category(self, category_name: str) -> bool:
+        """Add new category"""
+        categories = self.menu_data.setdefault("categories", {})
+        if category_name in categories:
+            return False  # Category already exists
+
+        categories[category_name] = {}
+        self.save_menu()
+        return True
+
+    def remove_category(self, category_name: str) -> bool:
+        """Remove category"""
+        categories = self.menu_data.get("categories", {})
+        if category_name not in categories:
+            return False
+
+        del categories[category_name]
+        self.save_menu()
+        return True
+
+    def get_menu(self) -> Dict:
+        return self.menu_data
+
+    def get_categories(self) -> List[str]:
+        return list(self.menu_data.get("categories", {}).keys())
+
+    def get_category_items(self, category: str) -> Dict:
+        return self.menu_data.get("categories", {}).get(category, {})
+
+    def get_category_ids(self) -> Dict[str, int]:
+        return self.menu_index.category_ids()
+
+    def get_category_by_id(self, category_id: int) -> Optional[str]:
+        return self.menu_index.categories.get(category_id)
+
+    def get_menu_item_by_id(self, item_id: int) -> Optional[Tuple[str, str]]:
+        """Category and name of a menu item"""
+        return self.menu_index.items.get(item_id)
+
+    # Staff group management
+    def get_staff_group_id(self) -> Optional[int]:
+        return self._get_setting("staff_group_id")
+
+    def set_staff_group_id(self, group_id: int):
+        self._set_setting("staff_group_id", group_id)
+
+    def get_topic_id(self, topic_name: str) -> Optional[int]:
+        row = self.conn.execute("SELECT topic_id FROM topics WHERE name = ?", (topic_name,)).fetchone()
+        return row[0] if row else None
+
+    def set_topic_id(self, topic_name: str, topic_id: int):
+        self._write(
+            "INSERT INTO topics (name, topic_id) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET topic_id = excluded.topic_id",
+            (topic_name, topic_id)
+        )
+
+    def set_sponsor_channel_id(self, channel_id: int):
+        """Set sponsor channel ID"""
+        self._set_setting("sponsor_channel_id", channel_id)
+
+    def get_sponsor_channel_id(self) -> Optional[int]:
+        """Get sponsor channel ID"""
+        return self._get_setting("sponsor_channel_id")
+
+    # Cart management
+    def get_user_cart(self, user_id: int) -> List[Dict]:
+        """Get user's cart items"""
+        rows = self.conn.execute(
+            "SELECT item_name, item_price, category, quantity, added_at FROM cart_items "
+            "WHERE user_id = ? ORDER BY rowid",
+            (user_id,)
+        ).fetchall()
+        return [
+            {"item_name": row[0], "item_price": row[1], "category": row[2], "quantity": row[3], "added_at": row[4]}
+            for row in rows
+        ]
+
+    def add_to_cart(self, user_id: int, item_name: str, item_price: int, category: str):
+        """Add item to user's cart"""
+        self._write(
+            "INSERT INTO cart_items (user_id, item_name, item_price, category, quantity, added_at) "
+            "VALUES (?, ?, ?, ?, 1, ?) "
+            "ON CONFLICT (user_id, item_name) DO UPDATE SET quantity = quantity + 1, added_at = excluded.added_at",
+            (user_id, item_name, item_price, category, datetime.now().isoformat())
+        )
+
+    def increment_cart_item(self, user_id: int, item_name: str) -> int:
+        """Add one more of an item already in the cart, returns its new quantity (0 if not in cart)"""
+        with self._transaction():
+            row = self.conn.execute(
+                "UPDATE cart_items SET quantity = quantity + 1, added_at = ? WHERE user_id = ? AND item_name = ? "
+                "RETURNING quantity",
+                (datetime.now().isoformat(), user_id, item_name)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def decrement_cart_item(self, user_id: int, item_name: str) -> int:
+        """Remove one of an item from the cart, returns its new quantity"""
+        with self._transaction():
+            row = self.conn.execute(
+                "UPDATE cart_items SET quantity = quantity - 1, added_at = ? WHERE user_id = ? AND item_name = ? "
+                "RETURNING quantity",
+                (datetime.now().isoformat(), user_id, item_name)
+            ).fetchone()
+            if row and row[0] <= 0:
+                self.conn.execute("DELETE FROM cart_items WHERE user_id = ? AND item_name = ?", (user_id, item_name))
+        return max(row[0], 0) if row else 0
+
+    def remove_from_cart(self, user_id: int, item_name: str):
+        """Remove item from user's cart"""
+        self._write("DELETE FROM cart_items WHERE user_id = ? AND item_name = ?", (user_id, item_name))
+
+    def clear_cart(self, user_id: int):
+        """Clear user's cart"""
+        self._write("DELETE FROM cart_items WHERE user_id = ?", (user_id,))
+
+    def get_cart_total(self, user_id: int) -> int:
+        """Get total price of items in cart"""
+        row = self.conn.execute(
+            "SELECT COALESCE(SUM(item_price * quantity), 0) FROM cart_items WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0]
+
+    def get_cart_count(self, user_id: int) -> int:
+        """Get total number of items in cart"""
+        row = self.conn.execute(
+            "SELECT COALESCE(SUM(quantity), 0) FROM cart_items WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0]
+
+    # Order management
+    def _insert_record(self, table: str, record: Dict):
+        self.conn.execute(
+            f"INSERT OR REPLACE INTO {table} (id, user_id, status, created_at, data) VALUES (?, ?, ?, ?, ?)",
+            (record["id"], record["user_id"], record["status"], record["created_at"],
+             json.dumps(record, ensure_ascii=False))
+        )
+
+    def _get_record(self, table: str, record_id: str) -> Optional[Dict]:
+        row = self.conn.execute(f"SELECT data FROM {table} WHERE id = ?", (record_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _update_status(self, table: str, record_id: str, status: str, extra: Optional[Dict] = None):
+        """Update status and updated_at of a single record"""
+        fields = {"status": status, "updated_at": datetime.now().isoformat()}
+        fields.update(extra or {})
+        json_args = []
+        for key, value in fields.items():
+            json_args.extend([f"$.{key}", value])
+        placeholders = ", ".join("?" for _ in json_args)
+        self._write(
+            f"UPDATE {table} SET status = ?, data = json_set(data, {placeholders}) WHERE id = ?",
+            (status, *json_args, record_id)
+        )
+
+    def _set_staff_message(self, table: str, record_id: str, message_id: int):
+        self._write(
+            f"UPDATE {table} SET data = json_set(data, '$.staff_message_id', ?) WHERE id = ?",
+            (message_id, record_id)
+        )
+
+    def create_order_from_cart(self, user_id: int, username: str) -> Optional[str]:
+        """Create order from user's cart"""
+        cart = self.get_user_cart(user_id)
+        if not cart:
+            return None
+
+        with self._transaction():
+            order_id = f"{self._next_counter('order_counter')}"
+            self._insert_record("orders", {
+                "id": order_id,
+                "user_id": user_id,
+                "username": username,
+                "items": cart,
+                "total_price": sum(item["item_price"] * item["quantity"] for item in cart),
+                "status": "pending",
+                "created_at": datetime.now().isoformat(),
+                "staff_message_id": None,
+                "assigned_to": None
+            })
+            self.conn.execute("DELETE FROM cart_items WHERE user_id = ?", (user_id,))
+        return order_id
+
+    def create_order(self, user_id: int, username: str, item_name: str, item_price: int) -> str:
+        """Legacy method for single item orders"""
+        order_id = f"order_{user_id}_{int(datetime.now().timestamp())}"
+        with self._transaction():
+            self._insert_record("orders", {
+                "id": order_id,
+                "user_id": user_id,
+                "username": username,
+                "items": [{"item_name": item_name, "item_price": item_price, "quantity": 1}],
+                "total_price": item_price,
+                "status": "pending",
+                "created_at": datetime.now().isoformat(),
+                "staff_message_id": None,
+                "assigned_to": None
+            })
+        return order_id
+
+    def get_order(self, order_id: str) -> Optional[Dict]:
+        return self._get_record("orders", order_id)
+
+    def update_order_status(self, order_id: str, status: str, staff_user_id: Optional[int] = None):
+        self._update_status("orders", order_id, status, {"assigned_to": staff_user_id} if staff_user_id else None)
+
+    def set_order_staff_message(self, order_id: str, message_id: int):
+        self._set_staff_message("orders", order_id, message_id)
+
+    # Sponsor management
+    def create_sponsor_request(self, user_id: int, username: str, message: str, original_message_id: int = None, original_chat_id: int = None) -> str:
+        with self._transaction():
+            sponsor_id = f"S{self._next_counter('sponsor_counter')}"
+            self._insert_record("sponsors", {
+                "id": sponsor_id,
+                "user_id": user_id,
+                "username": username,
+                "message": message,
+                "original_message_id": original_message_id,
+                "original_chat_id": original_chat_id,
+                "status": "pending",
+                "created_at": datetime.now().isoformat(),
+                "staff_message_id": None
+            })
+        return sponsor_id
+
+    def get_sponsor_request(self, sponsor_id: str) -> Optional[Dict]:
+        return self._get_record("sponsors", sponsor_id)
+
+    def update_sponsor_status(self, sponsor_id: str, status: str):
+        self._update_status("sponsors", sponsor_id, status)
+
+    def set_sponsor_staff_message(self, sponsor_id: str, message_id: int):
+        self._set_staff_message("sponsors", sponsor_id, message_id)
+
+    # Application management
+    def create_application(self, user_id: int, username: str, full_name: str, minecraft_name: str,
+                         telegram: str, presentation: str, reason: str, experience: str,
+                         hours: str, advice: str, bad_employee: str, additional: str) -> str:
+        with self._transaction():
+            app_id = f"A{self._next_counter('application_counter')}"
+            self._insert_record("applications", {
+                "id": app_id,
+                "user_id": user_id,
+                "username": username,
+                "full_name": full_name,
+                "minecraft_name": minecraft_name,
+                "telegram": telegram,
+                "presentation": presentation,
+                "reason": reason,
+                "experience": experience,
+                "hours": hours,
+                "advice": advice,
+                "bad_employee": bad_employee,
+                "additional": additional,
+                "status": "pending",
+                "created_at": datetime.now().isoformat(),
+                "staff_message_id": None
+            })
+        return app_id
+
+    def get_application(self, app_id: str) -> Optional[Dict]:
+        return self._get_record("applications", app_id)
+
+    def update_application_status(self, app_id: str, status: str):
+        self._update_status("applications", app_id, status)
+
+    def set_application_staff_message(self, app_id: str, message_id: int):
+        self._set_staff_message("applications", app_id, message_id)
+
+    # Expiry
+    def sweep_expired(self, cart_ttl_hours: float, order_timeout_hours: float) -> Tuple[List[int], List[Dict]]:
+        """Drop carts idle for cart_ttl_hours and expire orders pending for order_timeout_hours.
+
+        A cart's last change is the newest added_at of its rows, which
+        add/increment/decrement refresh. Both lookups start from an index
+        on the timestamp and run in the same write transaction as the
+        changes, so a cart or order changed by another process in between
+        is left alone.
+        """
+        now = datetime.now()
+        cart_cutoff = (now - timedelta(hours=cart_ttl_hours)).isoformat()
+        order_cutoff = (now - timedelta(hours=order_timeout_hours)).isoformat()
+
+        with self.batch():
+            expired_carts = [row[0] for row in self.conn.execute(
+                "SELECT user_id FROM cart_items "
+                "WHERE user_id IN (SELECT DISTINCT user_id FROM cart_items WHERE added_at < ?) "
+                "GROUP BY user_id HAVING MAX(added_at) < ?",
+                (cart_cutoff, cart_cutoff)
+            )]
+            expired_ids = [order["id"] for order in self._find("orders", "status = 'pending' AND created_at < ?", (order_cutoff,))]
+            self.conn.executemany("DELETE FROM cart_items WHERE user_id = ?", [(user_id,) for user_id in expired_carts])
+            for order_id in expired_ids:
+                self.update_order_status(order_id, "expired")
+            return expired_carts, [self.get_order(order_id) for order_id in expired_ids]
+
+    # Outbox of messages to send (see utils.outbox)
+    def add_outbox_message(self, chat_id: int, priority: int, methods: List[Dict], after: Optional[List] = None,
+                           worker: int = 0) -> str:
+        """Queue serialized Telegram methods for chat_id, join a batch to store them with the state they report"""
+        with self._transaction():
+            outbox_id = f"M{self._next_counter('outbox_counter')}"
+            self._insert_outbox({
+                "id": outbox_id,
+                "chat_id": chat_id,
+                "priority": priority,
+                "methods": methods,
+                "after": after,
+                "worker": worker,
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": datetime.now().timestamp(),
+                "sent": 0,
+                "message_id": None,
+                "error": None,
+                "created_at": datetime.now().isoformat()
+            })
+        return outbox_id
+
+    def _insert_outbox(self, entry: Dict):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO outbox (id, data) VALUES (?, ?)", (entry["id"], json.dumps(entry, ensure_ascii=False))
+        )
+
+    def get_outbox_messages(self) -> List[Dict]:
+        """Outbox messages not delivered yet, oldest first"""
+        return [json.loads(row[0]) for row in self.conn.execute("SELECT data FROM outbox ORDER BY rowid")]
+
+    def update_outbox_message(self, outbox_id: str, **fields):
+        with self._transaction():
+            row = self.conn.execute("SELECT data FROM outbox WHERE id = ?", (outbox_id,)).fetchone()
+            if row:
+                self.conn.execute(
+                    "UPDATE outbox SET data = ? WHERE id = ?",
+                    (json.dumps(dict(json.loads(row[0]), **fields), ensure_ascii=False), outbox_id)
+                )
+
+    def remove_outbox_message(self, outbox_id: str):
+        """Drop a delivered message"""
+        self._write("DELETE FROM outbox WHERE id = ?", (outbox_id,))
+
+    # Queries served by the table indexes
+    def _find(self, table: str, where: str, params: tuple) -> List[Dict]:
+        return [
+            json.loads(row[0])
+            for row in self.conn.execute(f"SELECT data FROM {table} WHERE {where} ORDER BY rowid", params)
+        ]
+
+    def _find_day(self, table: str, day: date) -> List[Dict]:
+        start = day.strftime("%Y-%m-%d")
+        end = (date.fromisoformat(start) + timedelta(days=1)).isoformat()
+        return self._find(table, "created_at >= ? AND created_at < ?", (start, end))
+
+    def get_orders_by_status(self, status: str) -> List[Dict]:
+        """Get orders with the given status"""
+        return self._find("orders", "status = ?", (status,))
+
+    def get_orders_by_user(self, user_id: int) -> List[Dict]:
+        """Get orders placed by a user"""
+        return self._find("orders", "user_id = ?", (user_id,))
+
+    def get_orders_by_day(self, day: date) -> List[Dict]:
+        """Get orders created on a day"""
+        return self._find_day("orders", day)
+
+    def get_sponsors_by_status(self, status: str) -> List[Dict]:
+        """Get sponsor requests with the given status"""
+        return self._find("sponsors", "status = ?", (status,))
+
+    def get_sponsors_by_user(self, user_id: int) -> List[Dict]:
+        """Get sponsor requests sent by a user"""
+        return self._find("sponsors", "user_id = ?", (user_id,))
+
+    def get_sponsors_by_day(self, day: date) -> List[Dict]:
+        """Get sponsor requests created on a day"""
+        return self._find_day("sponsors", day)
+
+    def get_applications_by_status(self, status: str) -> List[Dict]:
+        """Get applications with the given status"""
+        return self._find("applications", "status = ?", (status,))
+
+    def get_applications_by_user(self, user_id: int) -> List[Dict]:
+        """Get applications sent by a user"""
+        return self._find("applications", "user_id = ?", (user_id,))
+
+    def get_applications_by_day(self, day: date) -> List[Dict]:
+        """Get applications created on a day"""
+        return self._find_day("applications", day)
+
+    # Admin management
+    def add_admin(self, user_id: int) -> bool:
+        """Add a new admin"""
+        cursor = self._write("INSERT OR IGNORE INTO admins (user_id) VALUES (?)", (user_id,))
+        return cursor.rowcount > 0
+
+    def remove_admin(self, user_id: int) -> bool:
+        """Remove an admin"""
+        cursor = self._write("DELETE FROM admins WHERE user_id = ?", (user_id,))
+        return cursor.rowcount > 0
+
+    def get_admins(self) -> list:
+        """Get list of admin user IDs"""
+        return [row[0] for row in self.conn.execute("SELECT user_id FROM admins ORDER BY rowid")]
+
+    def is_admin(self, user_id: int) -> bool:
+        """Check if user is admin"""
+        return self.conn.execute("SELECT 1 FROM admins WHERE user_id = ?", (user_id,)).fetchone() is not None
+
+    def get_current_time(self) -> datetime:
+        """Get current datetime"""
+        return datetime.now()
+
+    # User management
+    def get_user_profile(self, user_id: int) -> Optional[UserProfile]:
+        """Profile of a user, banned users included; None if the user neither registered nor was ever banned"""
+        row = self.conn.execute(
+            "SELECT minecraft_name, username, banned, registered_at FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return self._profile(*row) if row else None
+
+    @staticmethod
+    def _profile(minecraft_name, username, banned, registered_at) -> UserProfile:
+        return UserProfile(minecraft_name, username, bool(banned), to_timestamp(registered_at))
+
+    def set_user_minecraft_name(self, user_id: int, minecraft_name: str, username: str = None):
+        """Set user minecraft name, keeping the ban and registration date of a known user"""
+        self._write(
+            "INSERT INTO users (user_id, minecraft_name, username, banned, registered_at) VALUES (?, ?, ?, 0, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET minecraft_name = excluded.minecraft_name, "
+            "username = COALESCE(excluded.username, users.username), "
+            "registered_at = COALESCE(users.registered_at, excluded.registered_at)",
+            (user_id, minecraft_name, username, self.get_current_time().isoformat())
+        )
+
+    def get_user_minecraft_name(self, user_id: int) -> str:
+        """Get user minecraft name"""
+        row = self.conn.execute("SELECT minecraft_name FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def _set_banned(self, user_id: int, banned: bool):
+        self._write(
+            "INSERT INTO users (user_id, banned) VALUES (?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET banned = excluded.banned",
+            (user_id, int(banned))
+        )
+        if banned:
+            self.banned_users.add(user_id)
+        else:
+            self.banned_users.discard(user_id)
+
+    def ban_user(self, user_id: int):
+        """Ban user from bot"""
+        self._set_banned(user_id, True)
+
+    def unban_user(self, user_id: int):
+        """Unban user from bot"""
+        self._set_banned(user_id, False)
+
+    def is_user_banned(self, user_id: int) -> bool:
+        """Check if user is banned"""
+        return user_id in self.banned_users
+
+    def get_all_users(self) -> Dict[str, UserProfile]:
+        """Get all registered users"""
+        return {
+            str(row[0]): self._profile(*row[1:]) for row in self.conn.execute(
+                "SELECT user_id, minecraft_name, username, banned, registered_at FROM users ORDER BY rowid"
+            )
+        }
+
+    # Import
+    def import_from_json(self, config: Dict, menu: Dict, archived_orders: Iterable[Dict] = ()):
+        """One-shot import of the JSON store (config, menu and archived orders) in a single transaction"""
+        with self.conn:
+            for key in ("staff_group_id", "sponsor_channel_id"):
+                if config.get(key) is not None:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, json.dumps(config[key]))
+                    )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES ('menu', ?)", (json.dumps(menu, ensure_ascii=False),)
+            )
+            for name in ("order_counter", "sponsor_counter", "application_counter", "outbox_counter"):
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?)", (name, config.get(name, 0))
+                )
+            for name, topic_id in config.get("topics", {}).items():
+                self.conn.execute("INSERT OR REPLACE INTO topics (name, topic_id) VALUES (?, ?)", (name, topic_id))
+            for user_id, cart in config.get("carts", {}).items():
+                for item in cart["items"].values():
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO cart_items (user_id, item_name, item_price, category, quantity, added_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (int(user_id), item["item_name"], item["item_price"], item.get("category"),
+                         item["quantity"], item.get("added_at") or datetime.now().isoformat())
+                    )
+            # The sqlite store has no archive: archived orders go back into the orders table
+            for order in archived_orders:
+                self._insert_record("orders", order)
+            for table in ("orders", "sponsors", "applications"):
+                for record in config.get(table, {}).values():
+                    self._insert_record(table, record if isinstance(record, dict) else record.to_dict())
+
+            minecraft_names = config.get("minecraft_names", {})
+            users = config.get("users", {})
+            for user_id in set(minecraft_names) | set(users):
+                user = users.get(user_id, {})
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO users (user_id, minecraft_name, username, banned, registered_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (int(user_id), minecraft_names.get(user_id, user.get("minecraft_name")), user.get("username"),
+                     int(user.get("banned", False)), user.get("registered_at"))
+                )
+            for user_id in config.get("admins", []):
+                self.conn.execute("INSERT OR IGNORE INTO admins (user_id) VALUES (?)", (user_id,))
+            for entry in config.get("outbox", {}).values():
+                self._insert_outbox(entry)
+
+        self.load_data()
+
+if __name__ == "__main__":
+    # One-shot import: python -m storage.sqlite_database
+    from config import SQLITE_FILE
+    from database import Database
+
+    logging.basicConfig(level=logging.INFO)
+    json_db = Database()
+    json_db.load_history()
+    sqlite_db = SqliteDatabase(SQLITE_FILE)
+    sqlite_db.import_from_json(json_db.config, json_db.menu_data, json_db.archive)
+    logger.info(
+        f"Imported {len(json_db.config.get('orders', {}))} orders ({len(json_db.archive)} archived ones besides), "
+        f"{len(json_db.config.get('sponsors', {}))} sponsors and "
+        f"{len(json_db.config.get('applications', {}))} applications into {SQLITE_FILE}"
+    )
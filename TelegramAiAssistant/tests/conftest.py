@@ -0,0 +1,26 @@
+import asyncio
+import threading
+
+import pytest
+
+from tests.fakes import FakeBotApi, serve
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Run in an empty directory: the file backends keep their data in ./data"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "data"
+
+@pytest.fixture
+def fake_api():
+    """FakeBotApi on a free local port (its `port`), served by a loop on a thread of its own"""
+    api = FakeBotApi()
+    loop = asyncio.new_event_loop()
+    runner, api.port = loop.run_until_complete(serve(api))
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    yield api
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.run_until_complete(runner.cleanup())
+    loop.close()
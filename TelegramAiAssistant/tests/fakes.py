@@ -0,0 +1,103 @@
+"""Local fake Bot API server answering like Telegram, 429s included, and synthetic updates"""
+import time
+import random
+from collections import Counter
+from typing import Dict, Tuple
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from middlewares.outbound import OutboundLimiter, is_group
+from middlewares.throttling import TokenBucket
+
+TOKEN = "123456:fake-bot-api"
+GROUP_ID = -1001
+# Telegram's limits scaled up so a burst takes seconds
+LIMITS = {"global_rate": 30, "global_burst": 30, "chat_rate": 2, "chat_burst": 2,
+          "group_rate": 10, "group_burst": 5}
+
+class FakeBotApi:
+    """sendMessage and forwardMessage endpoint enforcing LIMITS and injecting 429s.
+
+    A share `inject` of the requests within the limits is also answered 429.
+    A forwarded message is recorded as delivered text "forward <from_chat_id>/<message_id>".
+    While `down` is set every request is answered 502, like Telegram having an outage.
+    """
+
+    def __init__(self, inject: float = 0, seed: int = 1):
+        self.inject = inject
+        self.down = False
+        # Set once served
+        self.port = None
+        self.random = random.Random(seed)
+        now = time.monotonic()
+        # Buckets one token deeper than the limiter's: requests reach the
+        # server a little after their slot, some later than others
+        self.global_bucket = TokenBucket(LIMITS["global_rate"], LIMITS["global_burst"] + 1, now)
+        self.chat_buckets = {}
+        self.delivered = Counter()
+        self.rejected = Counter()
+
+    def chat_bucket(self, chat_id: int, now: float) -> TokenBucket:
+        if chat_id not in self.chat_buckets:
+            limit = ("group_rate", "group_burst") if is_group(chat_id) else ("chat_rate", "chat_burst")
+            self.chat_buckets[chat_id] = TokenBucket(LIMITS[limit[0]], LIMITS[limit[1]] + 1, now)
+        return self.chat_buckets[chat_id]
+
+    def too_many(self, reason: str) -> web.Response:
+        self.rejected[reason] += 1
+        return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                  "parameters": {"retry_after": 1}})
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        if method not in ("sendmessage", "forwardmessage"):
+            return web.json_response({"ok": False, "error_code": 404, "description": "Not Found"}, status=404)
+        if self.down:
+            self.rejected["down"] += 1
+            return web.json_response({"ok": False, "error_code": 502, "description": "Bad Gateway"}, status=502)
+        form = await request.post()
+        chat_id = int(form["chat_id"])
+        text = form["text"] if method == "sendmessage" else f"forward {form['from_chat_id']}/{form['message_id']}"
+        now = time.monotonic()
+        # Both buckets are charged, like Telegram counts every request
+        within_global = self.global_bucket.take(now)
+        within_chat = self.chat_bucket(chat_id, now).take(now)
+        if not (within_global and within_chat):
+            return self.too_many("limit")
+        if self.random.random() < self.inject:
+            return self.too_many("injected")
+        self.delivered[text] += 1
+        chat_type = "supergroup" if is_group(chat_id) else "private"
+        return web.json_response({"ok": True, "result": {
+            "message_id": sum(self.delivered.values()), "date": int(time.time()),
+            "chat": {"id": chat_id, "type": chat_type}, "text": text
+        }})
+
+async def serve(api) -> Tuple[web.AppRunner, int]:
+    """Serve api's handle() as the Bot API on a free local port"""
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+def make_bot(port: int) -> Tuple[Bot, OutboundLimiter]:
+    """Bot using the fake server on port through an OutboundLimiter"""
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{port}"))
+    limiter = OutboundLimiter(max_retries=10, **LIMITS)
+    session.middleware(limiter)
+    return Bot(token=TOKEN, session=session), limiter
+
+def start_update(update_id: int, user_id: int) -> Dict:
+    """/start sent by user_id in their private chat"""
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+    }}
@@ -0,0 +1,72 @@
+"""Bot process of tests/test_outbox.py: places orders and delivers its outbox to the fake Bot API.
+
+Usage: python -m tests.outbox_bot --backend json --port PORT [--orders 20]
+
+Each order is stored in one batch with its staff post (a message and a
+forward to the staff group, whose id is saved once sent) and the user
+notification, and reported with "created <id>" once persisted. Then the
+outbox is delivered until nothing is pending and the stored orders and
+outbox are printed as one "state <json>" line.
+"""
+import json
+import asyncio
+import argparse
+
+from aiogram.methods import ForwardMessage, SendMessage
+
+from database import create_database
+from storage.async_database import AsyncDatabase
+from tests.fakes import GROUP_ID, make_bot
+from utils.outbound_queue import OutboundQueue, STAFF, NOTIFICATION
+from utils.outbox import Outbox
+
+PRODUCT = ("Krabby Patty", 5, "🍔 Panini")
+
+async def run(backend: str, port: int, orders: int):
+    db = AsyncDatabase(create_database(backend))
+    bot, _ = make_bot(port)
+    sender = OutboundQueue()
+    outbox = Outbox(db, bot, sender)
+    db.start_flusher()
+    sender.start()
+    outbox.start()
+
+    await db.set_staff_group_id(GROUP_ID)
+    print("started", flush=True)
+    for user_id in range(1, orders + 1):
+        await db.add_to_cart(user_id, *PRODUCT)
+        async with db.batch():
+            order_id = await db.create_order_from_cart(user_id, f"user{user_id}")
+            await outbox.add(
+                STAFF,
+                SendMessage(chat_id=GROUP_ID, text=f"order {order_id}"),
+                ForwardMessage(chat_id=GROUP_ID, from_chat_id=user_id, message_id=int(order_id)),
+                after=["set_order_staff_message", order_id]
+            )
+            await outbox.add(NOTIFICATION, SendMessage(chat_id=user_id, text=f"confirmed {order_id}"))
+        await db.flush_async()
+        print(f"created {order_id}", flush=True)
+
+    while await db.get_outbox_messages():
+        await asyncio.sleep(0.1)
+    state = {
+        "orders": {order["id"]: order["staff_message_id"] for order in await db.get_orders_by_status("pending")},
+        "outbox": await db.get_outbox_messages(),
+        "stats": outbox.stats
+    }
+    print(f"state {json.dumps(state)}", flush=True)
+    await outbox.close()
+    await sender.close()
+    await db.close()
+    await bot.session.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", required=True)
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--orders", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.backend, args.port, args.orders))
+
+if __name__ == "__main__":
+    main()
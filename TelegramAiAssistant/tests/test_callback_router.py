@@ -0,0 +1,25 @@
+import pytest
+
+from utils.callback_data import pack
+from utils.callback_router import callback_router
+from utils.workers import handler_dispatcher
+
+@pytest.fixture(scope="module")
+def router():
+    return callback_router(handler_dispatcher())
+
+@pytest.mark.parametrize("action", ["ban_user", "unban_user"])
+def test_legacy_payload_reads_the_decimal_user_id(router, action):
+    route, fields = router.parse(f"{action}:123456789")
+    assert route is router.routes[action]
+    assert fields == [123456789]
+
+@pytest.mark.parametrize("action", ["ban_user", "unban_user"])
+def test_packed_payload_reads_the_base36_user_id(router, action):
+    assert pack(action, 123456789) == f"{pack(action)}:21i3v9"
+    route, fields = router.parse(pack(action, 123456789))
+    assert route is router.routes[action]
+    assert fields == [123456789]
+
+def test_malformed_legacy_id_is_not_routed(router):
+    assert router.parse("ban_user:21i3v9") == (None, [])
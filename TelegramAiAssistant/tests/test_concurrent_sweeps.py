@@ -0,0 +1,59 @@
+"""Workers sharing a store, each sweeping while staff accept orders"""
+import asyncio
+import threading
+
+import pytest
+
+from database import create_database
+from utils.workers import SHARED_BACKENDS
+
+ORDERS = 200
+
+def accept(db, order_id: str) -> bool:
+    """Accept the order if it is still pending, as one transaction"""
+    with db.batch():
+        if db.get_order(order_id)["status"] != "pending":
+            return False
+        db.update_order_status(order_id, "preparing", staff_user_id=99)
+        return True
+
+@pytest.mark.parametrize("backend", SHARED_BACKENDS)
+def test_concurrent_sweeps_never_expire_an_accepted_order(backend, data_dir):
+    customers, staff, *sweepers = [create_database(backend) for _ in range(4)]
+    accepted, swept = set(), [[] for _ in sweepers]
+    placing = threading.Event()
+    placing.set()
+
+    def sweep(db, expired):
+        while placing.is_set():
+            expired.extend(order["id"] for order in db.sweep_expired(24, -1)[1])
+        expired.extend(order["id"] for order in db.sweep_expired(24, -1)[1])
+
+    def accept_pending():
+        while placing.is_set():
+            staff.sync()
+            for order in staff.get_orders_by_status("pending"):
+                if accept(staff, order["id"]):
+                    accepted.add(order["id"])
+
+    threads = [threading.Thread(target=sweep, args=args) for args in zip(sweepers, swept)]
+    threads.append(threading.Thread(target=accept_pending))
+    for thread in threads:
+        thread.start()
+    order_ids = []
+    for user_id in range(ORDERS):
+        customers.add_to_cart(user_id, "Krabby Patty", 5, "Panini")
+        order_ids.append(customers.create_order_from_cart(user_id, f"user{user_id}"))
+    placing.clear()
+    for thread in threads:
+        thread.join()
+
+    first, second = map(set, swept)
+    assert len(first) + len(second) == len(swept[0]) + len(swept[1])
+    assert not first & second and not accepted & (first | second)
+    assert accepted | first | second == set(order_ids)
+    customers.sync()
+    statuses = {order_id: customers.get_order(order_id)["status"] for order_id in order_ids}
+    assert {order_id for order_id, status in statuses.items() if status == "preparing"} == accepted
+    for db in (customers, staff, *sweepers):
+        asyncio.run(db.close())
@@ -0,0 +1,50 @@
+import os
+
+from database import Database
+from storage.journal import Journal
+
+def cut_last_record(path: str, keep: int = 7):
+    """Truncate path inside its last line, as a crash during an append leaves it"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    start = data.rstrip(b"\n").rfind(b"\n") + 1
+    with open(path, 'r+b') as f:
+        f.truncate(start + keep)
+    return start
+
+def test_read_keeps_complete_records_of_a_cut_journal(tmp_path):
+    journal = Journal(str(tmp_path / "config.journal"))
+    journal.append([{"op": "set", "path": ["orders", "1"], "value": {"status": "pending"}}])
+    journal.append([{"op": "set", "path": ["carts", "7"], "value": {"items": {}}},
+                    {"op": "del", "path": ["carts", "8"]}])
+    journal.append([{"op": "set", "path": ["orders", "2"], "value": {"status": "pending"}}])
+    complete = cut_last_record(journal.path)
+
+    records = journal.read()
+
+    assert [record["op"] for record in records] == ["set", "batch"]
+    assert records[1]["records"][1] == {"op": "del", "path": ["carts", "8"]}
+    # The torn record is dropped, so the next append starts on a clean line
+    assert journal.size() == complete
+    journal.append([{"op": "del", "path": ["orders", "1"]}])
+    assert len(journal.read()) == 3
+
+def test_recover_keeps_every_complete_entry(data_dir):
+    db = Database()
+    db.add_to_cart(1, "Krabby Patty", 5, "Panini")
+    first = db.create_order_from_cart(1, "spongebob")
+    db.add_to_cart(2, "Kelp Shake", 3, "Bevande")
+    second = db.create_order_from_cart(2, "patrick")
+    db.update_order_status(second, "completed")
+    db.add_to_cart(3, "Coral Bits", 2, "Contorni")
+    journal = os.path.join("data", "config.journal")
+    assert os.path.getsize(journal) > 0
+    cut_last_record(journal)
+
+    recovered = Database()
+
+    assert recovered.get_order(first)["status"] == "pending"
+    assert recovered.get_order(second)["status"] == "completed"
+    assert recovered.get_user_cart(2) == []
+    # The add_to_cart that was being appended is lost as a whole
+    assert recovered.get_user_cart(3) == []
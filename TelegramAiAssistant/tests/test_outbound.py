@@ -0,0 +1,76 @@
+"""A burst like a wave of orders, sent to the fake Bot API through the outbound pacing"""
+import asyncio
+from typing import List, Tuple
+
+from aiogram import Bot
+
+from tests.fakes import GROUP_ID, make_bot
+from utils.outbound_queue import OutboundQueue, INTERACTIVE, STAFF, NOTIFICATION
+
+CHATS = 10
+
+def burst() -> List[Tuple[int, str]]:
+    """Staff posts to one group and notifications to CHATS private chats"""
+    sends = [(GROUP_ID, f"order {k}") for k in range(30)]
+    return sends + [(chat, f"notify {chat}/{k}") for chat in range(1, CHATS + 1) for k in range(4)]
+
+async def send_direct(bot: Bot, sends: List[Tuple[int, str]]) -> List:
+    return await asyncio.gather(*(bot.send_message(chat, text) for chat, text in sends), return_exceptions=True)
+
+async def send_queued(bot: Bot, sends: List[Tuple[int, str]]) -> Tuple[List, OutboundQueue]:
+    """Burst through an OutboundQueue, notifications first and interactive replies last"""
+    sender = OutboundQueue()
+    sender.start()
+    results = []
+
+    def job(chat: int, text: str):
+        async def send():
+            try:
+                results.append(await bot.send_message(chat, text))
+            except Exception as e:
+                results.append(e)
+                raise
+        return send
+
+    notifications = [(chat, text) for chat, text in sends if chat != GROUP_ID]
+    staff_posts = [(chat, text) for chat, text in sends if chat == GROUP_ID]
+    replies = [(chat, f"reply {chat}") for chat in range(1, CHATS + 1)]
+    for priority, batch in ((NOTIFICATION, notifications), (STAFF, staff_posts), (INTERACTIVE, replies)):
+        for chat, text in batch:
+            await sender.submit(priority, job(chat, text), chat_id=chat, name=text)
+    await sender.close(timeout=600)
+    return results, sender
+
+def run(fake_api, send, sends: List[Tuple[int, str]]):
+    async def main():
+        bot, limiter = make_bot(fake_api.port)
+        try:
+            return await send(bot, sends), limiter
+        finally:
+            await bot.session.close()
+    return asyncio.run(main())
+
+def assert_delivered_once(fake_api, sends: List[Tuple[int, str]], results: List):
+    assert [result for result in results if isinstance(result, Exception)] == []
+    assert [text for _, text in sends if fake_api.delivered[text] != 1] == []
+    assert sum(fake_api.delivered.values()) == len(sends)
+    # Every 429 was an injected one: the limiter kept within the server's limits
+    assert fake_api.rejected["limit"] == 0
+
+def test_limiter_delivers_a_burst_once_within_the_limits(fake_api):
+    fake_api.inject = 0.05
+    sends = burst()
+    results, limiter = run(fake_api, send_direct, sends)
+
+    assert_delivered_once(fake_api, sends, results)
+    assert fake_api.rejected["injected"] > 0
+    assert limiter.get_stats()["retried"] == fake_api.rejected["injected"]
+
+def test_queue_sends_interactive_replies_first(fake_api):
+    fake_api.inject = 0.05
+    sends = burst()
+    (results, sender), _ = run(fake_api, send_queued, sends)
+
+    assert_delivered_once(fake_api, sends + [(chat, f"reply {chat}") for chat in range(1, CHATS + 1)], results)
+    stats = sender.get_stats()
+    assert stats["interactive"]["wait_mean"] <= stats["notification"]["wait_mean"]
@@ -0,0 +1,119 @@
+import os
+import sys
+import json
+import signal
+import asyncio
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, Set, Tuple
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import ForwardMessage, SendMessage
+
+from config import OUTBOUND_WORKERS
+from storage.async_database import AsyncDatabase
+from storage.memory import MemoryDatabase
+from utils.outbound_queue import STAFF
+from utils.outbox import Outbox
+
+GROUP_ID = -100
+# Project root, for the bot processes started in a temporary directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class FailingBot:
+    """Answers the calls with increasing message ids, failing the calls of the given indexes for good"""
+
+    def __init__(self, *failing: int):
+        self.failing = failing
+        self.calls = []
+
+    async def __call__(self, method):
+        self.calls.append(method)
+        if len(self.calls) - 1 in self.failing:
+            raise TelegramBadRequest(method, "Bad Request: message to forward not found")
+        return SimpleNamespace(message_id=41 + len(self.calls))
+
+async def send_staff_post(bot: FailingBot):
+    db = AsyncDatabase(MemoryDatabase())
+    outbox = Outbox(db, bot, sender=None)
+    await db.add_to_cart(1, "Krabby Patty", 5, "Panini")
+    async with db.batch():
+        order_id = await db.create_order_from_cart(1, "user1")
+        await outbox.add(STAFF, SendMessage(chat_id=GROUP_ID, text=f"Ordine {order_id}"),
+                         ForwardMessage(chat_id=GROUP_ID, from_chat_id=1, message_id=7),
+                         after=["set_order_staff_message", order_id])
+    [entry] = await db.get_outbox_messages()
+    await outbox._send(entry)
+    return db, outbox, order_id
+
+def test_failed_follow_up_call_keeps_the_delivered_message_id():
+    db, outbox, order_id = asyncio.run(send_staff_post(FailingBot(1)))
+
+    assert db.db.get_order(order_id)["staff_message_id"] == 42
+    assert db.db.get_outbox_messages() == []
+    assert outbox.stats["failed"] == 1
+
+def test_failed_first_call_runs_no_after_call():
+    db, outbox, order_id = asyncio.run(send_staff_post(FailingBot(0)))
+
+    assert db.db.get_order(order_id)["staff_message_id"] is None
+    assert db.db.get_outbox_messages() == []
+
+def test_delivered_message_runs_its_after_call():
+    db, outbox, order_id = asyncio.run(send_staff_post(FailingBot()))
+
+    assert db.db.get_order(order_id)["staff_message_id"] == 42
+    assert outbox.stats["delivered"] == 1
+
+async def spawn(directory, backend: str, port: int, orders: int) -> asyncio.subprocess.Process:
+    """Start tests.outbox_bot with its storage in directory"""
+    env = dict(os.environ, PYTHONPATH=ROOT, SAVE_MODE="write_through",
+               OUTBOX_RETRY_BASE_SECONDS="0.5", OUTBOX_POLL_SECONDS="1")
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "tests.outbox_bot", "--backend", backend, "--port", str(port), "--orders", str(orders),
+        cwd=directory, env=env, stdout=asyncio.subprocess.PIPE
+    )
+
+async def kill_and_restart(fake_api, directory, backend: str, orders: int, kill_after: int) -> Tuple[Set[str], Dict]:
+    """Kill the bot while it places orders, restart it during an outage; the orders it reported and its final state"""
+    created = set()
+    child = await spawn(directory, backend, fake_api.port, orders)
+    while len(created) < kill_after:
+        line = (await child.stdout.readline()).decode()
+        if not line:
+            break
+        if line.startswith("created "):
+            created.add(line.split()[1])
+    child.send_signal(signal.SIGKILL)
+    await child.wait()
+
+    fake_api.down = True
+    child = await spawn(directory, backend, fake_api.port, 0)
+    await child.stdout.readline()
+    await asyncio.sleep(1.5)
+    fake_api.down = False
+    state = {}
+    async for line in child.stdout:
+        if line.startswith(b"state "):
+            state = json.loads(line[len("state "):])
+    await child.wait()
+    return created, state
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_killed_bot_delivers_the_stored_messages_after_restart(backend, fake_api, tmp_path):
+    created, state = asyncio.run(kill_and_restart(fake_api, tmp_path, backend, orders=20, kill_after=12))
+
+    stored = state["orders"]
+    assert created <= set(stored)
+    # Staff posts are paced at 10 per second: most were still stored when it was killed
+    assert state["stats"]["resumed"] > 0 and fake_api.rejected["down"] > 0
+    expected = Counter()
+    for order_id in stored:
+        expected.update([f"order {order_id}", f"forward {order_id}/{order_id}", f"confirmed {order_id}"])
+    # Nothing lost, nothing sent about an order that was not stored
+    assert set(fake_api.delivered) == set(expected)
+    assert [order_id for order_id, message_id in stored.items() if message_id is None] == []
+    assert state["outbox"] == []
+    # Only the calls in flight when it was killed may have gone out twice
+    assert sum((fake_api.delivered - expected).values()) <= OUTBOUND_WORKERS
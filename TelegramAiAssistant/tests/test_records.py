@@ -0,0 +1,31 @@
+from datetime import datetime
+
+from database import Database
+from models.order import Order
+from models.record import now_timestamp, to_iso, to_timestamp
+
+STORED = {
+    "id": "1", "user_id": 1, "username": "user1",
+    "items": [{"item_name": "Krabby Patty", "item_price": 5, "category": "Panini", "quantity": 2,
+               "added_at": "2025-07-19T18:02:03.000042"}],
+    "total_price": 10, "status": "completed", "created_at": "2025-07-19T18:05:00.123456",
+    "staff_message_id": 7, "assigned_to": None, "updated_at": "2025-07-19T18:30:00"
+}
+
+def test_stored_timestamps_round_trip_unchanged():
+    assert Order.from_dict(STORED).to_dict() == STORED
+    now = datetime.now()
+    assert to_iso(to_timestamp(now.isoformat())) == now.isoformat()
+    assert to_iso(now_timestamp())[:16] == now.isoformat()[:16]
+
+def test_written_back_order_keeps_its_microseconds(data_dir):
+    db = Database()
+    db.add_to_cart(1, "Krabby Patty", 5, "Panini")
+    order_id = db.create_order_from_cart(1, "user1")
+    created_at = db.get_order(order_id)["created_at"]
+    db.update_order_status(order_id, "preparing")
+    db.flush()
+
+    order = Database().get_order(order_id)
+    assert order["created_at"] == created_at
+    assert order["updated_at"] >= created_at
@@ -0,0 +1,38 @@
+import time
+import fcntl
+import asyncio
+import threading
+
+from storage.async_database import AsyncDatabase
+from storage.shared import SharedDatabase
+
+def test_save_menu_keeps_an_in_place_edit(data_dir):
+    first, second = SharedDatabase(), SharedDatabase()
+    first.add_category("Dolci")
+
+    # Edited in place by a handler, written over the other process's menu
+    second.menu_data["categories"]["Fritti"] = {"Coral Bits": {"price": 2, "description": "Croccanti"}}
+    second.save_menu()
+
+    assert SharedDatabase().get_category_items("Fritti")["Coral Bits"]["price"] == 2
+
+def test_calls_waiting_for_the_lock_leave_the_loop_running(data_dir):
+    db = AsyncDatabase(SharedDatabase())
+    # Another process holding the store lock for a while
+    with open("data/config.lock", "rb") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        timer = threading.Timer(0.5, fcntl.flock, (lock, fcntl.LOCK_UN))
+        timer.start()
+
+        async def run():
+            call = asyncio.create_task(db.add_to_cart(1, "Kelp Shake", 3, "Bevande"))
+            start = time.perf_counter()
+            await asyncio.sleep(0.05)
+            ticked = time.perf_counter() - start
+            await call
+            await db.close()
+            return ticked
+
+        assert asyncio.run(run()) < 0.4
+        timer.join()
+    assert SharedDatabase().get_cart_count(1) == 1
@@ -0,0 +1,17 @@
+from database import Database
+from storage.sqlite_database import SqliteDatabase
+
+def test_import_keeps_archived_orders(data_dir):
+    json_db = Database()
+    order_ids = []
+    for user_id in range(1, 4):
+        json_db.add_to_cart(user_id, "Krabby Patty", 5, "Panini")
+        order_ids.append(json_db.create_order_from_cart(user_id, f"user{user_id}"))
+    json_db.update_order_status(order_ids[0], "completed")
+    assert json_db.archive_orders(max_age_days=-1) == 1
+
+    sqlite_db = SqliteDatabase(str(data_dir / "import.db"))
+    sqlite_db.import_from_json(json_db.config, json_db.menu_data, json_db.archive)
+
+    assert [sqlite_db.get_order(order_id)["status"] for order_id in order_ids] == ["completed", "pending", "pending"]
+    assert [order["id"] for order in sqlite_db.get_orders_by_user(1)] == [order_ids[0]]
@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta
+
+from storage.sqlite_database import SqliteDatabase
+
+def test_sweep_skips_changes_committed_before_its_transaction(data_dir):
+    db_file = str(data_dir / "sweep.db")
+    sweeper, staff = SqliteDatabase(db_file), SqliteDatabase(db_file)
+    staff.add_to_cart(1, "Krabby Patty", 5, "Panini")
+    order_id = staff.create_order_from_cart(1, "user1")
+    staff.add_to_cart(2, "Kelp Shake", 3, "Bevande")
+    with staff.batch():
+        staff.conn.execute("UPDATE cart_items SET added_at = ?", ((datetime.now() - timedelta(hours=2)).isoformat(),))
+
+    # Another process accepts the order and touches the cart just before the sweep takes the write lock
+    begin_batch = sweeper.begin_batch
+    def accept_then_begin():
+        staff.update_order_status(order_id, "preparing", staff_user_id=99)
+        staff.add_to_cart(2, "Kelp Shake", 3, "Bevande")
+        sweeper.begin_batch = begin_batch
+        return begin_batch()
+    sweeper.begin_batch = accept_then_begin
+
+    assert sweeper.sweep_expired(1, -1) == ([], [])
+    assert staff.get_order(order_id)["status"] == "preparing"
+    assert staff.get_cart_count(2) == 2
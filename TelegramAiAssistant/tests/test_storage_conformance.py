@@ -0,0 +1,212 @@
+"""Behavior every StorageBackend must share, run against each of them"""
+import asyncio
+from datetime import date
+
+import pytest
+
+from database import create_database
+
+BACKENDS = ["memory", "json", "shared_json", "sqlite"]
+# Backends whose data outlives the instance
+PERSISTENT = ["json", "shared_json", "sqlite"]
+
+class Stores:
+    """Opens stores in the test's data directory, closing those left open at teardown"""
+
+    def __init__(self):
+        self.opened = []
+
+    def open(self, backend: str):
+        db = create_database(backend)
+        self.opened.append(db)
+        return db
+
+    def close(self, db):
+        self.opened.remove(db)
+        asyncio.run(db.close())
+
+@pytest.fixture
+def stores(data_dir):
+    stores = Stores()
+    yield stores
+    for db in list(stores.opened):
+        stores.close(db)
+
+@pytest.fixture(params=BACKENDS)
+def db(request, stores):
+    return stores.open(request.param)
+
+def place_order(db, user_id: int, *items) -> str:
+    for name, price in items:
+        db.add_to_cart(user_id, name, price, "Panini")
+    return db.create_order_from_cart(user_id, f"user{user_id}")
+
+def test_cart_keeps_count_and_total(db):
+    db.add_to_cart(1, "Krabby Patty", 5, "Panini")
+    db.add_to_cart(1, "Krabby Patty", 5, "Panini")
+    db.add_to_cart(1, "Kelp Shake", 3, "Bevande")
+    assert db.get_cart_count(1) == 3
+    assert db.get_cart_total(1) == 13
+    assert {item["item_name"]: item["quantity"] for item in db.get_user_cart(1)} == {"Krabby Patty": 2, "Kelp Shake": 1}
+
+    assert db.increment_cart_item(1, "Kelp Shake") == 2
+    assert db.decrement_cart_item(1, "Krabby Patty") == 1
+    assert db.increment_cart_item(1, "Coral Bits") == 0
+    assert (db.get_cart_count(1), db.get_cart_total(1)) == (3, 11)
+
+    db.remove_from_cart(1, "Kelp Shake")
+    assert (db.get_cart_count(1), db.get_cart_total(1)) == (1, 5)
+    assert db.decrement_cart_item(1, "Krabby Patty") == 0
+    assert db.get_user_cart(1) == []
+    assert (db.get_cart_count(1), db.get_cart_total(1)) == (0, 0)
+
+    db.add_to_cart(2, "Kelp Shake", 3, "Bevande")
+    db.clear_cart(2)
+    assert db.get_user_cart(2) == []
+
+def test_orders_are_numbered_and_indexed(db):
+    assert db.create_order_from_cart(1, "user1") is None
+    first = place_order(db, 1, ("Krabby Patty", 5), ("Kelp Shake", 3))
+    second = place_order(db, 2, ("Kelp Shake", 3))
+    assert (first, second) == ("1", "2")
+    assert db.get_user_cart(1) == []
+
+    order = db.get_order(first)
+    assert (order["user_id"], order["total_price"], order["status"]) == (1, 8, "pending")
+    assert sorted(item["item_name"] for item in order["items"]) == ["Kelp Shake", "Krabby Patty"]
+
+    db.update_order_status(first, "preparing", staff_user_id=99)
+    db.set_order_staff_message(first, 1234)
+    order = db.get_order(first)
+    assert (order["status"], order["assigned_to"], order["staff_message_id"]) == ("preparing", 99, 1234)
+    assert [order["id"] for order in db.get_orders_by_status("pending")] == [second]
+    assert [order["id"] for order in db.get_orders_by_status("preparing")] == [first]
+    assert [order["id"] for order in db.get_orders_by_user(1)] == [first]
+    assert sorted(order["id"] for order in db.get_orders_by_day(date.today())) == [first, second]
+    assert db.get_order("404") is None
+
+def test_failed_batch_is_rolled_back(db):
+    db.add_to_cart(1, "Krabby Patty", 5, "Panini")
+    with pytest.raises(RuntimeError):
+        with db.batch():
+            db.create_order_from_cart(1, "user1")
+            db.ban_user(1)
+            raise RuntimeError("handler failed")
+
+    assert db.get_orders_by_user(1) == []
+    assert db.get_cart_count(1) == 1
+    assert not db.is_user_banned(1)
+    assert place_order(db, 1) == "1"
+
+def test_sponsors_and_applications(db):
+    sponsor_id = db.create_sponsor_request(1, "user1", "Seguite il mio canale", 10, 20)
+    assert sponsor_id == "S1"
+    db.update_sponsor_status(sponsor_id, "approved")
+    db.set_sponsor_staff_message(sponsor_id, 55)
+    sponsor = db.get_sponsor_request(sponsor_id)
+    assert (sponsor["status"], sponsor["staff_message_id"], sponsor["original_chat_id"]) == ("approved", 55, 20)
+    assert [sponsor["id"] for sponsor in db.get_sponsors_by_user(1)] == [sponsor_id]
+
+    app_id = db.create_application(2, "user2", "Squidward Tentacles", "squidward", "@squid", "Ciao", "Soldi",
+                                   "Cassiere", "Sempre", "Nessuno", "Dormire", "-")
+    assert app_id == "A1"
+    db.update_application_status(app_id, "rejected")
+    assert db.get_application(app_id)["minecraft_name"] == "squidward"
+    assert [app["id"] for app in db.get_applications_by_status("rejected")] == [app_id]
+
+def test_users_and_bans(db):
+    assert db.get_user_profile(1) is None
+    db.set_user_minecraft_name(1, "spongebob", "sb")
+    db.ban_user(1)
+    assert db.is_user_banned(1)
+    profile = db.get_user_profile(1)
+    assert (profile.minecraft_name, profile.username, profile.banned) == ("spongebob", "sb", True)
+
+    db.unban_user(1)
+    db.set_user_minecraft_name(1, "spongebob2")
+    assert not db.is_user_banned(1)
+    assert db.get_user_minecraft_name(1) == "spongebob2"
+    assert db.get_user_profile(1).username == "sb"
+    assert list(db.get_all_users()) == ["1"]
+
+def test_admins_settings_and_topics(db):
+    assert db.add_admin(7) and not db.add_admin(7)
+    assert db.is_admin(7)
+    assert db.remove_admin(7) and not db.remove_admin(7)
+    db.set_staff_group_id(-100)
+    db.set_sponsor_channel_id(-200)
+    db.set_topic_id("orders", 3)
+    assert (db.get_staff_group_id(), db.get_sponsor_channel_id(), db.get_topic_id("orders")) == (-100, -200, 3)
+    assert db.get_topic_id("missing") is None
+
+def test_menu_edits_and_ids(db):
+    assert db.add_category("Dolci") and not db.add_category("Dolci")
+    assert db.add_menu_item("Dolci", "Torta di corallo", 4, "Dolce")
+    assert not db.add_menu_item("Dolci", "Torta di corallo", 4, "Dolce")
+    category_id = db.get_category_ids()["Dolci"]
+    assert db.get_category_by_id(category_id) == "Dolci"
+    item_ids = [item_id for item_id in range(1, 1000) if db.get_menu_item_by_id(item_id) == ("Dolci", "Torta di corallo")]
+    assert len(item_ids) == 1
+    assert db.get_category_items("Dolci")["Torta di corallo"]["price"] == 4
+
+    assert db.remove_menu_item("Dolci", "Torta di corallo")
+    assert db.remove_category("Dolci") and not db.remove_category("Dolci")
+    assert "Dolci" not in db.get_categories()
+
+def test_sweep_expires_idle_carts_and_pending_orders(db):
+    order_id = place_order(db, 1, ("Krabby Patty", 5))
+    done = place_order(db, 2, ("Kelp Shake", 3))
+    db.update_order_status(done, "completed")
+    db.add_to_cart(3, "Coral Bits", 2, "Contorni")
+
+    assert db.sweep_expired(24, 24) == ([], [])
+    carts, orders = db.sweep_expired(-1, -1)
+    assert carts == [3]
+    assert [order["id"] for order in orders] == [order_id]
+    assert db.get_order(order_id)["status"] == "expired"
+    assert db.get_order(done)["status"] == "completed"
+    assert db.get_user_cart(3) == []
+    assert db.sweep_expired(-1, -1) == ([], [])
+
+def test_rolled_back_sweep_expires_again(db):
+    order_id = place_order(db, 1, ("Krabby Patty", 5))
+    db.add_to_cart(2, "Coral Bits", 2, "Contorni")
+    with pytest.raises(RuntimeError):
+        with db.batch():
+            assert db.sweep_expired(-1, -1) == ([2], [db.get_order(order_id)])
+            raise RuntimeError("outbox write failed")
+
+    assert db.get_order(order_id)["status"] == "pending"
+    assert db.get_cart_count(2) == 1
+    carts, orders = db.sweep_expired(-1, -1)
+    assert (carts, [order["id"] for order in orders]) == ([2], [order_id])
+
+def test_outbox_messages(db):
+    methods = [{"method": "SendMessage", "chat_id": 1, "text": "Ciao"}]
+    with db.batch():
+        outbox_id = db.add_outbox_message(1, 0, methods, after=["set_order_staff_message", "1"])
+    [entry] = db.get_outbox_messages()
+    assert (entry["id"], entry["methods"], entry["status"], entry["attempts"]) == (outbox_id, methods, "pending", 0)
+
+    db.update_outbox_message(outbox_id, attempts=1, error="timeout")
+    assert db.get_outbox_messages()[0]["error"] == "timeout"
+    db.remove_outbox_message(outbox_id)
+    assert db.get_outbox_messages() == []
+
+@pytest.mark.parametrize("backend", PERSISTENT)
+def test_reopened_store_keeps_the_data(backend, stores):
+    db = stores.open(backend)
+    order_id = place_order(db, 1, ("Krabby Patty", 5))
+    db.update_order_status(order_id, "ready")
+    db.add_to_cart(2, "Kelp Shake", 3, "Bevande")
+    db.ban_user(3)
+    db.add_category("Dolci")
+    stores.close(db)
+
+    reopened = stores.open(backend)
+    assert reopened.get_order(order_id)["status"] == "ready"
+    assert [order["id"] for order in reopened.get_orders_by_user(1)] == [order_id]
+    assert reopened.get_cart_total(2) == 3
+    assert reopened.is_user_banned(3)
+    assert "Dolci" in reopened.get_categories()
+    assert place_order(reopened, 4, ("Kelp Shake", 3)) == str(int(order_id) + 1)
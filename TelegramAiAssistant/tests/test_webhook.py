@@ -0,0 +1,73 @@
+import time
+import asyncio
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+import pytest
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import WELCOME_MESSAGE
+from handlers import menu
+from storage.async_database import AsyncDatabase
+from storage.memory import MemoryDatabase
+from tests.fakes import make_bot, start_update
+from utils.webhook import WebhookServer
+
+TOKEN = "123456:webhook-test"
+SECRET = "webhook-test-secret"
+CONCURRENCY = 8
+
+def test_refuses_to_run_without_a_secret():
+    with pytest.raises(ValueError):
+        WebhookServer(Dispatcher(), Bot(TOKEN), url="", secret_token="")
+
+def test_generates_a_secret_for_the_webhook_it_registers():
+    server = WebhookServer(Dispatcher(), Bot(TOKEN), url="https://bot.example.org", secret_token="")
+    assert len(server.secret_token) >= 32
+    assert server.handler.secret_token == server.secret_token
+
+def test_listens_locally_by_default():
+    assert WebhookServer(Dispatcher(), Bot(TOKEN), secret_token="proxy-secret").host == "127.0.0.1"
+
+async def post(session: aiohttp.ClientSession, url: str, update: Dict, secret: Optional[str]) -> Tuple[int, float]:
+    """Status and seconds until answered"""
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret is not None else {}
+    start = time.perf_counter()
+    async with session.post(url, json=update, headers=headers) as response:
+        await response.read()
+        return response.status, time.perf_counter() - start
+
+async def post_updates(port: int, users: int, forged: int):
+    """Post /start from `users` private chats at once, and `forged` more with a wrong or no secret"""
+    db = AsyncDatabase(MemoryDatabase())
+    bot, _ = make_bot(port)
+    dp = Dispatcher(storage=MemoryStorage())
+    menu.register_handlers(dp, db, bot)
+    server = WebhookServer(dp, bot, host="127.0.0.1", port=0, path="/webhook", url="",
+                           secret_token=SECRET, max_concurrency=CONCURRENCY)
+    url = f"http://127.0.0.1:{await server.start()}/webhook"
+    start = time.perf_counter()
+    try:
+        async with aiohttp.ClientSession() as session:
+            genuine = [post(session, url, start_update(k, k), SECRET) for k in range(1, users + 1)]
+            fakes = [post(session, url, start_update(users + k, users + k), "wrong" if k % 2 else None)
+                     for k in range(1, forged + 1)]
+            results = await asyncio.gather(*genuine, *fakes)
+    finally:
+        # Waits for the updates it accepted
+        await server.close()
+        await bot.session.close()
+        await db.close()
+    return results[:users], results[users:], time.perf_counter() - start, server.handler.get_stats()
+
+def test_updates_are_answered_at_once_and_processed_within_the_limit(fake_api):
+    genuine, forged, processed, stats = asyncio.run(post_updates(fake_api.port, users=150, forged=20))
+
+    assert {status for status, _ in genuine} == {200}
+    assert {status for status, _ in forged} == {401}
+    # Answered right away while the welcome messages are paced at 30 per second
+    assert max(seconds for _, seconds in genuine) < processed / 10
+    assert fake_api.delivered == {WELCOME_MESSAGE: 150}
+    assert (stats["accepted"], stats["unauthorized"], stats["processed"], stats["failed"]) == (150, 20, 150, 0)
+    assert stats["max_active"] <= CONCURRENCY
@@ -0,0 +1,111 @@
+from typing import Dict, Tuple, Union
+
+# Telegram rejects buttons whose callback_data is longer than this
+MAX_CALLBACK_BYTES = 64
+
+# Short code sent in callback_data for each callback action. Codes end up
+# in the keyboards of messages already sent, so never change or reuse one.
+ACTION_CODES = {
+    # Menu
+    "main_menu": "m",
+    "category": "c",
+    "item": "i",
+    "view_cart": "vc",
+    "clear_cart": "cc",
+    "back_to_menu": "bm",
+    "back_to_categories": "bc",
+    "back_to_home": "bh",
+    "help": "h",
+    # Orders
+    "checkout": "co",
+    "confirm_order": "ok",
+    "cancel_order": "xo",
+    "order_action": "o",
+    "reply_to_user": "ro",
+    # Sponsors
+    "request_sponsor": "rs",
+    "cancel_sponsor": "xs",
+    "sponsor_action": "s",
+    "reply_to_sponsor": "rp",
+    # Recruitment
+    "start_application": "sa",
+    "cancel_application": "xa",
+    "role": "r",
+    "write_additional": "wa",
+    "no_additional_info": "na",
+    "app_action": "a",
+    "reply_to_applicant": "ra",
+    # User management
+    "ban_user": "b",
+    "unban_user": "u",
+    # Menu management
+    "add_new_item": "ni",
+    "manage_categories": "mc",
+    "add_category": "ac",
+    "view_category": "v",
+    "edit_item": "e",
+    "remove_item": "d",
+    "add_to_category": "at",
+    "cancel_add_item": "xi",
+    "add_new_category": "nc",
+    "remove_category": "dc",
+    "back_to_menu_management": "bg",
+}
+ACTION_NAMES: Dict[str, str] = {code: action for action, code in ACTION_CODES.items()}
+# A code must never read as the full name of another action (legacy callback_data)
+assert len(ACTION_NAMES) == len(ACTION_CODES) and not set(ACTION_NAMES) & set(ACTION_CODES)
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+def encode_int(value: int) -> str:
+    """Base-36 form of an integer field"""
+    if value < 0:
+        return "-" + encode_int(-value)
+    digits = ""
+    while True:
+        value, digit = divmod(value, 36)
+        digits = _DIGITS[digit] + digits
+        if not value:
+            return digits
+
+def decode_int(text: str) -> int:
+    """Integer field of callback_data, raises ValueError if malformed"""
+    if not text or not text.lstrip("-").isalnum():
+        raise ValueError(f"Invalid integer field {text!r}")
+    return int(text, 36)
+
+def decode_legacy_int(text: str) -> int:
+    """Integer field of callback_data written before the codes, in decimal"""
+    if not text or not text.lstrip("-").isdigit():
+        raise ValueError(f"Invalid integer field {text!r}")
+    return int(text)
+
+def is_legacy(data: str) -> bool:
+    """True for callback_data written before the codes, starting with the full action name"""
+    return data.partition(":")[0] in ACTION_CODES
+
+def pack(action: str, *fields: Union[int, str]) -> str:
+    """callback_data for action and its fields: "<code>:<field>:...", ints in base 36.
+
+    Only the last field may contain ":" (CallbackRouter hands it the rest
+    of the data). Raises ValueError past Telegram's 64-byte limit.
+    """
+    parts = [ACTION_CODES[action]]
+    for k, value in enumerate(fields):
+        text = encode_int(value) if isinstance(value, int) else str(value)
+        if ":" in text and k < len(fields) - 1:
+            raise ValueError(f"Field {k} of {action} contains ':'")
+        parts.append(text)
+    data = ":".join(parts)
+    if len(data.encode("utf-8")) > MAX_CALLBACK_BYTES:
+        raise ValueError(f"callback_data of {action} exceeds {MAX_CALLBACK_BYTES} bytes: {data!r}")
+    return data
+
+def unpack(data: str) -> Tuple[str, str]:
+    """Action name and raw fields of callback_data.
+
+    Data written before the codes (full action names, see is_legacy())
+    maps to the same action; its int fields are decimal, not base 36.
+    """
+    code, _, rest = data.partition(":")
+    return ACTION_NAMES.get(code, code), rest
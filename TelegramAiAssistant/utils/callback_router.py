@@ -0,0 +1,86 @@
+import inspect
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery
+
+from utils.callback_data import decode_int, decode_legacy_int, is_legacy, unpack
+
+class Route(NamedTuple):
+    handler: Callable[..., Awaitable]
+    fields: int  # callback_data fields after the action
+    wants_state: bool
+    # Converter of each field, decode_int for the fields annotated int
+    converters: Tuple[Callable[[str], object], ...]
+    # The same for legacy callback_data, whose int fields are decimal
+    legacy_converters: Tuple[Callable[[str], object], ...]
+
+def _route(handler: Callable[..., Awaitable]) -> Route:
+    """Route of a handler taking the callback, one argument per field and optionally state"""
+    parameters = list(inspect.signature(handler).parameters.values())[1:]
+    fields = [parameter for parameter in parameters if parameter.name != "state"]
+    ints = [parameter.annotation in (int, "int") for parameter in fields]
+    return Route(handler, len(fields), len(fields) < len(parameters),
+                 tuple(decode_int if is_int else str for is_int in ints),
+                 tuple(decode_legacy_int if is_int else str for is_int in ints))
+
+class CallbackRouter:
+    """Single callback_query handler dispatching on the action of callback_data.
+
+    callback_data is "action" or "action:field:...", packed by
+    utils.callback_data with a short code in place of the action name. It is
+    parsed once per callback and the action looked up in a dict, instead of
+    aiogram running one filter per registered handler until one matches. A
+    handler gets the fields as positional arguments, the last one keeping
+    any further ":" and those annotated int decoded (base 36, or decimal in
+    legacy data with the full action name), and the FSMContext if it has a
+    state parameter.
+    """
+
+    def __init__(self):
+        self.routes: Dict[str, Route] = {}
+
+    def route(self, action: str):
+        """Decorator registering handler for callbacks of action"""
+        def decorator(handler: Callable[..., Awaitable]):
+            if action in self.routes:
+                raise ValueError(f"Callback action {action!r} already registered")
+            self.routes[action] = _route(handler)
+            return handler
+        return decorator
+
+    def parse(self, data: str) -> Tuple[Optional[Route], List]:
+        """Route and fields of callback_data, (None, []) if no handler takes it"""
+        action, rest = unpack(data)
+        route = self.routes.get(action)
+        if route is None:
+            return None, []
+        if not route.fields:
+            return (route, []) if not rest else (None, [])
+        fields = rest.split(":", route.fields - 1) if rest else []
+        if len(fields) != route.fields:
+            return None, []
+        converters = route.legacy_converters if is_legacy(data) else route.converters
+        try:
+            return route, [convert(field) for convert, field in zip(converters, fields)]
+        except ValueError:
+            return None, []
+
+    async def dispatch(self, callback: CallbackQuery, state: FSMContext):
+        route, fields = self.parse(callback.data or "")
+        if route is None:
+            # Leave it to later handlers, unhandled like before if there are none
+            raise SkipHandler()
+        if route.wants_state:
+            return await route.handler(callback, *fields, state=state)
+        return await route.handler(callback, *fields)
+
+def callback_router(dp) -> CallbackRouter:
+    """The dispatcher's CallbackRouter, registered as a callback_query handler on first use"""
+    router = dp.workflow_data.get("callback_router")
+    if router is None:
+        router = CallbackRouter()
+        dp.workflow_data["callback_router"] = router
+        dp.callback_query.register(router.dispatch)
+    return router
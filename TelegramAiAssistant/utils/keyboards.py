@@ -1,5 +1,7 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from typing import List, Dict
+from typing import Dict
+
+from utils.callback_data import pack
 
 class MenuKeyboard:
     """Keyboards for menu navigation"""
@@ -8,10 +10,10 @@ class MenuKeyboard:
     def home_menu() -> InlineKeyboardMarkup:
         """Home menu keyboard"""
         keyboard = [
-            [InlineKeyboardButton(text="🍔 Menu Ristorante", callback_data="main_menu")],
-            [InlineKeyboardButton(text="📣 Richiedi Sponsor", callback_data="request_sponsor")],
-            [InlineKeyboardButton(text="📝 Invia Candidatura", callback_data="start_application")],
-            [InlineKeyboardButton(text="ℹ️ Aiuto", callback_data="help")]
+            [InlineKeyboardButton(text="🍔 Menu Ristorante", callback_data=pack("main_menu"))],
+            [InlineKeyboardButton(text="📣 Richiedi Sponsor", callback_data=pack("request_sponsor"))],
+            [InlineKeyboardButton(text="📝 Invia Candidatura", callback_data=pack("start_application"))],
+            [InlineKeyboardButton(text="ℹ️ Aiuto", callback_data=pack("help"))]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
@@ -19,10 +21,10 @@ class MenuKeyboard:
     def main_menu() -> InlineKeyboardMarkup:
         """Main menu keyboard"""
         keyboard = [
-            [InlineKeyboardButton(text="🍔 Menù", callback_data="main_menu")],
-            [InlineKeyboardButton(text="📣 Sponsor", callback_data="request_sponsor")],
-            [InlineKeyboardButton(text="📝 Candidatura", callback_data="start_application")],
-            [InlineKeyboardButton(text="🏠 Torna alla Home", callback_data="back_to_home")]
+            [InlineKeyboardButton(text="🍔 Menù", callback_data=pack("main_menu"))],
+            [InlineKeyboardButton(text="📣 Sponsor", callback_data=pack("request_sponsor"))],
+            [InlineKeyboardButton(text="📝 Candidatura", callback_data=pack("start_application"))],
+            [InlineKeyboardButton(text="🏠 Torna alla Home", callback_data=pack("back_to_home"))]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
@@ -30,38 +32,38 @@ class MenuKeyboard:
     def help_menu() -> InlineKeyboardMarkup:
         """Help menu keyboard"""
         keyboard = [
-            [InlineKeyboardButton(text="🍔 Vai al Menù", callback_data="main_menu")],
-            [InlineKeyboardButton(text="📣 Richiedi Sponsor", callback_data="request_sponsor")],
-            [InlineKeyboardButton(text="📝 Invia Candidatura", callback_data="start_application")]
+            [InlineKeyboardButton(text="🍔 Vai al Menù", callback_data=pack("main_menu"))],
+            [InlineKeyboardButton(text="📣 Richiedi Sponsor", callback_data=pack("request_sponsor"))],
+            [InlineKeyboardButton(text="📝 Invia Candidatura", callback_data=pack("start_application"))]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
     @staticmethod
-    def categories(categories: List[str], has_cart: bool = False) -> InlineKeyboardMarkup:
-        """Categories selection keyboard"""
+    def categories(categories: Dict[str, int], has_cart: bool = False) -> InlineKeyboardMarkup:
+        """Categories selection keyboard, categories maps names to menu ids"""
         keyboard = []
         
-        for category in categories:
+        for category, category_id in categories.items():
             keyboard.append([InlineKeyboardButton(
                 text=category, 
-                callback_data=f"category:{category}"
+                callback_data=pack("category", category_id)
             )])
         
         if has_cart:
             keyboard.append([InlineKeyboardButton(
                 text="🛒 Visualizza Carrello", 
-                callback_data="view_cart"
+                callback_data=pack("view_cart")
             )])
         
         keyboard.append([InlineKeyboardButton(
             text="🏠 Torna alla Home", 
-            callback_data="back_to_home"
+            callback_data=pack("back_to_home")
         )])
         
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
     @staticmethod
-    def items(category: str, items: Dict, has_cart: bool = False) -> InlineKeyboardMarkup:
+    def items(items: Dict, has_cart: bool = False) -> InlineKeyboardMarkup:
         """Items selection keyboard"""
         keyboard = []
         
@@ -69,7 +71,7 @@ class MenuKeyboard:
             price = item_data.get("price", 0)
             keyboard.append([InlineKeyboardButton(
                 text=f"{item_name} - {price}€", 
-                callback_data=f"item:{category}:{item_name}"
+                callback_data=pack("item", item_data["id"])
             )])
         
         # Navigation buttons
@@ -77,11 +79,11 @@ class MenuKeyboard:
         if has_cart:
             nav_buttons.append(InlineKeyboardButton(
                 text="🛒 Carrello", 
-                callback_data="view_cart"
+                callback_data=pack("view_cart")
             ))
         nav_buttons.append(InlineKeyboardButton(
             text="🔙 Categorie", 
-            callback_data="back_to_categories"
+            callback_data=pack("back_to_categories")
         ))
         
         if nav_buttons:
@@ -89,7 +91,7 @@ class MenuKeyboard:
         
         keyboard.append([InlineKeyboardButton(
             text="🏠 Torna alla Home", 
-            callback_data="back_to_home"
+            callback_data=pack("back_to_home")
         )])
         
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -98,10 +100,10 @@ class MenuKeyboard:
     def cart_actions() -> InlineKeyboardMarkup:
         """Cart actions keyboard"""
         keyboard = [
-            [InlineKeyboardButton(text="✅ Procedi all'Ordine", callback_data="checkout")],
-            [InlineKeyboardButton(text="🗑️ Svuota Carrello", callback_data="clear_cart")],
-            [InlineKeyboardButton(text="🔙 Continua Shopping", callback_data="back_to_categories")],
-            [InlineKeyboardButton(text="🏠 Torna alla Home", callback_data="back_to_home")]
+            [InlineKeyboardButton(text="✅ Procedi all'Ordine", callback_data=pack("checkout"))],
+            [InlineKeyboardButton(text="🗑️ Svuota Carrello", callback_data=pack("clear_cart"))],
+            [InlineKeyboardButton(text="🔙 Continua Shopping", callback_data=pack("back_to_categories"))],
+            [InlineKeyboardButton(text="🏠 Torna alla Home", callback_data=pack("back_to_home"))]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
@@ -112,9 +114,9 @@ class OrderKeyboard:
     def confirm_order() -> InlineKeyboardMarkup:
         """Order confirmation keyboard"""
         keyboard = [
-            [InlineKeyboardButton(text="✔️ Conferma Ordine", callback_data="confirm_order")],
-            [InlineKeyboardButton(text="❌ Annulla", callback_data="cancel_order")],
-            [InlineKeyboardButton(text="🏠 Torna alla Home", callback_data="back_to_home")]
+            [InlineKeyboardButton(text="✔️ Conferma Ordine", callback_data=pack("confirm_order"))],
+            [InlineKeyboardButton(text="❌ Annulla", callback_data=pack("cancel_order"))],
+            [InlineKeyboardButton(text="🏠 Torna alla Home", callback_data=pack("back_to_home"))]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
@@ -123,15 +125,15 @@ class OrderKeyboard:
         """Staff order management keyboard"""
         keyboard = [
             [
-                InlineKeyboardButton(text="🟢 Prendi in Carico", callback_data=f"order_action:accept:{order_id}"),
-                InlineKeyboardButton(text="❌ Rifiuta", callback_data=f"order_action:reject:{order_id}")
+                InlineKeyboardButton(text="🟢 Prendi in Carico", callback_data=pack("order_action", "accept", order_id)),
+                InlineKeyboardButton(text="❌ Rifiuta", callback_data=pack("order_action", "reject", order_id))
             ],
             [
-                InlineKeyboardButton(text="🔥 Pronto", callback_data=f"order_action:ready:{order_id}"),
-                InlineKeyboardButton(text="✅ Completato", callback_data=f"order_action:complete:{order_id}")
+                InlineKeyboardButton(text="🔥 Pronto", callback_data=pack("order_action", "ready", order_id)),
+                InlineKeyboardButton(text="✅ Completato", callback_data=pack("order_action", "complete", order_id))
             ],
             [
-                InlineKeyboardButton(text="💬 Rispondi", callback_data=f"reply_to_user:{order_id}")
+                InlineKeyboardButton(text="💬 Rispondi", callback_data=pack("reply_to_user", order_id))
             ]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -140,8 +142,8 @@ class OrderKeyboard:
     def back_to_menu() -> InlineKeyboardMarkup:
         """Back to menu keyboard"""
         keyboard = [
-            [InlineKeyboardButton(text="🔙 Torna al Menù", callback_data="back_to_menu")],
-            [InlineKeyboardButton(text="🏠 Torna alla Home", callback_data="back_to_home")]
+            [InlineKeyboardButton(text="🔙 Torna al Menù", callback_data=pack("back_to_menu"))],
+            [InlineKeyboardButton(text="🏠 Torna alla Home", callback_data=pack("back_to_home"))]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
@@ -152,9 +154,9 @@ class SponsorKeyboard:
     def sponsor_request() -> InlineKeyboardMarkup:
         """Sponsor request keyboard"""
         keyboard = [
-            [InlineKeyboardButton(text="📣 Invia Richiesta", callback_data="request_sponsor")],
-            [InlineKeyboardButton(text="❌ Annulla", callback_data="cancel_sponsor")],
-            [InlineKeyboardButton(text="🏠 Torna alla Home", callback_data="back_to_home")]
+            [InlineKeyboardButton(text="📣 Invia Richiesta", callback_data=pack("request_sponsor"))],
+            [InlineKeyboardButton(text="❌ Annulla", callback_data=pack("cancel_sponsor"))],
+            [InlineKeyboardButton(text="🏠 Torna alla Home", callback_data=pack("back_to_home"))]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
@@ -163,11 +165,11 @@ class SponsorKeyboard:
         """Staff sponsor management keyboard"""
         keyboard = [
             [
-                InlineKeyboardButton(text="✅ Approva", callback_data=f"sponsor_action:approve:{sponsor_id}"),
-                InlineKeyboardButton(text="❌ Rifiuta", callback_data=f"sponsor_action:reject:{sponsor_id}")
+                InlineKeyboardButton(text="✅ Approva", callback_data=pack("sponsor_action", "approve", sponsor_id)),
+                InlineKeyboardButton(text="❌ Rifiuta", callback_data=pack("sponsor_action", "reject", sponsor_id))
             ],
             [
-                InlineKeyboardButton(text="💬 Rispondi", callback_data=f"reply_to_sponsor:{sponsor_id}")
+                InlineKeyboardButton(text="💬 Rispondi", callback_data=pack("reply_to_sponsor", sponsor_id))
             ]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -176,7 +178,7 @@ class SponsorKeyboard:
     def back_to_menu() -> InlineKeyboardMarkup:
         """Back to menu keyboard"""
         keyboard = [
-            [InlineKeyboardButton(text="🔙 Torna al Menù", callback_data="back_to_menu")]
+            [InlineKeyboardButton(text="🔙 Torna al Menù", callback_data=pack("back_to_menu"))]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
@@ -187,8 +189,8 @@ class RecruitmentKeyboard:
     def start_application() -> InlineKeyboardMarkup:
         """Start application keyboard"""
         keyboard = [
-            [InlineKeyboardButton(text="📝 Inizia Candidatura", callback_data="start_application")],
-            [InlineKeyboardButton(text="❌ Annulla", callback_data="cancel_application")]
+            [InlineKeyboardButton(text="📝 Inizia Candidatura", callback_data=pack("start_application"))],
+            [InlineKeyboardButton(text="❌ Annulla", callback_data=pack("cancel_application"))]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
@@ -207,12 +209,12 @@ class RecruitmentKeyboard:
         for role_display, role_value in roles:
             keyboard.append([InlineKeyboardButton(
                 text=role_display, 
-                callback_data=f"role:{role_value}"
+                callback_data=pack("role", role_value)
             )])
         
         keyboard.append([InlineKeyboardButton(
             text="❌ Annulla", 
-            callback_data="cancel_application"
+            callback_data=pack("cancel_application")
         )])
         
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -221,7 +223,7 @@ class RecruitmentKeyboard:
     def cancel_application() -> InlineKeyboardMarkup:
         """Cancel application keyboard"""
         keyboard = [
-            [InlineKeyboardButton(text="❌ Annulla Candidatura", callback_data="cancel_application")]
+            [InlineKeyboardButton(text="❌ Annulla Candidatura", callback_data=pack("cancel_application"))]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
@@ -229,9 +231,9 @@ class RecruitmentKeyboard:
     def additional_info() -> InlineKeyboardMarkup:
         """Additional info selection keyboard"""
         keyboard = [
-            [InlineKeyboardButton(text="✍️ Scrivi messaggio", callback_data="write_additional")],
-            [InlineKeyboardButton(text="📝 Non ho nulla da dire", callback_data="no_additional_info")],
-            [InlineKeyboardButton(text="❌ Annulla Candidatura", callback_data="cancel_application")]
+            [InlineKeyboardButton(text="✍️ Scrivi messaggio", callback_data=pack("write_additional"))],
+            [InlineKeyboardButton(text="📝 Non ho nulla da dire", callback_data=pack("no_additional_info"))],
+            [InlineKeyboardButton(text="❌ Annulla Candidatura", callback_data=pack("cancel_application"))]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
@@ -240,11 +242,11 @@ class RecruitmentKeyboard:
         """Staff application management keyboard"""
         keyboard = [
             [
-                InlineKeyboardButton(text="✅ Approva", callback_data=f"app_action:approve:{app_id}"),
-                InlineKeyboardButton(text="❌ Rifiuta", callback_data=f"app_action:reject:{app_id}")
+                InlineKeyboardButton(text="✅ Approva", callback_data=pack("app_action", "approve", app_id)),
+                InlineKeyboardButton(text="❌ Rifiuta", callback_data=pack("app_action", "reject", app_id))
             ],
             [
-                InlineKeyboardButton(text="💬 Rispondi", callback_data=f"reply_to_applicant:{app_id}")
+                InlineKeyboardButton(text="💬 Rispondi", callback_data=pack("reply_to_applicant", app_id))
             ]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -254,11 +256,11 @@ class RecruitmentKeyboard:
         """User management keyboard"""
         if is_banned:
             keyboard = [
-                [InlineKeyboardButton(text="✅ Sbanna", callback_data=f"unban_user:{user_id}")]
+                [InlineKeyboardButton(text="✅ Sbanna", callback_data=pack("unban_user", int(user_id)))]
             ]
         else:
             keyboard = [
-                [InlineKeyboardButton(text="🚫 Banna", callback_data=f"ban_user:{user_id}")]
+                [InlineKeyboardButton(text="🚫 Banna", callback_data=pack("ban_user", int(user_id)))]
             ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
@@ -266,7 +268,7 @@ class RecruitmentKeyboard:
     def back_to_menu() -> InlineKeyboardMarkup:
         """Back to menu keyboard"""
         keyboard = [
-            [InlineKeyboardButton(text="🔙 Torna al Menù", callback_data="back_to_menu")]
+            [InlineKeyboardButton(text="🔙 Torna al Menù", callback_data=pack("back_to_menu"))]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
@@ -274,71 +276,71 @@ class AdminKeyboard:
     """Keyboards for admin functions"""
     
     @staticmethod
-    def menu_management(categories: List[str]) -> InlineKeyboardMarkup:
+    def menu_management(categories: Dict[str, int]) -> InlineKeyboardMarkup:
         """Menu management keyboard"""
         keyboard = []
         
         # View categories
-        for category in categories:
+        for category, category_id in categories.items():
             keyboard.append([InlineKeyboardButton(
                 text=f"📋 Visualizza {category}", 
-                callback_data=f"view_category:{category}"
+                callback_data=pack("view_category", category_id)
             )])
         
         # Management options
         keyboard.append([
-            InlineKeyboardButton(text="➕ Aggiungi Piatto", callback_data="add_new_item"),
-            InlineKeyboardButton(text="📂 Gestisci Categorie", callback_data="manage_categories")
+            InlineKeyboardButton(text="➕ Aggiungi Piatto", callback_data=pack("add_new_item")),
+            InlineKeyboardButton(text="📂 Gestisci Categorie", callback_data=pack("manage_categories"))
         ])
         
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
     @staticmethod
-    def category_selection(categories: List[str]) -> InlineKeyboardMarkup:
+    def category_selection(categories: Dict[str, int]) -> InlineKeyboardMarkup:
         """Category selection for adding items"""
         keyboard = []
         
-        for category in categories:
+        for category, category_id in categories.items():
             keyboard.append([InlineKeyboardButton(
                 text=category, 
-                callback_data=f"add_category:{category}"
+                callback_data=pack("add_category", category_id)
             )])
         
         keyboard.append([InlineKeyboardButton(
             text="❌ Annulla", 
-            callback_data="cancel_add_item"
+            callback_data=pack("cancel_add_item")
         )])
         
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
     @staticmethod
-    def category_items_management(category: str, items: List[str]) -> InlineKeyboardMarkup:
+    def category_items_management(category: str, category_id: int, items: Dict) -> InlineKeyboardMarkup:
         """Category items management keyboard"""
         keyboard = []
         
         # Show items with edit and remove options
-        for item in items:
+        for item, item_data in items.items():
             keyboard.append([
                 InlineKeyboardButton(
                     text=f"✏️ Modifica {item}", 
-                    callback_data=f"edit_item:{category}:{item}"
+                    callback_data=pack("edit_item", item_data["id"])
                 ),
                 InlineKeyboardButton(
                     text=f"🗑️ Rimuovi {item}", 
-                    callback_data=f"remove_item:{category}:{item}"
+                    callback_data=pack("remove_item", item_data["id"])
                 )
             ])
         
         # Add new item to this category
         keyboard.append([InlineKeyboardButton(
             text=f"➕ Aggiungi Piatto a {category}", 
-            callback_data=f"add_to_category:{category}"
+            callback_data=pack("add_to_category", category_id)
         )])
         
         # Navigation
         keyboard.append([InlineKeyboardButton(
             text="🔙 Gestione Menù", 
-            callback_data="back_to_menu_management"
+            callback_data=pack("back_to_menu_management")
         )])
         
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -347,30 +349,30 @@ class AdminKeyboard:
     def cancel_add_item() -> InlineKeyboardMarkup:
         """Cancel add item keyboard"""
         keyboard = [
-            [InlineKeyboardButton(text="❌ Annulla", callback_data="cancel_add_item")]
+            [InlineKeyboardButton(text="❌ Annulla", callback_data=pack("cancel_add_item"))]
         ]
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
     
     @staticmethod
-    def category_management(categories: List[str]) -> InlineKeyboardMarkup:
+    def category_management(categories: Dict[str, int]) -> InlineKeyboardMarkup:
         """Category management keyboard"""
         keyboard = []
         
         # Remove categories
-        for category in categories:
+        for category, category_id in categories.items():
             keyboard.append([InlineKeyboardButton(
                 text=f"🗑️ Rimuovi {category}", 
-                callback_data=f"remove_category:{category}"
+                callback_data=pack("remove_category", category_id)
             )])
         
         # Add new category
         keyboard.append([
-            InlineKeyboardButton(text="➕ Aggiungi Categoria", callback_data="add_new_category")
+            InlineKeyboardButton(text="➕ Aggiungi Categoria", callback_data=pack("add_new_category"))
         ])
         
         # Back button
         keyboard.append([
-            InlineKeyboardButton(text="🔙 Gestione Menù", callback_data="back_to_menu_management")
+            InlineKeyboardButton(text="🔙 Gestione Menù", callback_data=pack("back_to_menu_management"))
         ])
         
         return InlineKeyboardMarkup(inline_keyboard=keyboard)
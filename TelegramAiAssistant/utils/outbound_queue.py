@@ -0,0 +1,135 @@
+import time
+import heapq
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from config import OUTBOUND_WORKERS, OUTBOUND_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lower is sent first
+INTERACTIVE = 0  # Replies to the user or staff member who just acted
+STAFF = 1  # Posts to the staff group
+NOTIFICATION = 2  # Status notifications and broadcasts
+PRIORITY_NAMES = {INTERACTIVE: "interactive", STAFF: "staff", NOTIFICATION: "notification"}
+
+Job = Callable[[], Awaitable[object]]
+# (priority, sequence, chat_id, name, enqueued at, job)
+Entry = Tuple[int, int, Optional[Union[int, str]], str, float, Job]
+
+class OutboundQueue:
+    """Priority queue of sends drained by a bounded pool of workers.
+
+    Handlers submit a job (a coroutine function making the Telegram calls)
+    with a priority class and the chat it writes to, and return as soon as
+    it is queued. Workers take the most urgent job first, FIFO within a
+    class. Jobs for the same chat run one at a time in order, so a worker
+    never waits behind another job's chat while other chats have work, and
+    the outbound limiter's pacing of a chat does not hold the whole pool.
+    A job's exceptions are logged, not raised to the handler. submit()
+    waits while max_size jobs are pending.
+    """
+
+    def __init__(self, workers: int = OUTBOUND_WORKERS, max_size: int = OUTBOUND_QUEUE_SIZE,
+                 clock: Callable[[], float] = time.monotonic):
+        self.workers = workers
+        self.clock = clock
+        self.heap: List[Entry] = []
+        self.ready = asyncio.Condition()
+        self.slots = asyncio.Semaphore(max_size)
+        self.sequence = 0
+        # Chats with a job running, and jobs taken off the heap while their chat was
+        self.running: Set[Union[int, str]] = set()
+        self.parked: Dict[Union[int, str], List[Entry]] = {}
+        self.tasks: List[asyncio.Task] = []
+        self.pending = 0
+        self.stats = {name: {"sent": 0, "failed": 0, "wait_total": 0.0, "wait_max": 0.0}
+                      for name in PRIORITY_NAMES.values()}
+
+    def start(self):
+        """Start the workers"""
+        self.tasks = [asyncio.create_task(self._worker(), name=f"outbound-{k}") for k in range(self.workers)]
+
+    async def close(self, timeout: float = 10):
+        """Let the workers finish the queued jobs for up to timeout seconds, then stop them"""
+        if not self.tasks:
+            return
+        deadline = self.clock() + timeout
+        while self.pending and self.clock() < deadline:
+            await asyncio.sleep(0.05)
+        if self.pending:
+            logger.warning(f"Dropping {self.pending} outbound jobs on shutdown")
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def get_stats(self) -> Dict:
+        """Pending jobs and, per priority class, sent and failed jobs and queue wait in seconds"""
+        return {"pending": self.pending, "workers": self.workers,
+                **{name: dict(stats, wait_mean=stats["wait_total"] / max(1, stats["sent"] + stats["failed"]))
+                   for name, stats in self.stats.items()}}
+
+    async def submit(self, priority: int, job: Job, chat_id: Optional[Union[int, str]] = None, name: str = ""):
+        """Queue job, run by a worker once the jobs before it (and its chat's) are done"""
+        await self.slots.acquire()
+        self.pending += 1
+        self.sequence += 1
+        entry = (priority, self.sequence, chat_id, name or getattr(job, "__name__", "job"), self.clock(), job)
+        async with self.ready:
+            heapq.heappush(self.heap, entry)
+            self.ready.notify()
+
+    async def _next(self) -> Entry:
+        async with self.ready:
+            while True:
+                while not self.heap:
+                    await self.ready.wait()
+                entry = heapq.heappop(self.heap)
+                chat_id = entry[2]
+                if chat_id is None:
+                    return entry
+                if chat_id in self.running:
+                    heapq.heappush(self.parked.setdefault(chat_id, []), entry)
+                    continue
+                self.running.add(chat_id)
+                return entry
+
+    async def _done(self, chat_id: Optional[Union[int, str]]):
+        self.pending -= 1
+        self.slots.release()
+        if chat_id is None:
+            return
+        async with self.ready:
+            self.running.discard(chat_id)
+            parked = self.parked.get(chat_id)
+            if parked:
+                # The chat's most urgent parked job goes back in its place
+                heapq.heappush(self.heap, heapq.heappop(parked))
+                if not parked:
+                    del self.parked[chat_id]
+                self.ready.notify()
+
+    async def _worker(self):
+        while True:
+            priority, _, chat_id, name, enqueued, job = await self._next()
+            stats = self.stats[PRIORITY_NAMES[priority]]
+            waited = self.clock() - enqueued
+            stats["wait_total"] += waited
+            stats["wait_max"] = max(stats["wait_max"], waited)
+            try:
+                await job()
+                stats["sent"] += 1
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error(f"Outbound {PRIORITY_NAMES[priority]} job {name} failed: {e}")
+            finally:
+                await self._done(chat_id)
+
+def outbound_queue(dp) -> OutboundQueue:
+    """The dispatcher's OutboundQueue, created on first use and started by main"""
+    queue = dp.workflow_data.get("outbound_queue")
+    if queue is None:
+        queue = dp.workflow_data["outbound_queue"] = OutboundQueue()
+    return queue
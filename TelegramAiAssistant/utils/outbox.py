@@ -0,0 +1,210 @@
+import time
+import asyncio
+import logging
+from functools import partial
+from typing import Callable, Dict, List, Optional, Set
+
+from aiogram import Bot, methods
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNotFound, TelegramUnauthorizedError
+)
+from aiogram.methods import TelegramMethod
+
+from config import OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BASE_SECONDS, OUTBOX_RETRY_MAX_SECONDS, OUTBOX_POLL_SECONDS
+from storage.async_database import AsyncDatabase
+from utils.outbound_queue import OutboundQueue, outbound_queue
+from utils.workers import worker_shard
+
+logger = logging.getLogger(__name__)
+
+# Errors that sending again cannot fix: the message fails at once
+PERMANENT_ERRORS = (TelegramBadRequest, TelegramForbiddenError, TelegramNotFound, TelegramUnauthorizedError)
+# Database calls an outbox message may make once delivered, given its first message id
+AFTER_SEND = frozenset({"set_order_staff_message", "set_sponsor_staff_message", "set_application_staff_message"})
+
+def dump_method(method: TelegramMethod) -> Dict:
+    """JSON form of a Telegram method call"""
+    return {"method": type(method).__name__,
+            "params": method.model_dump(mode="json", exclude_none=True, exclude_defaults=True)}
+
+def load_method(data: Dict) -> TelegramMethod:
+    """Telegram method call from its dump_method() form"""
+    return getattr(methods, data["method"]).model_validate(data["params"])
+
+class Outbox:
+    """Staff posts and notifications stored with the change they report, sent until delivered.
+
+    add() stores the Telegram calls of a message in the database; called
+    inside `async with db.batch():` next to the state change (a new order
+    and its staff post, a status change and the user notification), both
+    are persisted together or not at all. The dispatcher loop reads the
+    due messages only once the batches writing them have ended and the
+    writes are flushed, and sends each through the OutboundQueue with its
+    priority. A message whose send fails is tried again after a delay
+    doubling from retry_base up to retry_max, and dropped, logged with its
+    calls, after max_attempts or an error sending again cannot fix, so the
+    store only holds pending messages. Delivered and dropped messages are
+    removed together with their `after` call, which stores the message id
+    of the first call whenever it was sent: a staff post whose follow-up
+    call failed still gets its id. Messages still pending when the bot
+    stopped are sent after the next start, skipping the calls recorded as
+    sent: delivery is at least once, a crash repeats at most the calls
+    sent since the last flush.
+
+    With several worker processes (utils.workers) each outbox sends only
+    the messages added by its worker, so no message is sent by two; a
+    worker started again with the same index resumes them.
+    """
+
+    def __init__(self, db: AsyncDatabase, bot: Bot, sender: OutboundQueue,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS, retry_base: float = OUTBOX_RETRY_BASE_SECONDS,
+                 retry_max: float = OUTBOX_RETRY_MAX_SECONDS, poll_interval: float = OUTBOX_POLL_SECONDS,
+                 clock: Callable[[], float] = time.time, worker: int = 0, workers: int = 1):
+        self.db = db
+        self.bot = bot
+        self.sender = sender
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.worker = worker
+        self.workers = workers
+        # Messages queued in the sender and not finished yet
+        self.in_flight: Set[str] = set()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {"delivered": 0, "retried": 0, "failed": 0, "resumed": 0}
+
+    def start(self):
+        """Start the dispatcher loop, resuming the messages left pending"""
+        self.task = asyncio.create_task(self._run(), name="outbox")
+
+    async def close(self):
+        """Stop dispatching; messages already handed to the sender finish with it"""
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def get_stats(self) -> Dict:
+        """Delivered, retried and failed counts, and messages stored pending"""
+        entries = await self.db.get_outbox_messages()
+        return dict(self.stats, pending=len(entries), in_flight=len(self.in_flight))
+
+    async def add(self, priority: int, *calls: TelegramMethod, after: Optional[List] = None) -> str:
+        """Store calls to the chat of the first one, sent in order; after is [AFTER_SEND call, *args]"""
+        if after and after[0] not in AFTER_SEND:
+            raise ValueError(f"Unknown outbox after call: {after[0]}")
+        outbox_id = await self.db.add_outbox_message(
+            calls[0].chat_id, priority, [dump_method(call) for call in calls], list(after) if after else None,
+            worker=self.worker
+        )
+        self.wakeup.set()
+        return outbox_id
+
+    def owns(self, entry: Dict) -> bool:
+        """Whether this worker sends entry; those of a worker index past the current count go to another"""
+        return entry.get("worker", 0) % self.workers == self.worker
+
+    def retry_delay(self, attempts: int) -> float:
+        return min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+
+    async def _run(self):
+        entries = [entry for entry in await self.db.get_outbox_messages() if self.owns(entry)]
+        # Kept by earlier versions, which stored failed messages
+        async with self.db.batch():
+            for entry in entries:
+                if entry["status"] == "failed":
+                    await self.db.remove_outbox_message(entry["id"])
+        pending = [entry for entry in entries if entry["status"] == "pending"]
+        if pending:
+            self.stats["resumed"] = len(pending)
+            logger.info(f"Resuming {len(pending)} undelivered outbox messages")
+        while True:
+            self.wakeup.clear()
+            try:
+                delay = await self._dispatch()
+            except Exception as e:
+                logger.error(f"Error dispatching outbox messages: {e}")
+                delay = self.poll_interval
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(0.0, min(delay, self.poll_interval)))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch(self) -> float:
+        """Queue the due messages, returns the seconds until the next one is due"""
+        due = []
+        next_due = self.poll_interval
+        # Inside a batch: messages added in an open batch are read once it ended, and
+        # deliveries cannot finish between the read and marking the due ones in flight
+        async with self.db.batch():
+            now = self.clock()
+            for entry in await self.db.get_outbox_messages():
+                if entry["status"] != "pending" or entry["id"] in self.in_flight or not self.owns(entry):
+                    continue
+                if entry["next_attempt_at"] > now:
+                    next_due = min(next_due, entry["next_attempt_at"] - now)
+                    continue
+                self.in_flight.add(entry["id"])
+                due.append(entry)
+        if due:
+            # Sent only once persisted, like the change they report
+            await self.db.flush_async()
+        for entry in due:
+            await self.sender.submit(entry["priority"], partial(self._deliver, entry), chat_id=entry["chat_id"],
+                                     name=f"outbox {entry['id']}")
+        return next_due
+
+    async def _deliver(self, entry: Dict):
+        try:
+            await self._send(entry)
+        finally:
+            self.in_flight.discard(entry["id"])
+
+    async def _send(self, entry: Dict):
+        calls = entry["methods"]
+        message_id = entry["message_id"]
+        try:
+            for index in range(entry["sent"], len(calls)):
+                result = await self.bot(load_method(calls[index]))
+                if index == 0:
+                    message_id = getattr(result, "message_id", None)
+                if index + 1 < len(calls):
+                    # Calls already sent are skipped if the bot restarts before the rest
+                    await self.db.update_outbox_message(entry["id"], sent=index + 1, message_id=message_id)
+        except Exception as e:
+            attempts = entry["attempts"] + 1
+            if isinstance(e, PERMANENT_ERRORS) or attempts >= self.max_attempts:
+                self.stats["failed"] += 1
+                logger.error(f"Outbox message {entry['id']} to {entry['chat_id']} failed after {attempts} attempts, "
+                             f"dropping its calls {calls[entry['sent']:]}: {e}")
+                await self._finish(entry, message_id)
+                return
+            delay = self.retry_delay(attempts)
+            self.stats["retried"] += 1
+            logger.warning(f"Outbox message {entry['id']} to {entry['chat_id']} failed, retrying in {delay:g}s: {e}")
+            await self.db.update_outbox_message(entry["id"], attempts=attempts, error=str(e),
+                                                next_attempt_at=self.clock() + delay)
+            self.wakeup.set()
+            return
+
+        await self._finish(entry, message_id)
+        self.stats["delivered"] += 1
+
+    async def _finish(self, entry: Dict, message_id: Optional[int]):
+        """Remove entry, running its after call if the first call was delivered"""
+        async with self.db.batch():
+            if entry["after"] and message_id is not None:
+                call, *args = entry["after"]
+                await getattr(self.db, call)(*args, message_id)
+            await self.db.remove_outbox_message(entry["id"])
+
+def outbox(dp, db: AsyncDatabase, bot: Bot) -> Outbox:
+    """The dispatcher's Outbox, created on first use and started by main"""
+    box = dp.workflow_data.get("outbox")
+    if box is None:
+        worker, workers = worker_shard()
+        box = dp.workflow_data["outbox"] = Outbox(db, bot, outbound_queue(dp), worker=worker, workers=workers)
+    return box
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+from typing import Dict
+from aiogram.methods import EditMessageReplyMarkup, SendMessage
+
+from config import CART_TTL_HOURS, ORDER_TIMEOUT_HOURS, SWEEP_INTERVAL_SECONDS
+from storage.async_database import AsyncDatabase
+from utils.outbound_queue import NOTIFICATION
+from utils.outbox import Outbox
+
+logger = logging.getLogger(__name__)
+
+async def notify_expired_cart(outbox: Outbox, user_id: int):
+    """Tell a user their idle cart was emptied"""
+    await outbox.add(NOTIFICATION, SendMessage(
+        chat_id=user_id,
+        text=f"🛒 Il tuo carrello è stato svuotato dopo {CART_TTL_HOURS:g} ore di inattività."
+    ))
+
+async def notify_expired_order(outbox: Outbox, db: AsyncDatabase, order: Dict):
+    """Tell the user and the staff group that a pending order timed out"""
+    await outbox.add(NOTIFICATION, SendMessage(
+        chat_id=order["user_id"],
+        text=f"⏰ Il tuo ordine `{order['id']}` è scaduto: non è stato preso in carico entro "
+             f"{ORDER_TIMEOUT_HOURS} ore."
+    ))
+
+    staff_group_id = await db.get_staff_group_id()
+    if not staff_group_id or not order.get("staff_message_id"):
+        return
+    # Drop the action buttons and reply to the order message, sent apart so the
+    # reply still goes out if the buttons were already gone
+    await outbox.add(NOTIFICATION, EditMessageReplyMarkup(
+        chat_id=staff_group_id,
+        message_id=order["staff_message_id"]
+    ))
+    await outbox.add(NOTIFICATION, SendMessage(
+        chat_id=staff_group_id,
+        message_thread_id=await db.get_topic_id("orders"),
+        reply_to_message_id=order["staff_message_id"],
+        text=f"⏰ Ordine `{order['id']}` scaduto dopo {ORDER_TIMEOUT_HOURS} ore in attesa."
+    ))
+
+async def run_sweeper(db: AsyncDatabase, outbox: Outbox):
+    """Drop idle carts and expire stale pending orders every SWEEP_INTERVAL_SECONDS"""
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+        try:
+            # The notifications are stored with the expiry they report
+            async with db.batch():
+                expired_carts, expired_orders = await db.sweep_expired(CART_TTL_HOURS, ORDER_TIMEOUT_HOURS)
+                for user_id in expired_carts:
+                    await notify_expired_cart(outbox, user_id)
+                for order in expired_orders:
+                    await notify_expired_order(outbox, db, order)
+        except Exception as e:
+            logger.error(f"Error sweeping expired carts and orders: {e}")
+            continue
+
+        if expired_carts or expired_orders:
+            logger.info(f"Swept {len(expired_carts)} idle carts and {len(expired_orders)} expired orders")
@@ -0,0 +1,166 @@
+import signal
+import asyncio
+import logging
+import secrets
+import contextlib
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import (
+    WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_MAX_CONCURRENCY
+)
+
+logger = logging.getLogger(__name__)
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """Answers Telegram 200 at once and processes at most max_concurrency updates at a time.
+
+    Requests without the secret token are answered 401 by SimpleRequestHandler.
+    Every accepted update is handed to a background task which waits for one
+    of the max_concurrency slots before feeding the dispatcher; close() waits
+    up to drain_timeout seconds for the updates accepted so far. The bot
+    session belongs to the bot and is not closed here.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrency: int = WEBHOOK_MAX_CONCURRENCY,
+                 secret_token: str = None, drain_timeout: float = 30, **data: Any):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token, **data)
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.drain_timeout = drain_timeout
+        self.active = 0
+        self.stats = {"accepted": 0, "unauthorized": 0, "processed": 0, "failed": 0, "max_active": 0}
+
+    def verify_secret(self, telegram_secret_token: str, bot: Bot) -> bool:
+        if super().verify_secret(telegram_secret_token, bot):
+            self.stats["accepted"] += 1
+            return True
+        self.stats["unauthorized"] += 1
+        return False
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        async with self.slots:
+            self.active += 1
+            self.stats["max_active"] = max(self.stats["max_active"], self.active)
+            try:
+                await super()._background_feed_update(bot, update)
+                self.stats["processed"] += 1
+            except Exception as e:
+                # Telegram was already answered: the update is logged and dropped, like polling does
+                self.stats["failed"] += 1
+                logger.error(f"Error processing update {update.get('update_id')}: {e}")
+            finally:
+                self.active -= 1
+
+    def get_stats(self) -> Dict:
+        """Request counts, and updates processing or waiting for a slot"""
+        return dict(self.stats, active=self.active,
+                    waiting=len(self._background_feed_update_tasks) - self.active)
+
+    async def close(self) -> None:
+        """Wait for the accepted updates"""
+        tasks = set(self._background_feed_update_tasks)
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"Dropped {len(pending)} updates still processing after {self.drain_timeout:g}s")
+
+class RoutingRequestHandler(SimpleRequestHandler):
+    """Answers Telegram 200 once route() took the update, processing nothing in this process"""
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, route: Callable[[Dict], Awaitable],
+                 secret_token: str = None):
+        super().__init__(dispatcher, bot, handle_in_background=True, secret_token=secret_token)
+        self.route = route
+        self.stats = {"accepted": 0, "unauthorized": 0}
+
+    def verify_secret(self, telegram_secret_token: str, bot: Bot) -> bool:
+        accepted = super().verify_secret(telegram_secret_token, bot)
+        self.stats["accepted" if accepted else "unauthorized"] += 1
+        return accepted
+
+    async def _handle_request_background(self, bot: Bot, request: web.Request) -> web.Response:
+        # Awaited before answering: updates of one request are routed in the order they came
+        await self.route(await request.json(loads=bot.session.json_loads))
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
+
+    async def close(self) -> None:
+        """Nothing is processed here"""
+
+class WebhookServer:
+    """Embedded aiohttp server feeding the dispatcher the updates Telegram posts to path.
+
+    When url is set the webhook is registered at start() as url + path,
+    with secret_token (generated if empty) so Telegram's requests can be
+    told from others. Without url it is left to whoever runs the reverse
+    proxy, which must register the same secret_token; the server refuses
+    to run without one, since anyone reaching it could post updates.
+    Given route, the updates are handed to it instead of the dispatcher
+    (see utils.workers).
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                 path: str = WEBHOOK_PATH, url: str = WEBHOOK_URL, secret_token: str = WEBHOOK_SECRET,
+                 max_concurrency: int = WEBHOOK_MAX_CONCURRENCY, route: Optional[Callable[[Dict], Awaitable]] = None):
+        self.dp = dp
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.path = path
+        self.url = url.rstrip("/")
+        self.secret_token = secret_token or (secrets.token_urlsafe(32) if url else None)
+        if not self.secret_token:
+            raise ValueError("Webhook mode without WEBHOOK_URL needs WEBHOOK_SECRET, "
+                             "registered with the webhook by whoever sets it")
+        if route:
+            self.handler = RoutingRequestHandler(dp, bot, route, secret_token=self.secret_token)
+        else:
+            self.handler = BoundedRequestHandler(dp, bot, max_concurrency, secret_token=self.secret_token)
+        self.app = web.Application()
+        self.handler.register(self.app, path=path)
+        # The dispatcher's startup and shutdown hooks run with the application's
+        setup_application(self.app, dp, bot=bot)
+        self.runner = None
+
+    async def start(self) -> int:
+        """Listen for updates and register the webhook; returns the port"""
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        if self.url:
+            await self.bot.set_webhook(
+                f"{self.url}{self.path}",
+                secret_token=self.secret_token,
+                allowed_updates=self.dp.resolve_used_update_types()
+            )
+            logger.info(f"Webhook set to {self.url}{self.path}")
+        logger.info(f"Receiving updates on {self.host}:{self.port}{self.path}")
+        return self.port
+
+    async def serve(self):
+        """Start, then run until SIGINT or SIGTERM"""
+        await self.start()
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):
+                loop.add_signal_handler(sig, stopping.set)
+        await stopping.wait()
+
+    async def close(self):
+        """Stop accepting updates and wait for those accepted"""
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+            logger.info(f"Webhook server stopped: {self.handler.get_stats()}")
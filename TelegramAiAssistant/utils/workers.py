@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import signal
+import asyncio
+import logging
+import contextlib
+from functools import partial
+from typing import Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot, Dispatcher
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import GetUpdates, TelegramMethod
+
+from config import (
+    BOT_MODE, BOT_WORKERS, BOT_WORKER, WORKER_MAX_CONCURRENCY, STORAGE_BACKEND,
+    OUTBOUND_GLOBAL_RATE, OUTBOUND_GLOBAL_BURST, OUTBOUND_GROUP_RATE, OUTBOUND_GROUP_BURST
+)
+from utils.webhook import WebhookServer
+
+logger = logging.getLogger(__name__)
+
+# Started once per worker, with BOT_WORKER set
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+# Stores several processes can share
+SHARED_BACKENDS = ("shared_json", "sqlite")
+# Longest update line a worker reads from its pipe
+MAX_LINE_BYTES = 4 * 1024 * 1024
+POLLING_TIMEOUT = 30
+
+def update_user_id(update: Dict) -> Optional[int]:
+    """Id of the user an update comes from, or of its chat when it has no user"""
+    for event in update.values():
+        if isinstance(event, dict):
+            sender = event.get("from") or event.get("user") or event.get("chat")
+            return sender["id"] if sender else None
+    return None
+
+def worker_for(update: Dict, workers: int) -> int:
+    """Index of the worker handling update: every update of a user goes to the same one"""
+    # User ids are spread evenly already, and a modulo is the same in every process
+    return (update_user_id(update) or 0) % workers
+
+def worker_shard() -> Tuple[int, int]:
+    """This process's worker index and the worker count, (0, 1) outside supervisor mode"""
+    return (BOT_WORKER, BOT_WORKERS) if BOT_WORKER >= 0 else (0, 1)
+
+def worker_limits(workers: int) -> Dict:
+    """OutboundLimiter rates of one of `workers` processes sending as the same bot"""
+    # A private chat is written by its user's worker only, the global and group limits are split
+    return {"global_rate": OUTBOUND_GLOBAL_RATE / workers, "global_burst": max(1, OUTBOUND_GLOBAL_BURST // workers),
+            "group_rate": OUTBOUND_GROUP_RATE / workers, "group_burst": max(1, OUTBOUND_GROUP_BURST // workers)}
+
+def handler_dispatcher() -> Dispatcher:
+    """Scratch dispatcher with every handler registered, for the update types they use"""
+    from handlers import menu, orders, sponsor, recruitment, admin, fallback, user_management
+
+    dp = Dispatcher(storage=MemoryStorage())
+    for module in (menu, orders, sponsor, recruitment, admin, user_management, fallback):
+        module.register_handlers(dp, None, None)
+    return dp
+
+class UpdateFeeder:
+    """Worker side: feeds the dispatcher the updates the supervisor writes to stdin, one JSON per line.
+
+    Updates of different users are processed concurrently, at most
+    max_concurrency at a time; an update waits for the previous one of its
+    user, so each user's updates are handled in the order the supervisor
+    received them. Reading stops while max_pending updates are unfinished,
+    which fills the pipe and holds the supervisor back. run() returns once
+    stdin is closed and every update read is processed.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, max_concurrency: int = WORKER_MAX_CONCURRENCY,
+                 max_pending: Optional[int] = None):
+        self.dp = dp
+        self.bot = bot
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.pending = asyncio.Semaphore(max_pending or max_concurrency * 4)
+        # Latest unfinished update of each user
+        self.tails: Dict[Optional[int], asyncio.Task] = {}
+        self.tasks: Set[asyncio.Task] = set()
+        self.stats = {"processed": 0, "failed": 0}
+
+    async def feed(self, update: Dict):
+        """Process update after the unfinished ones of its user"""
+        await self.pending.acquire()
+        user_id = update_user_id(update)
+        task = asyncio.create_task(self._process(update, self.tails.get(user_id)))
+        self.tails[user_id] = task
+        self.tasks.add(task)
+        task.add_done_callback(partial(self._done, user_id))
+
+    def _done(self, user_id: Optional[int], task: asyncio.Task):
+        self.tasks.discard(task)
+        self.pending.release()
+        if self.tails.get(user_id) is task:
+            del self.tails[user_id]
+
+    async def _process(self, update: Dict, previous: Optional[asyncio.Task]):
+        if previous:
+            await asyncio.wait([previous])
+        async with self.slots:
+            try:
+                result = await self.dp.feed_raw_update(self.bot, update)
+                if isinstance(result, TelegramMethod):
+                    await self.dp.silent_call_request(self.bot, result)
+                self.stats["processed"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Error processing update {update.get('update_id')}: {e}")
+
+    async def run(self, stream=None):
+        """Process the updates read from stream (stdin) until it is closed"""
+        reader = asyncio.StreamReader(limit=MAX_LINE_BYTES)
+        loop = asyncio.get_running_loop()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), stream or sys.stdin)
+        while line := await reader.readline():
+            await self.feed(json.loads(line))
+        if self.tasks:
+            await asyncio.wait(set(self.tasks))
+        logger.info(f"Update stream closed: {self.stats}")
+
+class Supervisor:
+    """Runs `workers` bot processes and hands each update to one of them by user id.
+
+    The updates are received here, by polling or with a WebhookServer
+    (BOT_MODE), and written to the stdin of the chosen worker, a `python
+    main.py` with BOT_WORKER set. Every update of a user reaches the same
+    worker, which keeps that user's state in memory (FSM, throttling
+    buckets, private chat pacing) and handles their updates in order;
+    orders, counters and staff topics live in the shared store. A worker
+    that exits is started again with the same index after restart_delay;
+    updates already written to its pipe are lost. close() closes the
+    workers' stdin and waits for them to process what they read.
+    """
+
+    def __init__(self, bot: Bot, workers: int = BOT_WORKERS, mode: str = BOT_MODE,
+                 backend: str = STORAGE_BACKEND, command: Optional[List[str]] = None,
+                 restart_delay: float = 1, stop_timeout: float = 30):
+        if backend not in SHARED_BACKENDS:
+            raise ValueError(f"{workers} workers need a STORAGE_BACKEND shared by processes "
+                             f"({', '.join(SHARED_BACKENDS)}), not {backend}")
+        self.bot = bot
+        self.workers = workers
+        self.mode = mode
+        self.command = command or [sys.executable, MAIN]
+        self.restart_delay = restart_delay
+        self.stop_timeout = stop_timeout
+        self.processes: List[Optional[asyncio.subprocess.Process]] = [None] * workers
+        # Set while the worker's process runs
+        self.ready = [asyncio.Event() for _ in range(workers)]
+        self.tasks: List[asyncio.Task] = []
+        self.webhook: Optional[WebhookServer] = None
+        self.closing = False
+        self.stats = {"routed": [0] * workers, "lost": 0, "restarts": 0}
+
+    async def start(self):
+        """Prepare the store, start the workers, then receive updates"""
+        from database import create_database
+        from storage.async_database import AsyncDatabase
+
+        # Created or migrated here once, before the workers open it together
+        await AsyncDatabase(create_database()).close()
+        for index in range(self.workers):
+            self.tasks.append(asyncio.create_task(self._keep_running(index), name=f"worker {index}"))
+
+        dp = handler_dispatcher()
+        if self.mode == "webhook":
+            self.webhook = WebhookServer(dp, self.bot, route=self.route)
+            await self.webhook.start()
+        else:
+            self.tasks.append(asyncio.create_task(self._poll(dp.resolve_used_update_types()), name="polling"))
+        logger.info(f"Supervisor started {self.workers} workers, receiving updates by {self.mode}")
+
+    async def serve(self):
+        """Start, then run until SIGINT or SIGTERM"""
+        await self.start()
+        stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):
+                loop.add_signal_handler(sig, stopping.set)
+        await stopping.wait()
+
+    async def _keep_running(self, index: int):
+        env = dict(os.environ, BOT_WORKER=str(index), BOT_WORKERS=str(self.workers))
+        while not self.closing:
+            # A session of its own: a Ctrl+C reaches the supervisor only, which stops the workers
+            process = await asyncio.create_subprocess_exec(
+                *self.command, stdin=asyncio.subprocess.PIPE, env=env, start_new_session=True
+            )
+            self.processes[index] = process
+            self.ready[index].set()
+            code = await process.wait()
+            self.ready[index].clear()
+            if self.closing:
+                return
+            self.stats["restarts"] += 1
+            logger.error(f"Worker {index} exited with code {code}, restarting in {self.restart_delay:g}s")
+            await asyncio.sleep(self.restart_delay)
+
+    async def route(self, update: Dict):
+        """Write update to its worker's pipe, waiting while the worker is restarted"""
+        index = worker_for(update, self.workers)
+        await self.ready[index].wait()
+        try:
+            self.processes[index].stdin.write(json.dumps(update).encode() + b"\n")
+            # Written in call order; drain() only waits while the pipe is full
+            await self.processes[index].stdin.drain()
+            self.stats["routed"][index] += 1
+        except (BrokenPipeError, ConnectionResetError) as e:
+            self.stats["lost"] += 1
+            logger.error(f"Update {update.get('update_id')} lost, worker {index} exited: {e}")
+
+    async def _poll(self, allowed_updates: List[str]):
+        """Single getUpdates poller for all the workers"""
+        # getUpdates is refused while a webhook is set
+        await self.bot.delete_webhook()
+        offset = None
+        while True:
+            try:
+                updates = await self.bot(
+                    GetUpdates(offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates),
+                    request_timeout=int(self.bot.session.timeout + POLLING_TIMEOUT)
+                )
+            except Exception as e:
+                logger.error(f"Error getting updates: {e}")
+                await asyncio.sleep(5)
+                continue
+            for update in updates:
+                await self.route(update.model_dump(mode="json", exclude_unset=True))
+                offset = update.update_id + 1
+
+    async def close(self):
+        """Stop receiving, then let the workers finish the updates they were given"""
+        self.closing = True
+        if self.webhook:
+            await self.webhook.close()
+        for task in self.tasks:
+            if task.get_name() == "polling":
+                task.cancel()
+        running = [process for process in self.processes if process and process.returncode is None]
+        for process in running:
+            process.stdin.close()
+        if running:
+            _, pending = await asyncio.wait([asyncio.create_task(process.wait()) for process in running],
+                                            timeout=self.stop_timeout)
+            if pending:
+                logger.warning(f"{len(pending)} workers still running after {self.stop_timeout:g}s, terminating")
+                for process in running:
+                    if process.returncode is None:
+                        process.terminate()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        logger.info(f"Supervisor stopped: {self.stats}")